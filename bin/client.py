@@ -800,19 +800,7 @@ def _set_cluster_package_config(client, cluster_id):
         raise Exception(msg)
 
 
-def _set_host_roles(client, cluster_id, host_id, roles, role_mapping):
-    status, response = client.update_cluster_host(
-        cluster_id, host_id, roles=roles)
-    logging.info(
-        'set cluster %s host %s roles %s status %s: %s',
-        cluster_id, host_id, roles, status, response
-    )
-    if status >= 400:
-        raise Exception(
-            'failed to set cluster %s host %s roles %s' % (
-                cluster_id, host_id, roles
-            )
-        )
+def _update_role_mapping(roles, role_mapping):
     for role in roles:
         if role in role_mapping and role_mapping[role] > 0:
             role_mapping[role] -= 1
@@ -830,9 +818,8 @@ def _set_hosts_roles(client, cluster_id, host_mapping, role_mapping):
                     hostname, host_mapping
                 )
             )
-        host_id = host_mapping[hostname]
         roles = [role for role in roles_str.split(',') if role]
-        _set_host_roles(client, cluster_id, host_id, roles, role_mapping)
+        _update_role_mapping(roles, role_mapping)
         host_roles[hostname] = roles
 
     # assign unassigned roles to unassigned hosts
@@ -852,9 +839,8 @@ def _set_hosts_roles(client, cluster_id, host_mapping, role_mapping):
         )
     for offset, role in enumerate(unassigned_roles):
         hostname = unassigned_hostnames[offset]
-        host_id = host_mapping[hostname]
         roles = [role]
-        _set_host_roles(client, cluster_id, host_id, roles, role_mapping)
+        _update_role_mapping(roles, role_mapping)
         host_roles[hostname] = roles
     unassigned_hostnames = unassigned_hostnames[len(unassigned_roles):]
     unassigned_roles = []
@@ -869,13 +855,30 @@ def _set_hosts_roles(client, cluster_id, host_mapping, role_mapping):
             'hosts %s do not have roles set' % unassigned_hostnames
         )
     for hostname in unassigned_hostnames:
-        host_id = host_mapping[hostname]
         roles = [default_roles[0]]
-        _set_host_roles(client, cluster_id, host_id, roles, role_mapping)
+        _update_role_mapping(roles, role_mapping)
         host_roles[hostname] = roles
         default_roles = default_roles[1:]
         default_roles.extend(roles)
 
+    data = [
+        {'host_id': host_mapping[hostname], 'roles': roles}
+        for hostname, roles in host_roles.items()
+    ]
+    if data:
+        status, response = client.update_cluster_hosts_config(
+            cluster_id, data
+        )
+        logging.info(
+            'set cluster %s hosts roles %s status %s: %s',
+            cluster_id, data, status, response
+        )
+        if status >= 400 or response.get('failed_hosts'):
+            raise Exception(
+                'failed to set cluster %s hosts roles %s' % (
+                    cluster_id, data
+                )
+            )
     return host_roles
 
 
@@ -938,20 +941,27 @@ def _get_installing_progress(client, cluster_id, host_mapping):
             cluster_installed = True
         if cluster_state['state'] == 'ERROR':
             cluster_failed = True
-        for hostname, host_id in host_mapping.items():
-            status, host_state = client.get_cluster_host_state(
-                cluster_id, host_id
-            )
-            logging.info(
-                'get cluster %s host %s state status %s: %s',
-                cluster_id, host_id, status, host_state
+        status, host_states = client.list_cluster_host_states(cluster_id)
+        logging.info(
+            'get cluster %s host states status %s: %s',
+            cluster_id, status, host_states
+        )
+        if status >= 400:
+            raise Exception(
+                'failed to acquire cluster %s host states' % cluster_id
             )
-            if status >= 400:
+        host_state_mapping = dict([
+            (host_state['host_id'], host_state)
+            for host_state in host_states
+        ])
+        for hostname, host_id in host_mapping.items():
+            if host_id not in host_state_mapping:
                 raise Exception(
                     'failed to acquire cluster %s host %s state' % (
                         cluster_id, host_id
                     )
                 )
+            host_state = host_state_mapping[host_id]
             if host_state['state'] in ['UNINITIALIZED', 'INITIALIZED']:
                 raise Exception(
                     'unintended status for host %s: %s' % (
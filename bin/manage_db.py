@@ -32,8 +32,11 @@ from compass.actions import deploy
 from compass.actions import reinstall
 from compass.api import app
 from compass.db.api import database
+from compass.db.api import machine as machine_api
 from compass.db.api import switch as switch_api
 from compass.db.api import user as user_api
+from compass.db.api import user_log as user_log_api
+from compass.db import models
 from compass.tasks.client import celery
 from compass.utils import flags
 from compass.utils import logsetting
@@ -72,6 +75,9 @@ flags.add('search_host_properties',
 flags.add('print_host_properties',
           help='comma separated host config properties to print',
           default='')
+flags.add_bool('profile',
+               help='print time spent in each stage of createdb',
+               default=False)
 
 
 app_manager = Manager(app, usage="Perform database operations")
@@ -112,9 +118,21 @@ def createdb():
     if setting.DATABASE_TYPE == 'file':
         if os.path.exists(setting.DATABASE_FILE):
             os.remove(setting.DATABASE_FILE)
-    database.create_db()
+    stage_times = database.create_db()
     if setting.DATABASE_TYPE == 'file':
         os.chmod(setting.DATABASE_FILE, 0o777)
+    if flags.OPTIONS.profile:
+        for stage, seconds in stage_times:
+            print '%s: %.3fs' % (stage, seconds)
+        print 'total: %.3fs' % sum(seconds for _, seconds in stage_times)
+
+
+@app_manager.command
+def upgradedb():
+    """Creates missing tables, columns and indexes in existing database."""
+    database.init()
+    for name in database.upgrade_db():
+        print 'created %s' % name
 
 
 @app_manager.command
@@ -192,6 +210,36 @@ def deploy_clusters():
         deploy.deploy(cluster_hosts)
 
 
+@app_manager.command
+def prune_user_logs():
+    """Delete user logs older than USER_LOG_RETENTION if it is set.
+
+    .. note::
+       Deleted user logs are archived in USER_LOG_ARCHIVE_DIR if it is set.
+    """
+    if flags.OPTIONS.async:
+        celery.send_task('compass.tasks.prune_user_logs', ())
+    else:
+        database.init()
+        print 'pruned %s user logs' % user_log_api.prune_user_actions()
+
+
+@app_manager.command
+def sync_machine_attributes():
+    """Index tag and location of existing machines.
+
+    .. note::
+       The machine_attribute table is created if it does not exist.
+    """
+    database.init()
+    models.MachineAttribute.__table__.create(
+        bind=database.ENGINE, checkfirst=True
+    )
+    print 'synced attributes of %s machines' % (
+        machine_api.sync_machine_attributes()
+    )
+
+
 if __name__ == "__main__":
     flags.init()
     logsetting.init()
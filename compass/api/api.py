@@ -52,7 +52,9 @@ from compass.utils import util
 def log_user_action(func):
     @functools.wraps(func)
     def decorated_api(*args, **kwargs):
-        user_log_api.log_user_action(current_user.id, request.path)
+        user_log_api.log_user_action_buffered(
+            current_user.id, request.path
+        )
         return func(*args, **kwargs)
     return decorated_api
 
@@ -141,11 +143,37 @@ def _int_converter(value):
         )
 
 
+def _fields_converter(value):
+    """Convert comma separated fields to list."""
+    if not isinstance(value, list):
+        value = [value]
+    return [
+        field.strip()
+        for item in value for field in item.split(',')
+        if field.strip()
+    ]
+
+
+PAGINATION_ARGS = {
+    'limit': _int_converter,
+    'cursor': str
+}
+RESPONSE_FORMAT_ARGS = ['pretty']
+
+
 def _get_request_args(**kwargs):
     args = dict(request.args)
     logging.debug('origin request args: %s', args)
     for key, value in args.items():
-        if key in kwargs:
+        if key in RESPONSE_FORMAT_ARGS:
+            del args[key]
+        elif key == 'fields':
+            args[key] = _fields_converter(value)
+        elif key in PAGINATION_ARGS:
+            if isinstance(value, list):
+                value = value[-1]
+            args[key] = PAGINATION_ARGS[key](value)
+        elif key in kwargs:
             converter = kwargs[key]
             if isinstance(value, list):
                 args[key] = [converter(item) for item in value]
@@ -199,7 +227,9 @@ def _reformat_host_networks(networks):
 
 def _reformat_host(host):
     if isinstance(host, list):
-        return [_reformat_host(item) for item in host]
+        for item in host:
+            _reformat_host(item)
+        return host
     if 'networks' in host:
         host['networks'] = _reformat_host_networks(host['networks'])
     return host
@@ -226,7 +256,7 @@ def _login(use_cookie):
     if not login_user(user, remember=data.get('remember', False)):
         raise exception_handler.UserDisabled('failed to login: %s' % user)
 
-    user_log_api.log_user_action(user.id, request.path)
+    user_log_api.log_user_action_buffered(user.id, request.path)
     response_data = user_api.record_user_token(
         user, user.token, user.expire_timestamp
     )
@@ -249,7 +279,7 @@ def login():
 @login_required
 def logout():
     """User logout."""
-    user_log_api.log_user_action(current_user.id, request.path)
+    user_log_api.log_user_action_buffered(current_user.id, request.path)
     response_data = user_api.clean_user_token(
         current_user, current_user.token
     )
@@ -257,6 +287,16 @@ def logout():
     return utils.make_json_response(200, response_data)
 
 
+@app.route('/users/token/cache', methods=['GET'])
+@log_user_action
+@login_required
+def show_user_token_cache_stats():
+    """Get user token cache hit rate counters."""
+    return utils.make_json_response(
+        200, user_api.get_user_token_cache_stats(current_user)
+    )
+
+
 @app.route("/users", methods=['GET'])
 @log_user_action
 @login_required
@@ -463,6 +503,14 @@ def show_permission(permission_id):
     )
 
 
+def _filter_since(data):
+    since = _get_data(data, 'since')
+    if since is not None:
+        data['since'] = util.parse_datetime(
+            since, exception_handler.BadRequest
+        )
+
+
 def _filter_timestamp(data):
     timestamp_filter = {}
     start = _get_data(data, 'timestamp_start')
@@ -1208,6 +1256,20 @@ def delete_subnet(subnet_id):
     )
 
 
+@app.route("/subnets/<int:subnet_id>/allocate", methods=['POST'])
+@log_user_action
+@login_required
+def allocate_subnet_ips(subnet_id):
+    """add host networks with ips allocated from subnet."""
+    data = _get_request_data_as_list()
+    return utils.make_json_response(
+        200,
+        host_api.allocate_host_networks(
+            current_user, subnet_id, data=data
+        )
+    )
+
+
 @app.route("/adapters", methods=['GET'])
 @log_user_action
 @login_required
@@ -1218,9 +1280,10 @@ def list_adapters():
     _filter_general(data, 'distributed_system_name')
     _filter_general(data, 'os_installer_name')
     _filter_general(data, 'package_installer_name')
-    return utils.make_json_response(
+    return utils.make_cached_json_response(
         200,
-        adapter_api.list_adapters(
+        adapter_api.get_adapters_version(current_user),
+        lambda: adapter_api.list_adapters(
             current_user, **data
         )
     )
@@ -1246,9 +1309,10 @@ def show_adapter(adapter_id):
 def show_adapter_metadata(adapter_id):
     """Get adapter metadata."""
     data = _get_request_args()
-    return utils.make_json_response(
+    return utils.make_cached_json_response(
         200,
-        metadata_api.get_package_metadata(
+        metadata_api.get_metadatas_version(current_user),
+        lambda: metadata_api.get_package_metadata(
             current_user, adapter_id, **data
         )
     )
@@ -1260,9 +1324,10 @@ def show_adapter_metadata(adapter_id):
 def show_os_metadata(os_id):
     """Get os metadata."""
     data = _get_request_args()
-    return utils.make_json_response(
+    return utils.make_cached_json_response(
         200,
-        metadata_api.get_os_metadata(
+        metadata_api.get_metadatas_version(current_user),
+        lambda: metadata_api.get_os_metadata(
             current_user, os_id, **data
         )
     )
@@ -1277,9 +1342,13 @@ def show_os_metadata(os_id):
 def show_adapter_os_metadata(adapter_id, os_id):
     """Get adapter metadata."""
     data = _get_request_args()
-    return utils.make_json_response(
+    return utils.make_cached_json_response(
         200,
-        metadata_api.get_package_os_metadata(
+        '%s.%s' % (
+            adapter_api.get_adapters_version(current_user),
+            metadata_api.get_metadatas_version(current_user)
+        ),
+        lambda: metadata_api.get_package_os_metadata(
             current_user, adapter_id, os_id, **data
         )
     )
@@ -1373,9 +1442,10 @@ def show_cluster_config(cluster_id):
 def show_cluster_metadata(cluster_id):
     """Get cluster config."""
     data = _get_request_args()
-    return utils.make_json_response(
+    return utils.make_cached_json_response(
         200,
-        cluster_api.get_cluster_metadata(
+        cluster_api.get_cluster_metadata_version(current_user, cluster_id),
+        lambda: cluster_api.get_cluster_metadata(
             current_user, cluster_id, **data
         )
     )
@@ -1730,6 +1800,34 @@ def patch_clusterhost_config(clusterhost_id):
     )
 
 
+@app.route("/clusters/<int:cluster_id>/hosts/config", methods=['PUT'])
+@log_user_action
+@login_required
+def update_cluster_hosts_config(cluster_id):
+    """update configs and roles of cluster hosts."""
+    data = _get_request_data_as_list()
+    return utils.make_json_response(
+        200,
+        cluster_api.update_cluster_hosts_config(
+            current_user, cluster_id, data=data
+        )
+    )
+
+
+@app.route("/clusters/<int:cluster_id>/hosts/config", methods=['PATCH'])
+@log_user_action
+@login_required
+def patch_cluster_hosts_config(cluster_id):
+    """patch configs and roles of cluster hosts."""
+    data = _get_request_data_as_list()
+    return utils.make_json_response(
+        200,
+        cluster_api.patch_cluster_hosts_config(
+            current_user, cluster_id, data=data
+        )
+    )
+
+
 @app.route(
     "/clusters/<int:cluster_id>/hosts/<int:host_id>/config",
     methods=['DELETE']
@@ -1792,6 +1890,36 @@ def show_clusterhost_state(clusterhost_id):
     )
 
 
+@app.route("/clusters/<int:cluster_id>/hosts/states", methods=['GET'])
+@log_user_action
+@login_required
+def list_cluster_host_states(cluster_id):
+    """List states of all hosts in the cluster."""
+    data = _get_request_args()
+    _filter_since(data)
+    return utils.make_json_response(
+        200,
+        cluster_api.list_cluster_host_states(
+            current_user, cluster_id, **data
+        )
+    )
+
+
+@app.route("/clusterhosts/states", methods=['GET'])
+@log_user_action
+@login_required
+def list_clusterhost_states():
+    """List clusterhost states of the given cluster."""
+    data = _get_request_args(cluster_id=_int_converter)
+    _filter_since(data)
+    return utils.make_json_response(
+        200,
+        cluster_api.list_clusterhost_states(
+            current_user, **data
+        )
+    )
+
+
 @app.route(
     "/clusters/<int:cluster_id>/hosts/<int:host_id>/state",
     methods=['PUT']
@@ -2366,6 +2494,75 @@ def proxy_delete(url):
     )
 
 
+@user_api.check_user_admin()
+def _get_database_metrics(getter):
+    return database.get_query_metrics()
+
+
+@app.route("/metrics/database", methods=['GET'])
+@log_user_action
+@login_required
+def show_database_metrics():
+    """Get database query stats aggregated by api and task."""
+    return utils.make_json_response(
+        200, _get_database_metrics(current_user)
+    )
+
+
+@app.before_request
+def begin_request_query_stats():
+    database.begin_query_stats()
+
+
+@app.after_request
+def add_query_stats_headers(response):
+    """Add the query count and time in ms of the request to headers.
+
+    .. note::
+       It is registered before the request session hooks so it runs
+       after the request session is committed.
+    """
+    stats = database.end_query_stats(request.endpoint)
+    if stats is not None:
+        response.headers['X-DB-Queries'] = str(stats['queries'])
+        response.headers['X-DB-Time'] = '%.3f' % (stats['time'] * 1000)
+    return response
+
+
+@app.teardown_request
+def end_request_query_stats(error=None):
+    database.end_query_stats(request.endpoint)
+
+
+@app.before_request
+def begin_request_session():
+    """Share one database session in the request if configured."""
+    if setting.REQUEST_SCOPED_SESSION:
+        database.begin_session()
+
+
+@app.after_request
+def commit_request_session(response):
+    if not database.in_session():
+        return response
+    try:
+        database.end_session()
+    except Exception as error:
+        return exception_handler.handle_exception(error)
+    return response
+
+
+@app.teardown_request
+def close_request_session(error=None):
+    """Rollback the request session if it is not committed."""
+    if not database.in_session():
+        return
+    try:
+        database.end_session(commit=False)
+    except Exception as error:
+        logging.exception(error)
+
+
 def init():
     logging.info('init flask')
     database.init()
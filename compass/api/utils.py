@@ -13,19 +13,128 @@
 # limitations under the License.
 
 """Utils for API usage."""
+import hashlib
+
+from flask import has_request_context
 from flask import make_response
+from flask import request
+from flask import Response
 import simplejson as json
+from werkzeug.urls import url_encode
+
+
+STREAM_CHUNK_SIZE = 65536
+COMPACT_SEPARATORS = (',', ':')
+# cached json responses: request path to (version, body, etag).
+JSON_RESPONSE_CACHE = {}
+JSON_RESPONSE_CACHE_SIZE = 1024
+
+
+def is_pretty_response():
+    """Check if the json response should be pretty printed."""
+    if not has_request_context():
+        return False
+    return request.args.get('pretty', '') in ['1', 'true', 'True']
+
+
+def _dump_json(data, pretty):
+    if pretty:
+        return json.dumps(data, indent=4)
+    return json.dumps(data, separators=COMPACT_SEPARATORS)
+
+
+def iter_json_list(data, pretty=False):
+    """Yield the json encoded list in chunks.
+
+    The list items are encoded one by one and sent in chunks of about
+    STREAM_CHUNK_SIZE, so the response starts before the whole list is
+    encoded. It does not reduce peak memory since data is already a
+    list of dicts built by the db api.
+    """
+    if not data:
+        yield '[]\r\n'
+        return
+    if pretty:
+        chunk = ['[\n']
+        separator = ',\n'
+    else:
+        chunk = ['[']
+        separator = ','
+    chunk_size = 0
+    for i, item in enumerate(data):
+        encoded_item = _dump_json(item, pretty)
+        if pretty:
+            encoded_item = '\n'.join([
+                '    ' + line for line in encoded_item.split('\n')
+            ])
+        if i:
+            chunk.append(separator)
+        chunk.append(encoded_item)
+        chunk_size += len(encoded_item)
+        if chunk_size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_size = 0
+    if pretty:
+        chunk.append('\n')
+    chunk.append(']\r\n')
+    yield ''.join(chunk)
 
 
 def make_json_response(status_code, data):
-    """Wrap json format to the reponse object."""
+    """Wrap json format to the reponse object.
 
-    result = json.dumps(data, indent=4) + '\r\n'
-    resp = make_response(result, status_code)
+    Lists are encoded in chunked transfer encoding. The json is
+    compact unless the request asks for pretty=1.
+    If data is a page of a list, the url of the next page is set
+    in the Link header.
+    """
+    pretty = is_pretty_response()
+    if isinstance(data, list):
+        resp = Response(iter_json_list(data, pretty), status_code)
+    else:
+        resp = make_response(_dump_json(data, pretty) + '\r\n', status_code)
     resp.headers['Content-type'] = 'application/json'
+    next_cursor = getattr(data, 'next_cursor', None)
+    if next_cursor:
+        resp.headers['Link'] = '<%s>; rel="next"' % get_next_page_url(
+            next_cursor
+        )
+    return resp
+
+
+def make_cached_json_response(status_code, version, get_data):
+    """Make json response cached by request path and version.
+
+    The json of get_data() is encoded once per version and sent with
+    a strong ETag. Requests whose If-None-Match matches the ETag get
+    304 without body.
+    """
+    cache_key = request.full_path
+    cached = JSON_RESPONSE_CACHE.get(cache_key)
+    if cached is None or cached[0] != version:
+        body = _dump_json(get_data(), is_pretty_response()) + '\r\n'
+        cached = (version, body, hashlib.sha1(body).hexdigest())
+        if len(JSON_RESPONSE_CACHE) >= JSON_RESPONSE_CACHE_SIZE:
+            JSON_RESPONSE_CACHE.clear()
+        JSON_RESPONSE_CACHE[cache_key] = cached
+    _, body, etag = cached
+    if request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+    else:
+        resp = make_response(body, status_code)
+        resp.headers['Content-type'] = 'application/json'
+    resp.set_etag(etag)
     return resp
 
 
+def get_next_page_url(next_cursor):
+    """Get the url of the current request with cursor replaced."""
+    args = request.args.copy()
+    args['cursor'] = next_cursor
+    return '%s?%s' % (request.base_url, url_encode(args))
+
+
 def make_csv_response(status_code, csv_data, fname):
     """Wrap CSV format to the reponse object."""
     fname = '.'.join((fname, 'csv'))
@@ -103,6 +103,25 @@ class Client(object):
         logging.debug('delete %s', url)
         return self._get_response(self.session_.delete(url))
 
+    def _get_pages(self, req_url, data=None, limit=100):
+        """Iterate the pages of a list api.
+
+        Yields (status, page) of each page until there is no next page
+        or the request fails.
+        """
+        url = '%s%s' % (self.url_, req_url)
+        params = dict(data or {})
+        params['limit'] = limit
+        while url:
+            logging.debug('get %s with data %s', url, params)
+            resp = self.session_.get(url, params=params)
+            status, page = self._get_response(resp)
+            yield status, page
+            if status >= 400:
+                return
+            url = resp.links.get('next', {}).get('url')
+            params = None
+
     def login(self, email, password):
         credential = {}
         credential['email'] = email
@@ -122,6 +141,13 @@ class Client(object):
         users = self._get('/users')
         return users
 
+    def iter_user_logs(self, user_id=None, limit=100, **data):
+        if user_id:
+            req_url = '/users/%s/logs' % user_id
+        else:
+            req_url = '/users/logs'
+        return self._get_pages(req_url, data=data, limit=limit)
+
     def list_switches(
             self,
             switch_ips=None,
@@ -199,6 +225,11 @@ class Client(object):
 
         return self._get('/switches/%s/machines' % switch_id, data=data)
 
+    def iter_switch_machines(self, switch_id, limit=100, **data):
+        return self._get_pages(
+            '/switches/%s/machines' % switch_id, data=data, limit=limit
+        )
+
     def get_switch_machine(self, switch_id, machine_id):
         return self._get('/switches/%s/machines/%s' % (switch_id, machine_id))
 
@@ -331,6 +362,9 @@ class Client(object):
 
         return self._get('/switch-machines', data=data)
 
+    def iter_switchmachines(self, limit=100, **data):
+        return self._get_pages('/switch-machines', data=data, limit=limit)
+
     def list_switchmachines_hosts(self, switch_ip_int=None, port=None,
                                   vlans=None, mac=None, tag=None,
                                   location=None, os_name=None, os_id=None):
@@ -362,6 +396,11 @@ class Client(object):
 
         return self._get('/switches-machines-hosts', data=data)
 
+    def iter_switchmachines_hosts(self, limit=100, **data):
+        return self._get_pages(
+            '/switches-machines-hosts', data=data, limit=limit
+        )
+
     def show_switchmachine(self, switchmachine_id):
         return self._get('/switch-machines/%s' % switchmachine_id)
 
@@ -405,6 +444,9 @@ class Client(object):
 
         return self._get('/machines', data=data)
 
+    def iter_machines(self, limit=100, **data):
+        return self._get_pages('/machines', data=data, limit=limit)
+
     def get_machine(self, machine_id):
         data = {}
         if id:
@@ -490,6 +532,9 @@ class Client(object):
     def delete_subnet(self, subnet_id):
         return self._delete('/subnets/%s' % subnet_id)
 
+    def allocate_subnet_ips(self, subnet_id, data):
+        return self._post('/subnets/%s/allocate' % subnet_id, data=data)
+
     def list_adapters(self, name=None, distributed_system_name=None,
                       os_installer_name=None, package_installer_name=None):
         data = {}
@@ -656,6 +701,9 @@ class Client(object):
     def list_clusterhosts(self):
         return self._get('/clusterhosts')
 
+    def iter_clusterhosts(self, limit=100, **data):
+        return self._get_pages('/clusterhosts', data=data, limit=limit)
+
     def get_cluster_host(self, cluster_id, host_id):
         return self._get('/clusters/%s/hosts/%s' % (cluster_id, host_id))
 
@@ -724,6 +772,14 @@ class Client(object):
         return self._put('/clusterhosts/%s/config' % clusterhost_id,
                          data=data)
 
+    def update_cluster_hosts_config(self, cluster_id, data):
+        return self._put('/clusters/%s/hosts/config' % cluster_id,
+                         data=data)
+
+    def patch_cluster_hosts_config(self, cluster_id, data):
+        return self._patch('/clusters/%s/hosts/config' % cluster_id,
+                           data=data)
+
     def patch_cluster_host_config(self, cluster_id, host_id,
                                   os_config=None,
                                   package_config=None,
@@ -817,6 +873,22 @@ class Client(object):
     def get_clusterhost_state(self, clusterhost_id):
         return self._get('/clusterhosts/%s/state' % clusterhost_id)
 
+    def list_cluster_host_states(self, cluster_id, since=None):
+        data = {}
+        if since:
+            data['since'] = since
+
+        return self._get('/clusters/%s/hosts/states' % cluster_id,
+                         data=data)
+
+    def list_clusterhost_states(self, cluster_id, since=None):
+        data = {}
+        data['cluster_id'] = cluster_id
+        if since:
+            data['since'] = since
+
+        return self._get('/clusterhosts/states', data=data)
+
     def update_cluster_host_state(self, cluster_id, host_id, state=None,
                                   percentage=None, message=None,
                                   raw_data=None):
@@ -870,6 +942,9 @@ class Client(object):
 
         return self._get('/hosts', data=data)
 
+    def iter_hosts(self, limit=100, **data):
+        return self._get_pages('/hosts', data=data, limit=limit)
+
     def get_host(self, host_id):
         return self._get('/hosts/%s' % host_id)
 
@@ -894,6 +969,9 @@ class Client(object):
 
         return self._get('/machines-hosts', data=data)
 
+    def iter_machines_or_hosts(self, limit=100, **data):
+        return self._get_pages('/machines-hosts', data=data, limit=limit)
+
     def get_machine_or_host(self, host_id):
         return self._get('/machines-hosts/%s' % host_id)
 
@@ -25,159 +25,250 @@ from compass.utils import setting_wrapper as setting
 from compass.utils import util
 
 
+def _get_on_conflict(exception_when_existing):
+    if exception_when_existing:
+        return 'error'
+    return 'update'
+
+
 def _add_system(session, model, configs, exception_when_existing=True):
-    parents = {}
     for config in configs:
         logging.info(
             'add config %s to %s',
             config, model
         )
-        object = utils.add_db_object(
-            session, model,
-            exception_when_existing, config['NAME'],
-            deployable=config.get('DEPLOYABLE', False)
-        )
-        parents[config['NAME']] = (
-            object, config.get('PARENT', None)
-        )
-    for name, (object, parent_name) in parents.items():
+    objects = utils.add_db_objects(
+        session, model, [
+            {
+                'name': config['NAME'],
+                'deployable': config.get('DEPLOYABLE', False)
+            }
+            for config in configs
+        ],
+        on_conflict=_get_on_conflict(exception_when_existing)
+    )
+    _update_parents(session, configs, objects)
+    return objects
+
+
+def _update_parents(session, configs, objects):
+    """Set the parent of objects to the object named by config PARENT.
+
+    The parent of an object whose config has no PARENT is cleared.
+    """
+    named_objects = dict(
+        (config['NAME'], object)
+        for config, object in zip(configs, objects)
+    )
+    for config, object in zip(configs, objects):
+        parent_name = config.get('PARENT', None)
         if parent_name:
-            parent, _ = parents[parent_name]
-        else:
-            parent = None
-        utils.update_db_object(session, object, parent=parent)
+            utils.update_db_object(
+                session, object, parent=named_objects[parent_name]
+            )
+        elif object.parent_id is not None:
+            utils.update_db_object(session, object, parent=None)
 
 
-def add_oses_internal(session, exception_when_existing=True):
-    configs = util.load_configs(setting.OS_DIR)
-    _add_system(
+def add_oses_internal(
+    session, exception_when_existing=True, configs=None
+):
+    if configs is None:
+        configs = util.load_configs(setting.OS_DIR)
+    return _add_system(
         session, models.OperatingSystem, configs,
         exception_when_existing=exception_when_existing
     )
 
 
-def add_distributed_systems_internal(session, exception_when_existing=True):
-    configs = util.load_configs(setting.DISTRIBUTED_SYSTEM_DIR)
-    _add_system(
+def add_distributed_systems_internal(
+    session, exception_when_existing=True, configs=None
+):
+    if configs is None:
+        configs = util.load_configs(setting.DISTRIBUTED_SYSTEM_DIR)
+    return _add_system(
         session, models.DistributedSystem, configs,
         exception_when_existing=exception_when_existing
     )
 
 
-def add_adapters_internal(session, exception_when_existing=True):
-    parents = {}
-    configs = util.load_configs(setting.ADAPTER_DIR)
+def _get_named_objects(session, model, key='name'):
+    """Get all objects of model indexed by key."""
+    return dict(
+        (getattr(object, key), object)
+        for object in utils.list_db_objects(session, model)
+    )
+
+
+def _get_named_object(named_objects, model, name, key='name'):
+    if name not in named_objects:
+        raise exception.RecordNotExists(
+            'Cannot find the record in table %s: %s' % (
+                model.__name__, {key: name}
+            )
+        )
+    return named_objects[name]
+
+
+def add_adapters_internal(
+    session, exception_when_existing=True, configs=None
+):
+    if configs is None:
+        configs = util.load_configs(setting.ADAPTER_DIR)
+    distributed_systems = _get_named_objects(
+        session, models.DistributedSystem
+    )
+    os_installers = _get_named_objects(
+        session, models.OSInstaller, 'alias'
+    )
+    package_installers = _get_named_objects(
+        session, models.PackageInstaller, 'alias'
+    )
+    rows = []
     for config in configs:
         logging.info('add config %s to adapter', config)
         if 'DISTRIBUTED_SYSTEM' in config:
-            distributed_system = utils.get_db_object(
-                session, models.DistributedSystem,
-                name=config['DISTRIBUTED_SYSTEM']
+            distributed_system = _get_named_object(
+                distributed_systems, models.DistributedSystem,
+                config['DISTRIBUTED_SYSTEM']
             )
         else:
             distributed_system = None
         if 'OS_INSTALLER' in config:
-            os_installer = utils.get_db_object(
-                session, models.OSInstaller,
-                alias=config['OS_INSTALLER']
+            os_installer = _get_named_object(
+                os_installers, models.OSInstaller,
+                config['OS_INSTALLER'], 'alias'
             )
         else:
             os_installer = None
         if 'PACKAGE_INSTALLER' in config:
-            package_installer = utils.get_db_object(
-                session, models.PackageInstaller,
-                alias=config['PACKAGE_INSTALLER']
+            package_installer = _get_named_object(
+                package_installers, models.PackageInstaller,
+                config['PACKAGE_INSTALLER'], 'alias'
             )
         else:
             package_installer = None
-        adapter = utils.add_db_object(
-            session, models.Adapter,
-            exception_when_existing,
-            config['NAME'],
-            display_name=config.get('DISPLAY_NAME', None),
-            distributed_system=distributed_system,
-            os_installer=os_installer,
-            package_installer=package_installer,
-            deployable=config.get('DEPLOYABLE', False)
+        rows.append({
+            'name': config['NAME'],
+            'display_name': config.get('DISPLAY_NAME', None),
+            'distributed_system': distributed_system,
+            'os_installer': os_installer,
+            'package_installer': package_installer,
+            'deployable': config.get('DEPLOYABLE', False)
+        })
+    on_conflict = _get_on_conflict(exception_when_existing)
+    adapters = utils.add_db_objects(
+        session, models.Adapter, rows, on_conflict=on_conflict
+    )
+    oses = [
+        os for os in utils.list_db_objects(
+            session, models.OperatingSystem
         )
+        if os.deployable
+    ]
+    adapter_os_rows = []
+    for config, adapter in zip(configs, adapters):
         supported_os_patterns = [
             re.compile(supported_os_pattern)
             for supported_os_pattern in config.get('SUPPORTED_OS_PATTERNS', [])
         ]
-        oses = utils.list_db_objects(
-            session, models.OperatingSystem
-        )
         for os in oses:
-            if not os.deployable:
-                continue
-            os_name = os.name
             for supported_os_pattern in supported_os_patterns:
-                if supported_os_pattern.match(os_name):
-                    utils.add_db_object(
-                        session, models.AdapterOS,
-                        exception_when_existing,
-                        os.id, adapter.id
-                    )
+                if supported_os_pattern.match(os.name):
+                    adapter_os_rows.append({
+                        'os_id': os.id, 'adapter_id': adapter.id
+                    })
                     break
-            parents[config['NAME']] = (adapter, config.get('PARENT', None))
-
-    for name, (adapter, parent_name) in parents.items():
-            if parent_name:
-                parent, _ = parents[parent_name]
-            else:
-                parent = None
-            utils.update_db_object(session, adapter, parent=parent)
+    utils.add_db_objects(
+        session, models.AdapterOS, adapter_os_rows,
+        on_conflict=on_conflict
+    )
+    _update_parents(session, configs, adapters)
+    return adapters
 
 
-def add_roles_internal(session, exception_when_existing=True):
-    configs = util.load_configs(setting.ADAPTER_ROLE_DIR)
+def add_roles_internal(
+    session, exception_when_existing=True, configs=None
+):
+    if configs is None:
+        configs = util.load_configs(setting.ADAPTER_ROLE_DIR)
+    adapters = _get_named_objects(session, models.Adapter)
+    rows = []
     for config in configs:
         logging.info(
             'add config %s to role', config
         )
-        adapter = utils.get_db_object(
-            session, models.Adapter,
-            name=config['ADAPTER_NAME']
+        adapter = _get_named_object(
+            adapters, models.Adapter, config['ADAPTER_NAME']
         )
         for role_dict in config['ROLES']:
-            utils.add_db_object(
-                session, models.AdapterRole,
-                exception_when_existing, role_dict['role'], adapter.id,
-                display_name=role_dict.get('display_name', None),
-                description=role_dict.get('description', None),
-                optional=role_dict.get('optional', False)
-            )
+            rows.append({
+                'name': role_dict['role'], 'adapter_id': adapter.id,
+                'display_name': role_dict.get('display_name', None),
+                'description': role_dict.get('description', None),
+                'optional': role_dict.get('optional', False)
+            })
+    return utils.add_db_objects(
+        session, models.AdapterRole, rows,
+        on_conflict=_get_on_conflict(exception_when_existing)
+    )
 
 
-def add_flavors_internal(session, exception_when_existing=True):
-    configs = util.load_configs(setting.ADAPTER_FLAVOR_DIR)
+def add_flavors_internal(
+    session, exception_when_existing=True, configs=None
+):
+    if configs is None:
+        configs = util.load_configs(setting.ADAPTER_FLAVOR_DIR)
+    adapters = _get_named_objects(session, models.Adapter)
+    roles = dict(
+        ((role.adapter_id, role.name), role)
+        for role in utils.list_db_objects(session, models.AdapterRole)
+    )
+    rows = []
+    flavor_role_names = []
     for config in configs:
         logging.info('add config %s to flavor', config)
-        adapter = utils.get_db_object(
-            session, models.Adapter,
-            name=config['ADAPTER_NAME']
+        adapter = _get_named_object(
+            adapters, models.Adapter, config['ADAPTER_NAME']
         )
         for flavor_dict in config['FLAVORS']:
-            flavor = utils.add_db_object(
-                session, models.AdapterFlavor,
-                exception_when_existing, flavor_dict['flavor'], adapter.id,
-                display_name=flavor_dict.get('display_name', None),
-                template=flavor_dict.get('template', None)
-            )
-            role_names = flavor_dict.get('roles', [])
-            for role_name in role_names:
-                role = utils.get_db_object(
-                    session, models.AdapterRole,
-                    name=role_name, adapter_id=adapter.id
-                )
-                utils.add_db_object(
-                    session, models.AdapterFlavorRole,
-                    exception_when_existing, flavor.id, role.id
-                )
-                utils.update_db_object(
-                    session, flavor,
-                    patched_ordered_flavor_roles=[role_name]
+            rows.append({
+                'name': flavor_dict['flavor'], 'adapter_id': adapter.id,
+                'display_name': flavor_dict.get('display_name', None),
+                'template': flavor_dict.get('template', None)
+            })
+            flavor_role_names.append(flavor_dict.get('roles', []))
+    on_conflict = _get_on_conflict(exception_when_existing)
+    flavors = utils.add_db_objects(
+        session, models.AdapterFlavor, rows, on_conflict=on_conflict
+    )
+    flavor_role_rows = []
+    for flavor, role_names in zip(flavors, flavor_role_names):
+        for role_name in role_names:
+            role_key = (flavor.adapter_id, role_name)
+            if role_key not in roles:
+                raise exception.RecordNotExists(
+                    'Cannot find the record in table %s: %s' % (
+                        models.AdapterRole.__name__, {
+                            'name': role_name,
+                            'adapter_id': flavor.adapter_id
+                        }
+                    )
                 )
+            flavor_role_rows.append({
+                'flavor_id': flavor.id, 'role_id': roles[role_key].id
+            })
+    utils.add_db_objects(
+        session, models.AdapterFlavorRole, flavor_role_rows,
+        on_conflict=on_conflict
+    )
+    for flavor, role_names in zip(flavors, flavor_role_names):
+        if role_names:
+            utils.update_db_object(
+                session, flavor,
+                patched_ordered_flavor_roles=role_names
+            )
+    return flavors
 
 
 def get_adapters_internal(session):
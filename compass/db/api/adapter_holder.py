@@ -18,6 +18,7 @@ import logging
 from compass.db.api import adapter as adapter_api
 from compass.db.api import database
 from compass.db.api import permission
+from compass.db.api import snapshot
 from compass.db.api import user as user_api
 from compass.db.api import utils
 from compass.db import exception
@@ -51,12 +52,26 @@ def load_adapters(session):
 
 
 def load_adapters_internal(session):
-    global ADAPTER_MAPPING
     logging.info('load adapters into memory')
-    ADAPTER_MAPPING = adapter_api.get_adapters_internal(session)
+    ADAPTER_SNAPSHOT.load(session)
 
 
-ADAPTER_MAPPING = {}
+ADAPTER_SNAPSHOT = snapshot.Snapshot(
+    'adapter', adapter_api.get_adapters_internal
+)
+
+
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_LIST_ADAPTERS
+)
+def get_adapters_version(session, getter):
+    """Get version of adapters.
+
+    The version changes whenever the adapters are reloaded.
+    """
+    ADAPTER_SNAPSHOT.get(session)
+    return str(ADAPTER_SNAPSHOT.generation)
 
 
 def _filter_adapters(adapter_config, filter_name, filter_value):
@@ -97,21 +112,19 @@ def _filter_adapters(adapter_config, filter_name, filter_value):
 )
 def list_adapters(session, lister, **filters):
     """list adapters."""
-    if not ADAPTER_MAPPING:
-        load_adapters_internal(session)
-    return ADAPTER_MAPPING.values()
+    adapter_mapping = ADAPTER_SNAPSHOT.get(session)
+    return adapter_mapping.values()
 
 
 def get_adapter_internal(session, adapter_id):
     """get adapter."""
-    if not ADAPTER_MAPPING:
-        load_adapters_internal(session)
+    adapter_mapping = ADAPTER_SNAPSHOT.get(session)
 
-    if adapter_id not in ADAPTER_MAPPING:
+    if adapter_id not in adapter_mapping:
         raise exception.RecordNotExists(
             'adpater %s does not exist' % adapter_id
         )
-    return ADAPTER_MAPPING[adapter_id]
+    return adapter_mapping[adapter_id]
 
 
 @utils.supported_filters([])
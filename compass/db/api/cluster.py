@@ -18,6 +18,11 @@ import copy
 import functools
 import logging
 
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import subqueryload
+from sqlalchemy.orm import undefer_group
+
 from compass.db.api import database
 from compass.db.api import metadata_holder as metadata_api
 from compass.db.api import permission
@@ -77,6 +82,12 @@ RESP_CLUSTERHOST_CONFIG_FIELDS = [
     'created_at',
     'updated_at'
 ]
+RESP_CLUSTERHOSTS_CONFIG_FIELDS = [
+    'hosts', 'failed_hosts'
+]
+RESP_CLUSTERHOSTS_CONFIG_HOST_FIELDS = [
+    'id', 'clusterhost_id', 'host_id', 'roles'
+] + RESP_CLUSTERHOST_CONFIG_FIELDS
 RESP_CLUSTERHOST_DEPLOYED_CONFIG_FIELDS = [
     'deployed_os_config',
     'deployed_package_config',
@@ -92,6 +103,40 @@ RESP_CLUSTERHOST_STATE_FIELDS = [
     'id', 'state', 'percentage', 'message', 'severity',
     'created_at', 'updated_at'
 ]
+# relationships accessed in ClusterHost.to_dict.
+CLUSTERHOST_LOAD_PROFILE = [
+    joinedload('state'),
+    joinedload('cluster'),
+    joinedload('host').joinedload('machine').subqueryload(
+        'switch_machines'
+    ).joinedload('switch'),
+    joinedload('host').joinedload('state'),
+    joinedload('host').joinedload('os_installer'),
+    joinedload('host').subqueryload('host_networks').joinedload('subnet'),
+    joinedload('host').subqueryload('clusterhosts').joinedload('cluster')
+]
+# deferred config columns accessed in update_cluster_hosts_config.
+CLUSTERHOST_CONFIG_LOAD_PROFILE = CLUSTERHOST_LOAD_PROFILE + [
+    undefer_group('config'),
+    joinedload('host').undefer_group('config')
+]
+# relationships and deferred config columns accessed in review_cluster.
+REVIEW_LOAD_PROFILE = [
+    subqueryload('clusterhosts').undefer_group('config'),
+    subqueryload('clusterhosts').joinedload('state'),
+    subqueryload('clusterhosts').joinedload('host').undefer_group('config'),
+    subqueryload('clusterhosts').joinedload('host').joinedload('state'),
+    subqueryload('clusterhosts').joinedload('host').joinedload('machine'),
+    subqueryload('clusterhosts').joinedload('host').subqueryload(
+        'clusterhosts'
+    ),
+    subqueryload('clusterhosts').joinedload('host').subqueryload(
+        'host_networks'
+    ).joinedload('subnet')
+]
+RESP_CLUSTERHOST_STATES_FIELDS = [
+    'clusterhost_id', 'cluster_id', 'host_id'
+] + RESP_CLUSTERHOST_STATE_FIELDS
 RESP_REVIEW_FIELDS = [
     'cluster', 'hosts'
 ]
@@ -115,6 +160,9 @@ UPDATED_DEPLOYED_CONFIG_FIELDS = [
 PATCHED_CONFIG_FIELDS = [
     'patched_os_config', 'patched_package_config', 'config_step'
 ]
+UPDATED_CLUSTERHOSTS_CONFIG_FIELDS = [
+    'clusterhost_id', 'host_id', 'os_config', 'package_config', 'roles'
+]
 UPDATED_CLUSTERHOST_CONFIG_FIELDS = [
     'put_os_config',
     'put_package_config'
@@ -148,7 +196,9 @@ UPDATED_CLUSTERHOST_LOG_FIELDS = [
 ]
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_CLUSTERS
@@ -389,6 +439,25 @@ def get_cluster_metadata(session, getter, cluster_id, **kwargs):
     return metadatas
 
 
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_LIST_METADATAS
+)
+def get_cluster_metadata_version(session, getter, cluster_id):
+    """Get version of cluster metadata.
+
+    The version changes with the os and adapter of the cluster and
+    the version of metadatas.
+    """
+    cluster = utils.get_db_object(
+        session, models.Cluster, id=cluster_id
+    )
+    return '%s.%s.%s' % (
+        cluster.os_id, cluster.adapter_id,
+        metadata_api.get_metadatas_version_internal(session)
+    )
+
+
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_ADD_CLUSTER_CONFIG
 )
@@ -634,7 +703,11 @@ def _set_clusterhosts(session, cluster, machines):
         )
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_CLUSTERHOST_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=(
+        SUPPORTED_CLUSTERHOST_FIELDS + utils.LIST_OPTION_FIELDS
+    )
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_CLUSTERHOSTS
@@ -643,12 +716,17 @@ def _set_clusterhosts(session, cluster, machines):
 def list_cluster_hosts(session, lister, cluster_id, **filters):
     """Get cluster host info."""
     return utils.list_db_objects(
-        session, models.ClusterHost, cluster_id=cluster_id,
+        session, models.ClusterHost,
+        load_profile=CLUSTERHOST_LOAD_PROFILE, cluster_id=cluster_id,
         **filters
     )
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_CLUSTERHOST_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=(
+        SUPPORTED_CLUSTERHOST_FIELDS + utils.LIST_OPTION_FIELDS
+    )
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_CLUSTERHOSTS
@@ -657,7 +735,8 @@ def list_cluster_hosts(session, lister, cluster_id, **filters):
 def list_clusterhosts(session, lister, **filters):
     """Get cluster host info."""
     return utils.list_db_objects(
-        session, models.ClusterHost, **filters
+        session, models.ClusterHost,
+        load_profile=CLUSTERHOST_LOAD_PROFILE, **filters
     )
 
 
@@ -674,7 +753,7 @@ def get_cluster_host(
     """Get clusterhost info."""
     return utils.get_db_object(
         session, models.ClusterHost,
-        exception_when_missing,
+        exception_when_missing, load_profile=CLUSTERHOST_LOAD_PROFILE,
         cluster_id=cluster_id, host_id=host_id
     )
 
@@ -692,7 +771,7 @@ def get_clusterhost(
     """Get clusterhost info."""
     return utils.get_db_object(
         session, models.ClusterHost,
-        exception_when_missing,
+        exception_when_missing, load_profile=CLUSTERHOST_LOAD_PROFILE,
         clusterhost_id=clusterhost_id
     )
 
@@ -717,6 +796,32 @@ def add_cluster_host(
     )
 
 
+def _validate_clusterhost_roles(clusterhost, roles):
+    """Check roles are in the roles of the cluster flavor."""
+    cluster_roles = []
+    cluster = clusterhost.cluster
+    flavor = cluster.flavor
+    if not roles:
+        if flavor:
+            raise exception.InvalidParameter(
+                'roles %s is empty' % roles
+            )
+    else:
+        if not flavor:
+            raise exception.InvalidParameter(
+                'not flavor in cluster %s' % cluster.name
+            )
+        for flavor_roles in flavor.flavor_roles:
+            cluster_roles.append(flavor_roles.role.name)
+        for role in roles:
+            if role not in cluster_roles:
+                raise exception.InvalidParameter(
+                    'role %s is not in cluster roles %s' % (
+                        role, cluster_roles
+                    )
+                )
+
+
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_UPDATE_CLUSTER_HOSTS
 )
@@ -755,28 +860,7 @@ def _update_clusterhost(session, updater, clusterhost, **kwargs):
             )
 
     def roles_validates(roles):
-        cluster_roles = []
-        cluster = clusterhost.cluster
-        flavor = cluster.flavor
-        if not roles:
-            if flavor:
-                raise exception.InvalidParameter(
-                    'roles %s is empty' % roles
-                )
-        else:
-            if not flavor:
-                raise exception.InvalidParameter(
-                    'not flavor in cluster %s' % cluster.name
-                )
-            for flavor_roles in flavor.flavor_roles:
-                cluster_roles.append(flavor_roles.role.name)
-            for role in roles:
-                if role not in cluster_roles:
-                    raise exception.InvalidParameter(
-                        'role %s is not in cluster roles %s' % (
-                            role, cluster_roles
-                        )
-                    )
+        _validate_clusterhost_roles(clusterhost, roles)
 
     @utils.input_validates(
         roles=roles_validates,
@@ -1231,6 +1315,195 @@ def patch_clusterhost_config(
     )
 
 
+def _get_clusterhost_config_updates(
+    session, updater, clusterhost, patch,
+    os_config=None, package_config=None, roles=None
+):
+    """Validate configs and roles of a clusterhost without updating it.
+
+    Put configs are validated as given and patched configs are
+    validated after being merged into the current configs.
+
+    :return: list of (db object, values) to update.
+    """
+    from compass.db.api import host as host_api
+    updates = []
+    host = clusterhost.host
+    cluster = clusterhost.cluster
+    if package_config is not None or roles is not None:
+        is_cluster_editable(session, cluster, updater)
+    if os_config is not None:
+        if host_api.is_host_editable(
+            session, host, updater,
+            exception_when_not_editable=False
+        ):
+            if patch:
+                metadata_api.validate_os_config(
+                    session, util.merge_dict(
+                        copy.deepcopy(dict(host.os_config)), os_config
+                    ), host.os_id
+                )
+                updates.append((host, {'patched_os_config': os_config}))
+            else:
+                metadata_api.validate_os_config(
+                    session, os_config, host.os_id
+                )
+                updates.append((host, {'put_os_config': os_config}))
+        else:
+            logging.info(
+                'ignore update host %s config '
+                'since it is not editable', host.name
+            )
+    clusterhost_values = {}
+    if package_config is not None:
+        if patch:
+            metadata_api.validate_package_config(
+                session, util.merge_dict(
+                    copy.deepcopy(dict(clusterhost.package_config)),
+                    package_config
+                ), cluster.adapter_id
+            )
+            clusterhost_values['patched_package_config'] = package_config
+        else:
+            metadata_api.validate_package_config(
+                session, package_config, cluster.adapter_id
+            )
+            clusterhost_values['put_package_config'] = package_config
+    if roles is not None:
+        _validate_clusterhost_roles(clusterhost, roles)
+        if patch:
+            clusterhost_values['patched_roles'] = roles
+        else:
+            clusterhost_values['roles'] = roles
+    if clusterhost_values:
+        updates.append((clusterhost, clusterhost_values))
+    return updates
+
+
+def _update_clusterhosts_config(session, updater, cluster_id, data, patch):
+    """Update configs and roles of cluster hosts in one transaction.
+
+    Each item of data is validated before anything is updated. Items
+    failing validation are returned in failed_hosts and the others are
+    updated together.
+    """
+    cluster = utils.get_db_object(
+        session, models.Cluster, id=cluster_id
+    )
+    if any(isinstance(item, dict) and 'roles' in item for item in data):
+        user_api.check_user_permission_internal(
+            session, updater, permission.PERMISSION_UPDATE_CLUSTER_HOSTS
+        )
+    clusterhosts = utils.list_db_objects(
+        session, models.ClusterHost,
+        load_profile=CLUSTERHOST_CONFIG_LOAD_PROFILE,
+        cluster_id=cluster.id
+    )
+    clusterhosts_by_id = {}
+    clusterhosts_by_host_id = {}
+    for clusterhost in clusterhosts:
+        clusterhosts_by_id[clusterhost.clusterhost_id] = clusterhost
+        clusterhosts_by_host_id[clusterhost.host_id] = clusterhost
+    hosts = []
+    failed_hosts = []
+    updates = []
+    for item in data:
+        try:
+            if not isinstance(item, dict):
+                raise exception.InvalidParameter(
+                    'item %s is not dict' % item
+                )
+            unsupported_keys = [
+                key for key in item
+                if key not in UPDATED_CLUSTERHOSTS_CONFIG_FIELDS
+            ]
+            if unsupported_keys:
+                raise exception.InvalidParameter(
+                    'unsupported keys %s in item %s' % (
+                        unsupported_keys, item
+                    )
+                )
+            in_kwargs = dict(item)
+            clusterhost_id = in_kwargs.pop('clusterhost_id', None)
+            host_id = in_kwargs.pop('host_id', None)
+            if clusterhost_id is not None:
+                clusterhost = clusterhosts_by_id.get(clusterhost_id)
+            elif host_id is not None:
+                clusterhost = clusterhosts_by_host_id.get(host_id)
+            else:
+                raise exception.InvalidParameter(
+                    'neither clusterhost_id nor host_id in item %s' % item
+                )
+            if not clusterhost or (
+                host_id is not None and clusterhost.host_id != host_id
+            ):
+                raise exception.RecordNotExists(
+                    'clusterhost %s host %s does not exist '
+                    'in cluster %s' % (clusterhost_id, host_id, cluster_id)
+                )
+            if clusterhost in hosts:
+                raise exception.InvalidParameter(
+                    'clusterhost %s is updated more than once' % (
+                        clusterhost.clusterhost_id
+                    )
+                )
+            updates.extend(_get_clusterhost_config_updates(
+                session, updater, clusterhost, patch, **in_kwargs
+            ))
+            hosts.append(clusterhost)
+        except exception.DatabaseException as error:
+            logging.exception(error)
+            failed_host = {'message': str(error)}
+            if isinstance(item, dict):
+                for key in ['clusterhost_id', 'host_id']:
+                    if key in item:
+                        failed_host[key] = item[key]
+            failed_hosts.append(failed_host)
+    utils.bulk_update_db_objects(session, updates)
+    return {
+        'hosts': hosts,
+        'failed_hosts': failed_hosts
+    }
+
+
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_ADD_CLUSTERHOST_CONFIG
+)
+@utils.wrap_to_dict(
+    RESP_CLUSTERHOSTS_CONFIG_FIELDS,
+    hosts=RESP_CLUSTERHOSTS_CONFIG_HOST_FIELDS
+)
+def update_cluster_hosts_config(session, updater, cluster_id, data=[]):
+    """Update configs and roles of cluster hosts.
+
+    data is a list of dict of clusterhost_id or host_id and any of
+    os_config, package_config and roles.
+    """
+    return _update_clusterhosts_config(
+        session, updater, cluster_id, data, False
+    )
+
+
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_ADD_CLUSTERHOST_CONFIG
+)
+@utils.wrap_to_dict(
+    RESP_CLUSTERHOSTS_CONFIG_FIELDS,
+    hosts=RESP_CLUSTERHOSTS_CONFIG_HOST_FIELDS
+)
+def patch_cluster_hosts_config(session, updater, cluster_id, data=[]):
+    """Patch configs and roles of cluster hosts.
+
+    data is a list of dict of clusterhost_id or host_id and any of
+    os_config, package_config and roles.
+    """
+    return _update_clusterhosts_config(
+        session, updater, cluster_id, data, True
+    )
+
+
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_DEL_CLUSTERHOST_CONFIG
 )
@@ -1383,6 +1656,63 @@ def validate_cluster(session, cluster):
             )
 
 
+def _review_clusterhost(
+    session, reviewer, clusterhost, os_config, package_config
+):
+    """Review configs of a clusterhost merged with cluster configs.
+
+    :return: list of (db object, values) to update.
+    """
+    from compass.db.api import host as host_api
+    updates = []
+    host = clusterhost.host
+    if os_config:
+        if host_api.is_host_editable(
+            session, host, reviewer, False
+        ):
+            host_os_config = copy.deepcopy(host.os_config)
+            host_os_config = metadata_api.autofill_os_config(
+                session, host_os_config, host.os_id,
+                host=host
+            )
+            deployed_os_config = util.merge_dict(
+                copy.deepcopy(os_config), host_os_config
+            )
+            metadata_api.validate_os_config(
+                session, deployed_os_config, host.os_id, True
+            )
+            host_api.validate_host(session, host)
+            updates.append((host, {
+                'os_config': host_os_config, 'config_validated': True
+            }))
+        else:
+            logging.info(
+                'ignore update host %s config '
+                'since it is not editable' % host.name
+            )
+    if package_config:
+        clusterhost_package_config = copy.deepcopy(
+            clusterhost.package_config
+        )
+        clusterhost_package_config = metadata_api.autofill_package_config(
+            session, clusterhost_package_config,
+            clusterhost.cluster.adapter_id, clusterhost=clusterhost
+        )
+        deployed_package_config = util.merge_dict(
+            copy.deepcopy(package_config), clusterhost_package_config
+        )
+        metadata_api.validate_package_config(
+            session, deployed_package_config,
+            clusterhost.cluster.adapter_id, True
+        )
+        validate_clusterhost(session, clusterhost)
+        updates.append((clusterhost, {
+            'package_config': clusterhost_package_config,
+            'config_validated': True
+        }))
+    return updates
+
+
 @utils.supported_filters(optional_support_keys=['review'])
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
@@ -1394,10 +1724,15 @@ def validate_cluster(session, cluster):
     hosts=RESP_CLUSTERHOST_CONFIG_FIELDS
 )
 def review_cluster(session, reviewer, cluster_id, review={}, **kwargs):
-    """review cluster."""
-    from compass.db.api import host as host_api
+    """review cluster.
+
+    Cluster configs are autofilled once. Clusterhost configs are then
+    reviewed one by one against them, errors of all clusterhosts are
+    reported together and the configs are written in one flush.
+    """
     cluster = utils.get_db_object(
-        session, models.Cluster, id=cluster_id
+        session, models.Cluster, load_profile=REVIEW_LOAD_PROFILE,
+        id=cluster_id
     )
     is_cluster_editable(session, cluster, reviewer)
     host_ids = review.get('hosts', [])
@@ -1418,31 +1753,6 @@ def review_cluster(session, reviewer, cluster_id, review={}, **kwargs):
         metadata_api.validate_os_config(
             session, os_config, cluster.os_id, True
         )
-        for clusterhost in clusterhosts:
-            host = clusterhost.host
-            if not host_api.is_host_editable(
-                session, host, reviewer, False
-            ):
-                logging.info(
-                    'ignore update host %s config '
-                    'since it is not editable' % host.name
-                )
-                continue
-            host_os_config = copy.deepcopy(host.os_config)
-            host_os_config = metadata_api.autofill_os_config(
-                session, host_os_config, host.os_id,
-                host=host
-            )
-            deployed_os_config = util.merge_dict(
-                os_config, host_os_config
-            )
-            metadata_api.validate_os_config(
-                session, deployed_os_config, host.os_id, True
-            )
-            host_api.validate_host(session, host)
-            utils.update_db_object(
-                session, host, os_config=host_os_config, config_validated=True
-            )
     package_config = copy.deepcopy(cluster.package_config)
     package_config = metadata_api.autofill_package_config(
         session, package_config, cluster.adapter_id,
@@ -1452,27 +1762,29 @@ def review_cluster(session, reviewer, cluster_id, review={}, **kwargs):
         metadata_api.validate_package_config(
             session, package_config, cluster.adapter_id, True
         )
-        for clusterhost in clusterhosts:
-            clusterhost_package_config = copy.deepcopy(
-                clusterhost.package_config
-            )
-            clusterhost_package_config = metadata_api.autofill_package_config(
-                session, clusterhost_package_config,
-                cluster.adapter_id, clusterhost=clusterhost
-            )
-            deployed_package_config = util.merge_dict(
-                package_config, clusterhost_package_config
-            )
-            metadata_api.validate_package_config(
-                session, deployed_package_config,
-                cluster.adapter_id, True
+    updates = []
+    errors = []
+    for clusterhost in clusterhosts:
+        try:
+            updates.extend(_review_clusterhost(
+                session, reviewer, clusterhost, os_config, package_config
+            ))
+        except exception.DatabaseException as error:
+            logging.error(
+                'failed to review clusterhost %s: %s',
+                clusterhost.name, error
             )
-            validate_clusterhost(session, clusterhost)
-            utils.update_db_object(
-                session, clusterhost,
-                package_config=clusterhost_package_config,
-                config_validated=True
+            errors.append((clusterhost, error))
+    if len(errors) == 1:
+        raise errors[0][1]
+    if errors:
+        raise exception.MultiDatabaseException([
+            exception.InvalidParameter(
+                'clusterhost %s: %s' % (failed_clusterhost.name, error)
             )
+            for failed_clusterhost, error in errors
+        ])
+    utils.bulk_update_db_objects(session, updates)
     validate_cluster(session, cluster)
     utils.update_db_object(
         session, cluster, os_config=os_config, package_config=package_config,
@@ -1626,6 +1938,83 @@ def get_clusterhost_self_state(
     ).state
 
 
+def _list_clusterhost_states(session, since=None, **filters):
+    """List clusterhost state dicts in one query.
+
+    cluster, cluster state, host and host state are eager loaded
+    so computing state_dict of each clusterhost does not issue
+    extra queries. If since is given, only clusterhosts whose
+    clusterhost state or host state is updated after it are returned.
+    """
+    with session.begin(subtransactions=True):
+        query = utils.model_query(
+            session, models.ClusterHost
+        ).options(
+            joinedload('cluster').joinedload('distributed_system'),
+            joinedload('state'),
+            joinedload('host').joinedload('state')
+        )
+        query = utils.model_filter(query, models.ClusterHost, **filters)
+        if since:
+            query = query.filter(or_(
+                models.ClusterHost.state.has(
+                    models.ClusterHostState.updated_at > since
+                ),
+                models.ClusterHost.host.has(
+                    models.Host.state.has(
+                        models.HostState.updated_at > since
+                    )
+                )
+            ))
+        query = query.order_by(models.ClusterHost.clusterhost_id)
+        states = []
+        for clusterhost in query.all():
+            state = clusterhost.state_dict()
+            state.update({
+                'clusterhost_id': clusterhost.clusterhost_id,
+                'cluster_id': clusterhost.cluster_id,
+                'host_id': clusterhost.host_id
+            })
+            states.append(state)
+        return states
+
+
+@utils.supported_filters(optional_support_keys=['since'])
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_GET_CLUSTERHOST_STATE
+)
+@utils.wrap_to_dict(RESP_CLUSTERHOST_STATES_FIELDS)
+def list_cluster_host_states(
+    session, getter, cluster_id, since=None, **kwargs
+):
+    """List state info of all hosts in the cluster."""
+    utils.get_db_object(
+        session, models.Cluster, id=cluster_id
+    )
+    return _list_clusterhost_states(
+        session, since=since, cluster_id=cluster_id
+    )
+
+
+@utils.supported_filters(
+    ['cluster_id'],
+    optional_support_keys=['since']
+)
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_GET_CLUSTERHOST_STATE
+)
+@utils.wrap_to_dict(RESP_CLUSTERHOST_STATES_FIELDS)
+def list_clusterhost_states(
+    session, getter, cluster_id, since=None, **kwargs
+):
+    """List clusterhost state info of the given cluster(s)."""
+    return _list_clusterhost_states(
+        session, since=since, cluster_id=cluster_id
+    )
+
+
 @utils.supported_filters(
     optional_support_keys=UPDATED_CLUSTERHOST_STATE_FIELDS,
     ignore_support_keys=IGNORE_FIELDS
@@ -13,12 +13,19 @@
 # limitations under the License.
 
 """Provider interface to manipulate database."""
+import copy
 import functools
 import logging
 import netaddr
+import os.path
+import threading
+import time
+import traceback
 
 from contextlib import contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import reflection
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import scoped_session
@@ -27,6 +34,7 @@ from sqlalchemy.pool import NullPool
 from sqlalchemy.pool import QueuePool
 from sqlalchemy.pool import SingletonThreadPool
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateColumn
 from threading import local
 
 from compass.db import exception
@@ -39,6 +47,10 @@ ENGINE = None
 SESSION = sessionmaker(autocommit=False, autoflush=False)
 SCOPED_SESSION = None
 SESSION_HOLDER = local()
+QUERY_STATS_HOLDER = local()
+QUERY_METRICS = {}
+QUERY_METRICS_LOCK = threading.Lock()
+DB_API_DIR = os.path.dirname(os.path.abspath(__file__))
 
 POOL_MAPPING = {
     'instant': NullPool,
@@ -48,6 +60,93 @@ POOL_MAPPING = {
 }
 
 
+def _sqlite_connect(dbapi_connection, connection_record):
+    # pysqlite begins transactions by itself and commits them
+    # before any SAVEPOINT. Let sqlalchemy emit BEGIN instead.
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(connection):
+    connection.execute('BEGIN')
+
+
+def _get_db_api_caller():
+    """Get the db api function which issues the query."""
+    for filename, lineno, func_name, _ in reversed(
+        traceback.extract_stack()
+    ):
+        module_dir, module_file = os.path.split(os.path.abspath(filename))
+        if module_dir != DB_API_DIR:
+            continue
+        module_name = os.path.splitext(module_file)[0]
+        if module_name in ['database', 'utils']:
+            continue
+        return '%s.%s:%s' % (module_name, func_name, lineno)
+    return 'unknown'
+
+
+def _before_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    # the start time is kept on the execution context since
+    # _after_cursor_execute is not called for a failed statement.
+    if context is not None:
+        context._query_start_time = time.time()
+
+
+def _after_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    start_time = getattr(context, '_query_start_time', None)
+    if start_time is None:
+        return
+    duration = time.time() - start_time
+    stats = getattr(QUERY_STATS_HOLDER, 'stats', None)
+    if stats is not None:
+        stats['queries'] += 1
+        stats['time'] += duration
+    threshold = setting.DB_SLOW_QUERY_THRESHOLD
+    if threshold and duration >= threshold:
+        logging.warning(
+            'slow query took %.3fs in %s: %s %r',
+            duration, _get_db_api_caller(), statement, parameters
+        )
+
+
+def begin_query_stats():
+    """Begin counting the queries issued in this thread."""
+    QUERY_STATS_HOLDER.stats = {'queries': 0, 'time': 0.0}
+
+
+def end_query_stats(name=None):
+    """End counting the queries issued in this thread.
+
+    :param name: api or task name to aggregate the query stats in.
+    :return: dict of query count and total query time in seconds,
+             None if begin_query_stats is not called.
+    """
+    stats = getattr(QUERY_STATS_HOLDER, 'stats', None)
+    if stats is None:
+        return None
+    del QUERY_STATS_HOLDER.stats
+    if name:
+        with QUERY_METRICS_LOCK:
+            metrics = QUERY_METRICS.setdefault(name, {
+                'calls': 0, 'queries': 0, 'time': 0.0, 'max_time': 0.0
+            })
+            metrics['calls'] += 1
+            metrics['queries'] += stats['queries']
+            metrics['time'] += stats['time']
+            metrics['max_time'] = max(metrics['max_time'], stats['time'])
+    return stats
+
+
+def get_query_metrics():
+    """Get query stats aggregated by api or task name in this process."""
+    with QUERY_METRICS_LOCK:
+        return copy.deepcopy(QUERY_METRICS)
+
+
 def init(database_url=None):
     """Initialize database.
 
@@ -74,6 +173,11 @@ def init(database_url=None):
         database_url, convert_unicode=True,
         poolclass=poolclass
     )
+    if ENGINE.dialect.name == 'sqlite':
+        event.listen(ENGINE, 'connect', _sqlite_connect)
+        event.listen(ENGINE, 'begin', _sqlite_begin)
+    event.listen(ENGINE, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(ENGINE, 'after_cursor_execute', _after_cursor_execute)
     SESSION.configure(bind=ENGINE)
     SCOPED_SESSION = scoped_session(SESSION)
     models.BASE.query = SCOPED_SESSION.query_property()
@@ -87,12 +191,28 @@ def in_session():
         return False
 
 
-@contextmanager
-def session():
-    """database session scope.
+def _convert_exception(error):
+    """Convert error raised in session to compass database exception."""
+    if isinstance(error, IntegrityError):
+        return exception.NotAcceptable(
+            'operation error in database'
+        )
+    elif isinstance(error, OperationalError):
+        return exception.DatabaseException(
+            'operation error in database'
+        )
+    elif isinstance(error, exception.DatabaseException):
+        return error
+    else:
+        return exception.DatabaseException(str(error))
+
+
+def begin_session():
+    """Begin a session shared by the database operations in this thread.
 
        .. note::
-       To operate database, it should be called in database session.
+       Database operations called before end_session join the session
+       in savepoints, and are committed together by end_session.
     """
     if not ENGINE:
         init()
@@ -100,33 +220,94 @@ def session():
     if hasattr(SESSION_HOLDER, 'session'):
         logging.error('we are already in session')
         raise exception.DatabaseException('session already exist')
-    else:
-        new_session = SCOPED_SESSION()
-        setattr(SESSION_HOLDER, 'session', new_session)
+    new_session = SCOPED_SESSION()
+    setattr(SESSION_HOLDER, 'session', new_session)
+    setattr(SESSION_HOLDER, 'end_callbacks', [])
+    return new_session
+
 
+def end_session(commit=True):
+    """End the session begun by begin_session.
+
+    :param commit: commit the session if True, otherwise rollback.
+    """
+    my_session = current_session()
     try:
-        yield new_session
-        new_session.commit()
+        if commit:
+            my_session.commit()
+        else:
+            my_session.rollback()
     except Exception as error:
-        new_session.rollback()
+        my_session.rollback()
         logging.error('failed to commit session')
         logging.exception(error)
-        if isinstance(error, IntegrityError):
-            raise exception.NotAcceptable(
-                'operation error in database'
-            )
-        elif isinstance(error, OperationalError):
-            raise exception.DatabaseExcedption(
-                'operation error in database'
-            )
-        elif isinstance(error, exception.DatabaseException):
-            raise error
-        else:
-            raise exception.DatabaseException(str(error))
+        raise _convert_exception(error)
     finally:
-        new_session.close()
+        my_session.close()
         SCOPED_SESSION.remove()
         delattr(SESSION_HOLDER, 'session')
+        callbacks = SESSION_HOLDER.end_callbacks
+        delattr(SESSION_HOLDER, 'end_callbacks')
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception as error:
+                logging.error('failed to call %s after session', callback)
+                logging.exception(error)
+
+
+def call_after_session(callback, *args):
+    """Call callback after the session begun by begin_session ends.
+
+       .. note::
+       It is called immediately if not in a session begun by
+       begin_session, and after the session is committed or rolled
+       back otherwise, so caches invalidated by the callback are not
+       refilled from the uncommitted session.
+    """
+    if not in_session():
+        callback(*args)
+        return
+    SESSION_HOLDER.end_callbacks.append((callback, args))
+
+
+@contextmanager
+def _nested_session(my_session):
+    """Run in a savepoint of the current session."""
+    savepoint = my_session.begin_nested()
+    try:
+        yield my_session
+        savepoint.commit()
+    except Exception as error:
+        savepoint.rollback()
+        logging.error('failed to commit nested session')
+        logging.exception(error)
+        raise _convert_exception(error)
+
+
+@contextmanager
+def session():
+    """database session scope.
+
+       .. note::
+       To operate database, it should be called in database session.
+       If it is called in database session, it runs in a savepoint
+       of that session instead.
+    """
+    if hasattr(SESSION_HOLDER, 'session'):
+        with _nested_session(SESSION_HOLDER.session) as my_session:
+            yield my_session
+        return
+
+    new_session = begin_session()
+    try:
+        yield new_session
+    except Exception as error:
+        end_session(commit=False)
+        logging.error('failed to commit session')
+        logging.exception(error)
+        raise _convert_exception(error)
+    end_session()
 
 
 def current_session():
@@ -186,90 +367,92 @@ def _setup_switch_table(switch_session):
     )
 
 
-def _setup_os_installers(installer_session):
+def _setup_os_installers(installer_session, configs=None):
     """Initialize os_installer table."""
     logging.info('setup os installer table')
     from compass.db.api import installer
     installer.add_os_installers_internal(
-        installer_session
+        installer_session, configs=configs
     )
 
 
-def _setup_package_installers(installer_session):
+def _setup_package_installers(installer_session, configs=None):
     """Initialize package_installer table."""
     logging.info('setup package installer table')
     from compass.db.api import installer
     installer.add_package_installers_internal(
-        installer_session
+        installer_session, configs=configs
     )
 
 
-def _setup_oses(os_session):
+def _setup_oses(os_session, configs=None):
     """Initialize os table."""
     logging.info('setup os table')
     from compass.db.api import adapter
     adapter.add_oses_internal(
-        os_session
+        os_session, configs=configs
     )
 
 
-def _setup_distributed_systems(distributed_system_session):
+def _setup_distributed_systems(distributed_system_session, configs=None):
     """Initialize distributed system table."""
     logging.info('setup distributed system table')
     from compass.db.api import adapter
     adapter.add_distributed_systems_internal(
-        distributed_system_session
+        distributed_system_session, configs=configs
     )
 
 
-def _setup_adapters(adapter_session):
+def _setup_adapters(adapter_session, configs=None):
     """Initialize package adapter table."""
     logging.info('setup adapter table')
     from compass.db.api import adapter
     adapter.add_adapters_internal(
-        adapter_session)
+        adapter_session, configs=configs)
 
 
-def _setup_os_fields(field_session):
+def _setup_os_fields(field_session, configs=None):
     """Initialize os field table."""
     logging.info('setup os field table')
     from compass.db.api import metadata
-    metadata.add_os_field_internal(field_session)
+    metadata.add_os_field_internal(field_session, configs=configs)
 
 
-def _setup_package_fields(field_session):
+def _setup_package_fields(field_session, configs=None):
     """Initialize package field table."""
     logging.info('setup package field table')
     from compass.db.api import metadata
-    metadata.add_package_field_internal(field_session)
+    metadata.add_package_field_internal(field_session, configs=configs)
 
 
-def _setup_os_metadatas(metadata_session):
+def _setup_os_metadatas(metadata_session, configs=None):
     """Initialize os metadata table."""
     logging.info('setup os metadata table')
     from compass.db.api import metadata
-    metadata.add_os_metadata_internal(metadata_session)
+    metadata.add_os_metadata_internal(metadata_session, configs=configs)
 
 
-def _setup_package_metadatas(metadata_session):
+def _setup_package_metadatas(metadata_session, configs=None):
     """Initialize package metadata table."""
     logging.info('setup package metadata table')
     from compass.db.api import metadata
-    metadata.add_package_metadata_internal(metadata_session)
+    metadata.add_package_metadata_internal(
+        metadata_session, configs=configs
+    )
 
 
-def _setup_adapter_roles(role_session):
+def _setup_adapter_roles(role_session, configs=None):
     """Initialize adapter role table."""
     logging.info('setup adapter role table')
     from compass.db.api import adapter
-    adapter.add_roles_internal(role_session)
+    adapter.add_roles_internal(role_session, configs=configs)
 
 
-def _setup_adapter_flavors(flavor_session):
+def _setup_adapter_flavors(flavor_session, configs=None):
     """Initialize adapter flavor table."""
     logging.info('setup adapter flavor table')
     from compass.db.api import adapter
-    adapter.add_flavors_internal(flavor_session)
+    adapter.add_flavors_internal(flavor_session, configs=configs)
 
 
 def _update_others(other_session):
@@ -288,27 +471,225 @@ def _update_others(other_session):
     )
 
 
+def _update_snapshot_versions(other_session):
+    """Bump versions of snapshots built from bootstrap tables."""
+    from compass.db.api import snapshot
+    snapshot.bump_versions(other_session, snapshot.BOOTSTRAP_SNAPSHOTS)
+
+
+# config dir and the keys required in each config of bootstrap configs.
+BOOTSTRAP_CONFIG_DIRS = [
+    ('os_installer', 'OS_INSTALLER_DIR', ['INSTANCE_NAME', 'NAME']),
+    ('package_installer', 'PACKAGE_INSTALLER_DIR', ['INSTANCE_NAME', 'NAME']),
+    ('os', 'OS_DIR', ['NAME']),
+    ('distributed_system', 'DISTRIBUTED_SYSTEM_DIR', ['NAME']),
+    ('adapter', 'ADAPTER_DIR', ['NAME']),
+    ('adapter_role', 'ADAPTER_ROLE_DIR', ['ADAPTER_NAME', 'ROLES']),
+    ('adapter_flavor', 'ADAPTER_FLAVOR_DIR', ['ADAPTER_NAME', 'FLAVORS']),
+    ('os_field', 'OS_FIELD_DIR', ['NAME']),
+    ('package_field', 'PACKAGE_FIELD_DIR', ['NAME']),
+    ('os_metadata', 'OS_METADATA_DIR', ['OS', 'METADATA']),
+    ('package_metadata', 'PACKAGE_METADATA_DIR', ['ADAPTER', 'METADATA'])
+]
+
+
+def _load_bootstrap_configs():
+    """Load configs of all conf dirs used to create database."""
+    from compass.db.api import metadata
+    from compass.utils import util
+    configs = {}
+    for name, config_dir_setting, required_keys in BOOTSTRAP_CONFIG_DIRS:
+        config_dir = getattr(setting, config_dir_setting)
+        if name.endswith('_field') or name.endswith('_metadata'):
+            dir_configs = metadata.load_configs(config_dir)
+        else:
+            dir_configs = util.load_configs(config_dir)
+        for config in dir_configs:
+            missing_keys = [
+                key for key in required_keys if key not in config
+            ]
+            if missing_keys:
+                raise exception.InvalidParameter(
+                    '%s config in %s misses keys %s' % (
+                        name, config_dir, missing_keys
+                    )
+                )
+        configs[name] = dir_configs
+    _check_bootstrap_configs(configs)
+    return configs
+
+
+def _check_config_references(name, key, value, names):
+    if value not in names:
+        raise exception.InvalidParameter(
+            '%s config %s %s is not in %s' % (
+                name, key, value, sorted(names)
+            )
+        )
+
+
+def _check_bootstrap_configs(configs):
+    """Check the references between bootstrap configs."""
+    names = {}
+    for name in ['os', 'distributed_system', 'adapter']:
+        names[name] = set(config['NAME'] for config in configs[name])
+        for config in configs[name]:
+            if config.get('PARENT', None):
+                _check_config_references(
+                    name, 'PARENT', config['PARENT'], names[name]
+                )
+    for name in ['os_installer', 'package_installer']:
+        names[name] = set(
+            config['INSTANCE_NAME'] for config in configs[name]
+        )
+    for config in configs['adapter']:
+        for key, name in [
+            ('DISTRIBUTED_SYSTEM', 'distributed_system'),
+            ('OS_INSTALLER', 'os_installer'),
+            ('PACKAGE_INSTALLER', 'package_installer')
+        ]:
+            if key in config:
+                _check_config_references(
+                    'adapter', key, config[key], names[name]
+                )
+    adapter_roles = {}
+    for config in configs['adapter_role']:
+        _check_config_references(
+            'adapter_role', 'ADAPTER_NAME', config['ADAPTER_NAME'],
+            names['adapter']
+        )
+        adapter_roles.setdefault(config['ADAPTER_NAME'], set()).update(
+            role_dict['role'] for role_dict in config['ROLES']
+        )
+    for config in configs['adapter_flavor']:
+        adapter_name = config['ADAPTER_NAME']
+        _check_config_references(
+            'adapter_flavor', 'ADAPTER_NAME', adapter_name,
+            names['adapter']
+        )
+        for flavor_dict in config['FLAVORS']:
+            for role_name in flavor_dict.get('roles', []):
+                _check_config_references(
+                    'adapter_flavor', 'role', role_name,
+                    adapter_roles.get(adapter_name, set())
+                )
+    for config in configs['os_metadata']:
+        _check_config_references(
+            'os_metadata', 'OS', config['OS'], names['os']
+        )
+    for config in configs['package_metadata']:
+        _check_config_references(
+            'package_metadata', 'ADAPTER', config['ADAPTER'],
+            names['adapter']
+        )
+
+
 @run_in_session()
 def create_db(my_session):
-    """Create database."""
-    models.BASE.metadata.create_all(bind=ENGINE)
-    _setup_permission_table(my_session)
-    _setup_user_table(my_session)
-    _setup_switch_table(my_session)
-    _setup_os_installers(my_session)
-    _setup_package_installers(my_session)
-    _setup_oses(my_session)
-    _setup_distributed_systems(my_session)
-    _setup_adapters(my_session)
-    _setup_adapter_roles(my_session)
-    _setup_adapter_flavors(my_session)
-    _setup_os_fields(my_session)
-    _setup_package_fields(my_session)
-    _setup_os_metadatas(my_session)
-    _setup_package_metadatas(my_session)
-    _update_others(my_session)
+    """Create database.
+
+    Configs of all conf dirs are loaded and checked before any
+    table is written. Tables are then filled in dependency order.
+
+    :return: list of (stage, seconds) spent in each stage.
+    """
+    stage_times = []
+
+    def run_stage(stage, func, *args, **kwargs):
+        start_time = time.time()
+        result = func(*args, **kwargs)
+        stage_times.append((stage, time.time() - start_time))
+        return result
+
+    configs = run_stage('load configs', _load_bootstrap_configs)
+    run_stage(
+        'create tables', models.BASE.metadata.create_all, bind=ENGINE
+    )
+    run_stage('permission', _setup_permission_table, my_session)
+    run_stage('user', _setup_user_table, my_session)
+    run_stage('switch', _setup_switch_table, my_session)
+    for stage, setup in [
+        ('os_installer', _setup_os_installers),
+        ('package_installer', _setup_package_installers),
+        ('os', _setup_oses),
+        ('distributed_system', _setup_distributed_systems),
+        ('adapter', _setup_adapters),
+        ('adapter_role', _setup_adapter_roles),
+        ('adapter_flavor', _setup_adapter_flavors),
+        ('os_field', _setup_os_fields),
+        ('package_field', _setup_package_fields),
+        ('os_metadata', _setup_os_metadatas),
+        ('package_metadata', _setup_package_metadatas)
+    ]:
+        run_stage(stage, setup, my_session, configs[stage])
+    run_stage('update others', _update_others, my_session)
+    run_stage(
+        'snapshot version', _update_snapshot_versions, my_session
+    )
+    return stage_times
 
 
 def drop_db():
     """Drop database."""
     models.BASE.metadata.drop_all(bind=ENGINE)
+
+
+def upgrade_db():
+    """Upgrade database to the tables, columns and indexes of the models.
+
+    Missing tables, and missing nullable columns and missing indexes
+    of existing tables, are created. Existing columns and data are
+    not changed. Machine attributes are synced if their table is
+    created.
+
+    :return: list of created table, table.column and index names.
+    """
+    inspector = reflection.Inspector.from_engine(ENGINE)
+    table_names = set(inspector.get_table_names())
+    upgraded = []
+    for table in models.BASE.metadata.sorted_tables:
+        if table.name not in table_names:
+            logging.info('create table %s', table.name)
+            table.create(bind=ENGINE)
+            upgraded.append(table.name)
+            continue
+        column_names = set([
+            column['name'] for column in inspector.get_columns(table.name)
+        ])
+        for column in table.columns:
+            if column.name in column_names:
+                continue
+            if not column.nullable and column.server_default is None:
+                logging.error(
+                    'can not add column %s to table %s '
+                    'since it is not nullable', column.name, table.name
+                )
+                continue
+            logging.info(
+                'add column %s to table %s', column.name, table.name
+            )
+            ENGINE.execute('ALTER TABLE %s ADD COLUMN %s' % (
+                table.name,
+                CreateColumn(column).compile(dialect=ENGINE.dialect)
+            ))
+            upgraded.append('%s.%s' % (table.name, column.name))
+        index_names = set([
+            index['name'] for index in inspector.get_indexes(table.name)
+        ])
+        for index in table.indexes:
+            if index.name in index_names:
+                continue
+            logging.info(
+                'create index %s on table %s', index.name, table.name
+            )
+            index.create(bind=ENGINE)
+            upgraded.append(index.name)
+    if models.MachineAttribute.__tablename__ in upgraded:
+        # tag and location filters of machines query machine attributes,
+        # so attributes of the existing machines are indexed now.
+        from compass.db.api import machine as machine_api
+        logging.info(
+            'synced attributes of %s machines',
+            machine_api.sync_machine_attributes()
+        )
+    return upgraded
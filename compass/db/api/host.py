@@ -17,8 +17,13 @@ import functools
 import logging
 import netaddr
 
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import subqueryload
+
 from compass.db.api import database
+from compass.db.api import machine as machine_api
 from compass.db.api import metadata_holder as metadata_api
+from compass.db.api import network as network_api
 from compass.db.api import permission
 from compass.db.api import user as user_api
 from compass.db.api import utils
@@ -37,6 +42,28 @@ RESP_FIELDS = [
     'reinstall_os', 'os_installed', 'tag', 'location', 'networks',
     'created_at', 'updated_at'
 ]
+# relationships accessed in Host.to_dict.
+LOAD_PROFILE = [
+    joinedload('machine').subqueryload(
+        'switch_machines'
+    ).joinedload('switch'),
+    joinedload('state'),
+    joinedload('os_installer'),
+    subqueryload('host_networks').joinedload('subnet'),
+    subqueryload('clusterhosts').joinedload('cluster')
+]
+# relationships accessed in Machine.to_dict and Host.to_dict
+# when listing machines or hosts. host.machine is loaded explicitly
+# since only hosts are returned and the machines may be released
+# from the session identity map before the hosts are converted.
+MACHINE_HOST_LOAD_PROFILE = [
+    subqueryload('switch_machines').joinedload('switch'),
+    joinedload('host').joinedload('machine'),
+    joinedload('host').joinedload('state'),
+    joinedload('host').joinedload('os_installer'),
+    joinedload('host').subqueryload('host_networks').joinedload('subnet'),
+    joinedload('host').subqueryload('clusterhosts').joinedload('cluster')
+]
 RESP_CLUSTER_FIELDS = [
     'id', 'name', 'os_name', 'reinstall_distributed_system',
     'distributed_system_name', 'owner', 'adapter_id',
@@ -47,6 +74,12 @@ RESP_NETWORK_FIELDS = [
     'id', 'ip', 'interface', 'netmask', 'is_mgmt', 'is_promiscuous',
     'created_at', 'updated_at'
 ]
+RESP_ALLOCATED_NETWORK_FIELDS = [
+    'host_id', 'subnet_id'
+] + RESP_NETWORK_FIELDS
+RESP_ALLOCATED_NETWORKS_FIELDS = [
+    'host_networks', 'failed_host_networks'
+]
 RESP_CONFIG_FIELDS = [
     'os_config',
     'config_setp',
@@ -75,6 +108,9 @@ ADDED_NETWORK_FIELDS = [
     'interface', 'ip', 'subnet_id'
 ]
 OPTIONAL_ADDED_NETWORK_FIELDS = ['is_mgmt', 'is_promiscuous']
+ALLOCATED_NETWORK_FIELDS = ['host_id', 'interface']
+# ip of a host network to allocate from its subnet.
+AUTO_IP = 'auto'
 UPDATED_NETWORK_FIELDS = [
     'interface', 'ip', 'subnet_id', 'subnet', 'is_mgmt',
     'is_promiscuous'
@@ -101,7 +137,9 @@ UPDATED_LOG_FIELDS = [
 ]
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_HOSTS
@@ -110,12 +148,15 @@ UPDATED_LOG_FIELDS = [
 def list_hosts(session, lister, **filters):
     """List hosts."""
     return utils.list_db_objects(
-        session, models.Host, **filters
+        session, models.Host, load_profile=LOAD_PROFILE, **filters
     )
 
 
 @utils.supported_filters(
-    optional_support_keys=SUPPORTED_MACHINE_HOST_FIELDS)
+    optional_support_keys=(
+        SUPPORTED_MACHINE_HOST_FIELDS + utils.LIST_OPTION_FIELDS
+    )
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_HOSTS
@@ -130,8 +171,11 @@ def list_hosts(session, lister, **filters):
 @utils.wrap_to_dict(RESP_FIELDS)
 def list_machines_or_hosts(session, lister, **filters):
     """List hosts."""
+    conditions = machine_api.pop_attributes_conditions(filters)
     machines = utils.list_db_objects(
-        session, models.Machine, **filters
+        session, models.Machine,
+        load_profile=MACHINE_HOST_LOAD_PROFILE,
+        conditions=conditions, **filters
     )
     machines_or_hosts = []
     for machine in machines:
@@ -140,7 +184,7 @@ def list_machines_or_hosts(session, lister, **filters):
             machines_or_hosts.append(host)
         else:
             machines_or_hosts.append(machine)
-    return machines_or_hosts
+    return utils.copy_page(machines, machines_or_hosts)
 
 
 @utils.supported_filters([])
@@ -156,7 +200,7 @@ def get_host(
     """get host info."""
     return utils.get_db_object(
         session, models.Host,
-        exception_when_missing, id=host_id
+        exception_when_missing, load_profile=LOAD_PROFILE, id=host_id
     )
 
 
@@ -173,7 +217,8 @@ def get_machine_or_host(
     """get host info."""
     machine = utils.get_db_object(
         session, models.Machine,
-        exception_when_missing, id=host_id
+        exception_when_missing, load_profile=MACHINE_HOST_LOAD_PROFILE,
+        id=host_id
     )
     if not machine:
         return None
@@ -566,22 +611,55 @@ def get_hostnetwork(session, getter, host_network_id, **kwargs):
     )
 
 
+def _check_host_network_ip(ip):
+    if ip != AUTO_IP:
+        utils.check_ip(ip)
+
+
+def _allocate_host_network_ip(session, host_id, interface, subnet_id):
+    """Allocate ip of host network from its subnet.
+
+    The ip of the existing host network in the subnet is kept.
+    """
+    subnet = network_api.lock_subnet_internal(session, subnet_id)
+    host_network = utils.get_db_object(
+        session, models.HostNetwork, False,
+        host_id=host_id, interface=interface
+    )
+    if host_network and host_network.subnet_id == subnet.id:
+        return host_network.ip
+    ip_ints = network_api.allocate_ips_internal(session, subnet, 1)
+    if not ip_ints:
+        raise exception.InvalidParameter(
+            'no free ip in subnet %s' % subnet.subnet
+        )
+    return str(netaddr.IPAddress(ip_ints[0]))
+
+
 @utils.supported_filters(
     ADDED_NETWORK_FIELDS,
     optional_support_keys=OPTIONAL_ADDED_NETWORK_FIELDS,
     ignore_support_keys=IGNORE_FIELDS
 )
 @utils.input_validates(
-    ip=utils.check_ip
+    ip=_check_host_network_ip
 )
 @utils.wrap_to_dict(RESP_NETWORK_FIELDS)
 def _add_host_network(
     session, creator, host_id, exception_when_existing=True,
     interface=None, ip=None, **kwargs
 ):
+    if ip == AUTO_IP:
+        # lock the subnet before reading the host networks.
+        network_api.lock_subnet_internal(session, kwargs['subnet_id'])
     host = utils.get_db_object(
         session, models.Host, id=host_id
     )
+    if ip == AUTO_IP:
+        is_host_editable(session, host, creator)
+        ip = _allocate_host_network_ip(
+            session, host_id, interface, kwargs['subnet_id']
+        )
     ip_int = long(netaddr.IPAddress(ip))
     host_network = utils.get_db_object(
         session, models.HostNetwork, False,
@@ -660,6 +738,141 @@ def add_host_networks(
     }
 
 
+def _get_failed_host_network(network, error):
+    if isinstance(network, dict):
+        failed_host_network = dict(network)
+    else:
+        failed_host_network = {}
+    failed_host_network['message'] = str(error)
+    return failed_host_network
+
+
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_ADD_HOST_NETWORK
+)
+@utils.wrap_to_dict(
+    RESP_ALLOCATED_NETWORKS_FIELDS,
+    host_networks=RESP_ALLOCATED_NETWORK_FIELDS
+)
+def allocate_host_networks(session, creator, subnet_id, data=[]):
+    """Create host networks with ips allocated from subnet.
+
+    data is a list of dict of host_id, interface and optional
+    is_mgmt and is_promiscuous. Each item is checked against the host
+    network constraints first, ips are then allocated in one batch for
+    the valid items, the others are returned in failed_host_networks.
+    """
+    subnet = network_api.lock_subnet_internal(session, subnet_id)
+    allocated_networks = []
+    failed_host_networks = []
+    interfaces = set([])
+    mgmt_host_ids = set([])
+    columns = models.HostNetwork.__table__.columns
+    for network in data:
+        try:
+            if not isinstance(network, dict):
+                raise exception.InvalidParameter(
+                    'host network %s is not dict' % network
+                )
+            missing_keys = [
+                key for key in ALLOCATED_NETWORK_FIELDS
+                if key not in network
+            ]
+            if missing_keys:
+                raise exception.InvalidParameter(
+                    'missing keys %s in host network %s' % (
+                        missing_keys, network
+                    )
+                )
+            unsupported_keys = [
+                key for key in network
+                if key not in (
+                    ALLOCATED_NETWORK_FIELDS + OPTIONAL_ADDED_NETWORK_FIELDS
+                )
+            ]
+            if unsupported_keys:
+                raise exception.InvalidParameter(
+                    'unsupported keys %s in host network %s' % (
+                        unsupported_keys, network
+                    )
+                )
+            host_id = network['host_id']
+            interface = network['interface']
+            if (host_id, interface) in interfaces:
+                raise exception.InvalidParameter(
+                    'host %s interface %s is allocated more than once' % (
+                        host_id, interface
+                    )
+                )
+            host = utils.get_db_object(
+                session, models.Host, False, id=host_id
+            )
+            if not host:
+                raise exception.RecordNotExists(
+                    'host %s does not exist' % host_id
+                )
+            is_host_editable(session, host, creator)
+            if utils.get_db_object(
+                session, models.HostNetwork, False,
+                host_id=host_id, interface=interface
+            ):
+                raise exception.DuplicatedRecord(
+                    'host %s interface %s exists' % (host_id, interface)
+                )
+            for key in ['interface'] + OPTIONAL_ADDED_NETWORK_FIELDS:
+                if key in network and not models.HostNetwork.type_compatible(
+                    network[key], columns[key].type
+                ):
+                    raise exception.InvalidParameter(
+                        'host network %s value %r type is unexpected: %s' % (
+                            key, network[key], columns[key].type
+                        )
+                    )
+            if network.get('is_mgmt'):
+                if network.get('is_promiscuous'):
+                    raise exception.InvalidParameter(
+                        'host %s interface %s is mgmt but promiscuous' % (
+                            host.name, interface
+                        )
+                    )
+                if host_id in mgmt_host_ids or any(
+                    host_network.is_mgmt
+                    for host_network in host.host_networks
+                ):
+                    raise exception.InvalidParameter(
+                        'host %s multi interfaces set mgmt ' % host.name
+                    )
+                mgmt_host_ids.add(host_id)
+            interfaces.add((host_id, interface))
+            allocated_networks.append(network)
+        except exception.DatabaseException as error:
+            logging.exception(error)
+            failed_host_networks.append(
+                _get_failed_host_network(network, error)
+            )
+    ip_ints = network_api.allocate_ips_internal(
+        session, subnet, len(allocated_networks)
+    )
+    for network in allocated_networks[len(ip_ints):]:
+        failed_host_networks.append(_get_failed_host_network(
+            network, exception.InvalidParameter(
+                'no free ip in subnet %s' % subnet.subnet
+            )
+        ))
+    host_networks = utils.add_db_objects(session, models.HostNetwork, [
+        dict(
+            network, subnet_id=subnet.id,
+            ip=str(netaddr.IPAddress(ip_int))
+        )
+        for network, ip_int in zip(allocated_networks, ip_ints)
+    ])
+    return {
+        'host_networks': host_networks,
+        'failed_host_networks': failed_host_networks
+    }
+
+
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_ADD_HOST_NETWORK
 )
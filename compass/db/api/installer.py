@@ -26,27 +26,39 @@ from compass.utils import util
 
 
 def _add_installers(session, model, configs, exception_when_existing=True):
-    installers = []
-    for config in configs:
-        installers.append(utils.add_db_object(
-            session, model,
-            exception_when_existing, config['INSTANCE_NAME'],
-            name=config['NAME'],
-            settings=config.get('SETTINGS', {})
-        ))
-    return installers
-
-
-def add_os_installers_internal(session, exception_when_existing=True):
-    configs = util.load_configs(setting.OS_INSTALLER_DIR)
+    if exception_when_existing:
+        on_conflict = 'error'
+    else:
+        on_conflict = 'update'
+    return utils.add_db_objects(
+        session, model, [
+            {
+                'alias': config['INSTANCE_NAME'],
+                'name': config['NAME'],
+                'settings': config.get('SETTINGS', {})
+            }
+            for config in configs
+        ],
+        on_conflict=on_conflict
+    )
+
+
+def add_os_installers_internal(
+    session, exception_when_existing=True, configs=None
+):
+    if configs is None:
+        configs = util.load_configs(setting.OS_INSTALLER_DIR)
     return _add_installers(
         session, models.OSInstaller, configs,
         exception_when_existing=exception_when_existing
     )
 
 
-def add_package_installers_internal(session, exception_when_existing=True):
-    configs = util.load_configs(setting.PACKAGE_INSTALLER_DIR)
+def add_package_installers_internal(
+    session, exception_when_existing=True, configs=None
+):
+    if configs is None:
+        configs = util.load_configs(setting.PACKAGE_INSTALLER_DIR)
     return _add_installers(
         session, models.PackageInstaller, configs,
         exception_when_existing=exception_when_existing
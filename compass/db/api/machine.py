@@ -15,6 +15,9 @@
 """Switch database operations."""
 import logging
 
+from sqlalchemy import and_
+from sqlalchemy import or_
+
 from compass.db.api import database
 from compass.db.api import permission
 from compass.db.api import user as user_api
@@ -43,6 +46,87 @@ RESP_DEPLOY_FIELDS = [
 ]
 
 
+def _attribute_values(value):
+    """Get the values which may be stored equal to value in python."""
+    if (
+        isinstance(value, (int, long, float)) and
+        float(value).is_integer()
+    ):
+        values = [int(value), float(value)]
+        if value in [0, 1]:
+            values.append(bool(value))
+        return values
+    return [value]
+
+
+def _attribute_condition(namespace, key, value):
+    encoded_values = set([
+        models.MachineAttribute.encode(key, item)
+        for item in _attribute_values(value)
+    ])
+    if None in encoded_values:
+        return None
+    return models.Machine.attributes.any(and_(
+        models.MachineAttribute.namespace == namespace,
+        models.MachineAttribute.key == key,
+        models.MachineAttribute.value.in_(list(encoded_values))
+    ))
+
+
+def _attributes_condition(namespace, attributes):
+    if not isinstance(attributes, dict):
+        return None
+    conditions = []
+    for key, value in attributes.items():
+        condition = _attribute_condition(namespace, key, value)
+        if condition is not None:
+            conditions.append(condition)
+    if not conditions:
+        return None
+    return and_(*conditions)
+
+
+def pop_attributes_conditions(filters):
+    """Translate tag and location filters to machine attribute conditions.
+
+    The translated filters are popped from filters. The machines
+    matching the conditions should still be checked by
+    general_filter_callback since only the indexed items are compared.
+    """
+    conditions = []
+    for namespace in models.MachineAttribute.NAMESPACES:
+        attributes_filter = filters.get(namespace)
+        if not isinstance(attributes_filter, dict):
+            continue
+        if 'resp_eq' in attributes_filter:
+            condition = _attributes_condition(
+                namespace, attributes_filter['resp_eq']
+            )
+        elif attributes_filter.get('resp_in'):
+            in_conditions = [
+                _attributes_condition(namespace, attributes)
+                for attributes in attributes_filter['resp_in']
+            ]
+            if any(
+                in_condition is None for in_condition in in_conditions
+            ):
+                condition = None
+            else:
+                condition = or_(*in_conditions)
+        else:
+            condition = None
+        if condition is not None:
+            conditions.append(condition)
+            del filters[namespace]
+    return conditions
+
+
+@database.run_in_session()
+def sync_machine_attributes(session):
+    """Index tag and location of all machines in machine attributes."""
+    return len(utils.update_db_objects(session, models.Machine))
+
+
 @utils.supported_filters([])
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
@@ -62,7 +146,7 @@ def get_machine(
 
 
 @utils.supported_filters(
-    optional_support_keys=SUPPORTED_FIELDS
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
 )
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
@@ -75,8 +159,9 @@ def get_machine(
 @utils.wrap_to_dict(RESP_FIELDS)
 def list_machines(session, lister, **filters):
     """List machines."""
+    conditions = pop_attributes_conditions(filters)
     return utils.list_db_objects(
-        session, models.Machine, **filters
+        session, models.Machine, conditions=conditions, **filters
     )
 
 
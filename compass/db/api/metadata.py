@@ -30,63 +30,71 @@ from compass.utils import util
 
 
 def _add_field_internal(session, model, configs):
-    fields = []
+    rows = []
     for config in configs:
         if not isinstance(config, dict):
             raise exception.InvalidParameter(
                 'config %s is not dict' % config
             )
-        fields.append(utils.add_db_object(
-            session, model, False,
-            config['NAME'],
-            field_type=config.get('FIELD_TYPE', basestring),
-            display_type=config.get('DISPLAY_TYPE', 'text'),
-            validator=config.get('VALIDATOR', None),
-            js_validator=config.get('JS_VALIDATOR', None),
-            description=config.get('DESCRIPTION', None)
-        ))
-    return fields
-
-
-def add_os_field_internal(session):
+        rows.append({
+            'field': config['NAME'],
+            'field_type': config.get('FIELD_TYPE', basestring),
+            'display_type': config.get('DISPLAY_TYPE', 'text'),
+            'validator': config.get('VALIDATOR', None),
+            'js_validator': config.get('JS_VALIDATOR', None),
+            'description': config.get('DESCRIPTION', None)
+        })
+    return utils.add_db_objects(
+        session, model, rows, on_conflict='update'
+    )
+
+
+def load_configs(config_dir):
+    """Load field or metadata configs with validators and callbacks."""
     env_locals = {}
     env_locals.update(metadata_validator.VALIDATOR_LOCALS)
     env_locals.update(metadata_callback.CALLBACK_LOCALS)
-    configs = util.load_configs(
-        setting.OS_FIELD_DIR,
+    return util.load_configs(
+        config_dir,
         env_locals=env_locals
     )
+
+
+def add_os_field_internal(session, configs=None):
+    if configs is None:
+        configs = load_configs(setting.OS_FIELD_DIR)
     return _add_field_internal(
         session, models.OSConfigField, configs
     )
 
 
-def add_package_field_internal(session):
-    env_locals = {}
-    env_locals.update(metadata_validator.VALIDATOR_LOCALS)
-    env_locals.update(metadata_callback.CALLBACK_LOCALS)
-    configs = util.load_configs(
-        setting.PACKAGE_FIELD_DIR,
-        env_locals=env_locals
-    )
+def add_package_field_internal(session, configs=None):
+    if configs is None:
+        configs = load_configs(setting.PACKAGE_FIELD_DIR)
     return _add_field_internal(
         session, models.PackageConfigField, configs
     )
 
 
-def _add_metadata(
-    session, field_model, metadata_model, id, path, name, config,
-    exception_when_existing=True, parent=None, **kwargs
+def _get_metadata_row(
+    fields, field_model, id_name, id, path, name, config,
+    parent=None, **kwargs
 ):
+    """Get the row to add metadata of config."""
     if not isinstance(config, dict):
         raise exception.InvalidParameter(
             '%s config %s is not dict' % (path, config)
         )
     metadata_self = config.get('_self', {})
     if 'field' in metadata_self:
-        field = utils.get_db_object(
-            session, field_model, field=metadata_self['field']
-        )
+        if metadata_self['field'] not in fields:
+            raise exception.RecordNotExists(
+                'Cannot find the record in table %s: %s' % (
+                    field_model.__name__,
+                    {'field': metadata_self['field']}
+                )
+            )
+        field = fields[metadata_self['field']]
     else:
         field = None
     mapping_to_template = metadata_self.get('mapping_to', None)
@@ -98,35 +106,42 @@ def _add_metadata(
         )
     else:
         mapping_to = None
-    metadata = utils.add_db_object(
-        session, metadata_model, exception_when_existing,
-        id, path, name=name, parent=parent, field=field,
-        display_name=metadata_self.get('display_name', name),
-        description=metadata_self.get('description', None),
-        is_required=metadata_self.get('is_required', False),
-        required_in_whole_config=metadata_self.get(
+    row = {
+        id_name: id, 'path': path, 'name': name, 'parent': parent,
+        'field': field,
+        'display_name': metadata_self.get('display_name', name),
+        'description': metadata_self.get('description', None),
+        'is_required': metadata_self.get('is_required', False),
+        'required_in_whole_config': metadata_self.get(
             'required_in_whole_config', False),
-        mapping_to=mapping_to,
-        validator=metadata_self.get('validator', None),
-        js_validator=metadata_self.get('js_validator', None),
-        default_value=metadata_self.get('default_value', None),
-        default_callback=metadata_self.get('default_callback', None),
-        default_callback_params=metadata_self.get(
+        'mapping_to': mapping_to,
+        'validator': metadata_self.get('validator', None),
+        'js_validator': metadata_self.get('js_validator', None),
+        'default_value': metadata_self.get('default_value', None),
+        'default_callback': metadata_self.get('default_callback', None),
+        'default_callback_params': metadata_self.get(
             'default_callback_params', {}),
-        options=metadata_self.get('options', None),
-        options_callback=metadata_self.get('options_callback', None),
-        options_callback_params=metadata_self.get(
+        'options': metadata_self.get('options', None),
+        'options_callback': metadata_self.get('options_callback', None),
+        'options_callback_params': metadata_self.get(
             'options_callback_params', {}),
-        autofill_callback=metadata_self.get(
+        'autofill_callback': metadata_self.get(
             'autofill_callback', None),
-        autofill_callback_params=metadata_self.get(
+        'autofill_callback_params': metadata_self.get(
             'autofill_callback_params', {}),
-        required_in_options=metadata_self.get(
-            'required_in_options', False),
-        **kwargs
-    )
+        'required_in_options': metadata_self.get(
+            'required_in_options', False)
+    }
+    row.update(kwargs)
+    return row
+
+
+def _get_sub_metadata_nodes(id, path, config, metadata, **kwargs):
+    """Get the nodes to add sub metadatas of config."""
+    metadata_self = config.get('_self', {})
     key_extensions = metadata_self.get('key_extensions', {})
     general_keys = []
+    nodes = []
     for key, value in config.items():
         if key.startswith('_'):
             continue
@@ -147,76 +162,108 @@ def _add_metadata(
                     )
                 sub_kwargs = dict(kwargs)
                 sub_kwargs[key[1:]] = extended_key
-                _add_metadata(
-                    session, field_model, metadata_model,
-                    id, '%s/%s' % (path, extended_key), extended_key, value,
-                    exception_when_existing=exception_when_existing,
-                    parent=metadata, **sub_kwargs
-                )
+                nodes.append((
+                    id, '%s/%s' % (path, extended_key), extended_key,
+                    value, metadata, sub_kwargs
+                ))
         else:
             if key.startswith('$'):
                 general_keys.append(key)
-            _add_metadata(
-                session, field_model, metadata_model,
-                id, '%s/%s' % (path, key), key, value,
-                exception_when_existing=exception_when_existing,
-                parent=metadata, **kwargs
-            )
+            nodes.append((
+                id, '%s/%s' % (path, key), key, value, metadata, kwargs
+            ))
         if len(general_keys) > 1:
             raise exception.InvalidParameter(
                 'foud multi general keys in %s: %s' % (
                     path, general_keys
                 )
             )
-    return metadata
+    return nodes
 
 
-def add_os_metadata_internal(session, exception_when_existing=True):
-    os_metadatas = []
-    env_locals = {}
-    env_locals.update(metadata_validator.VALIDATOR_LOCALS)
-    env_locals.update(metadata_callback.CALLBACK_LOCALS)
-    configs = util.load_configs(
-        setting.OS_METADATA_DIR,
-        env_locals=env_locals
+def _add_metadatas(
+    session, field_model, metadata_model, id_name, nodes,
+    exception_when_existing=True
+):
+    """Add metadatas of nodes and their sub metadatas.
+
+    Each node is a tuple of id, path, name, config, parent metadata
+    and kwargs. Metadatas in the same level of the metadata trees
+    are added in one bulk insert.
+    Returns the metadatas of nodes.
+    """
+    fields = dict(
+        (field.field, field)
+        for field in utils.list_db_objects(session, field_model)
     )
+    if exception_when_existing:
+        on_conflict = 'error'
+    else:
+        on_conflict = 'update'
+    top_metadatas = None
+    while nodes:
+        metadatas = utils.add_db_objects(
+            session, metadata_model, [
+                _get_metadata_row(
+                    fields, field_model, id_name, id, path, name, config,
+                    parent=parent, **kwargs
+                )
+                for id, path, name, config, parent, kwargs in nodes
+            ],
+            on_conflict=on_conflict
+        )
+        if top_metadatas is None:
+            top_metadatas = metadatas
+        sub_nodes = []
+        for (id, path, _, config, _, kwargs), metadata in zip(
+            nodes, metadatas
+        ):
+            sub_nodes.extend(_get_sub_metadata_nodes(
+                id, path, config, metadata, **kwargs
+            ))
+        nodes = sub_nodes
+    return top_metadatas or []
+
+
+def add_os_metadata_internal(
+    session, exception_when_existing=True, configs=None
+):
+    os_metadatas = []
+    if configs is None:
+        configs = load_configs(setting.OS_METADATA_DIR)
     for config in configs:
         os = utils.get_db_object(
             session, models.OperatingSystem, name=config['OS']
         )
         for key, value in config['METADATA'].items():
-            os_metadatas.append(_add_metadata(
-                session, models.OSConfigField,
-                models.OSConfigMetadata,
-                os.id, key, key, value,
-                exception_when_existing=exception_when_existing,
-                parent=None
-            ))
-    return os_metadatas
+            os_metadatas.append((os.id, key, key, value, None, {}))
+    return _add_metadatas(
+        session, models.OSConfigField, models.OSConfigMetadata,
+        'os_id', os_metadatas,
+        exception_when_existing=exception_when_existing
+    )
 
 
-def add_package_metadata_internal(session, exception_when_existing=True):
+def add_package_metadata_internal(
+    session, exception_when_existing=True, configs=None
+):
     package_metadatas = []
-    env_locals = {}
-    env_locals.update(metadata_validator.VALIDATOR_LOCALS)
-    env_locals.update(metadata_callback.CALLBACK_LOCALS)
-    configs = util.load_configs(
-        setting.PACKAGE_METADATA_DIR,
-        env_locals=env_locals
-    )
+    if configs is None:
+        configs = load_configs(setting.PACKAGE_METADATA_DIR)
     for config in configs:
         adapter = utils.get_db_object(
             session, models.Adapter, name=config['ADAPTER']
         )
         for key, value in config['METADATA'].items():
-            package_metadatas.append(_add_metadata(
-                session, models.PackageConfigField,
-                models.PackageConfigMetadata,
-                adapter.id, key, key, value,
-                exception_when_existing=exception_when_existing,
-                parent=None
-            ))
-    return package_metadatas
+            package_metadatas.append(
+                (adapter.id, key, key, value, None, {})
+            )
+    return _add_metadatas(
+        session, models.PackageConfigField,
+        models.PackageConfigMetadata,
+        'adapter_id', package_metadatas,
+        exception_when_existing=exception_when_existing
+    )
 
 
 def _filter_metadata(metadata, **kwargs):
@@ -296,124 +343,137 @@ def get_os_metadatas_internal(session):
     return metadata_mapping
 
 
-def _validate_self(
-    config_path, config_key, config,
-    metadata, whole_check,
-    **kwargs
-):
-    logging.debug('validate config self %s', config_path)
-    if '_self' not in metadata:
-        if isinstance(config, dict):
-            _validate_config(
-                config_path, config, metadata, whole_check, **kwargs
+def _get_options_set(options):
+    """Get options as frozenset, or tuple if they are not hashable."""
+    try:
+        return frozenset(options)
+    except TypeError:
+        return tuple(options)
+
+
+class ConfigValidator(object):
+    """Validator of config compiled from a metadata tree.
+
+    Each node keeps the checks of its _self metadata, the validators
+    of its specified children, the validators of its general ($)
+    children and the sets of required children keys, so validation
+    is a walk of the config along the compiled tree.
+    """
+
+    def __init__(self, metadata):
+        self_metadata = metadata.get('_self', None)
+        self.has_self = self_metadata is not None
+        if self.has_self:
+            self.field_type = self_metadata.get('field_type', basestring)
+            self.is_required = self_metadata.get('is_required', False)
+            self.required_in_whole_config = self_metadata.get(
+                'required_in_whole_config', False
             )
-        return
-    field_type = metadata['_self'].get('field_type', basestring)
-    if not isinstance(config, field_type):
-        raise exception.InvalidParameter(
-            '%s config type is not %s' % (config_path, field_type)
-        )
-    is_required = metadata['_self'].get(
-        'is_required', False
-    )
-    required_in_whole_config = metadata['_self'].get(
-        'required_in_whole_config', False
-    )
-    if isinstance(config, basestring):
-        if config == '' and not is_required and not required_in_whole_config:
-            # ignore empty config when it is optional
-            return
-    required_in_options = metadata['_self'].get(
-        'required_in_options', False
-    )
-    options = metadata['_self'].get('options', None)
-    if required_in_options:
-        if field_type in [int, basestring, float, bool]:
-            if options and config not in options:
-                raise exception.InvalidParameter(
-                    '%s config is not in %s' % (config_path, options)
-                )
-        elif field_type in [list, tuple]:
-            if options and not set(config).issubset(set(options)):
-                raise exception.InvalidParameter(
-                    '%s config is not in %s' % (config_path, options)
+            self.options = None
+            options = self_metadata.get('options', None)
+            if self_metadata.get('required_in_options', False) and options:
+                self.options = _get_options_set(options)
+            self.validator = self_metadata.get('validator', None)
+        self.specified = {}
+        self.generals = []
+        for key, value in metadata.items():
+            if key.startswith('$'):
+                self.generals.append(ConfigValidator(value))
+            elif not key.startswith('_'):
+                self.specified[key] = ConfigValidator(value)
+        self.required_keys = frozenset([
+            key for key, child in self.specified.items()
+            if child.has_self and child.is_required
+        ])
+        self.whole_required_keys = frozenset([
+            key for key, child in self.specified.items()
+            if child.has_self and child.required_in_whole_config
+        ])
+
+    def validate(self, config, whole_check, **kwargs):
+        """Validate config against the metadata tree."""
+        logging.debug('validate config %s', config)
+        self._validate_children('', config, whole_check, kwargs)
+
+    def _validate_self(self, config_path, config_key, config,
+                       whole_check, kwargs):
+        if not self.has_self:
+            if isinstance(config, dict):
+                self._validate_children(
+                    config_path, config, whole_check, kwargs
                 )
-        elif field_type == dict:
-            if options and not set(config.keys()).issubset(set(options)):
+            return
+        if not isinstance(config, self.field_type):
+            raise exception.InvalidParameter(
+                '%s config type is not %s' % (config_path, self.field_type)
+            )
+        if isinstance(config, basestring):
+            if (
+                config == '' and not self.is_required and
+                not self.required_in_whole_config
+            ):
+                # ignore empty config when it is optional
+                return
+        if self.options:
+            if self.field_type in [int, basestring, float, bool]:
+                if config not in self.options:
+                    raise exception.InvalidParameter(
+                        '%s config is not in %s' % (
+                            config_path, list(self.options)
+                        )
+                    )
+            elif self.field_type in [list, tuple, dict]:
+                for item in config:
+                    if item not in self.options:
+                        raise exception.InvalidParameter(
+                            '%s config is not in %s' % (
+                                config_path, list(self.options)
+                            )
+                        )
+        if self.validator:
+            if not self.validator(config_key, config, **kwargs):
                 raise exception.InvalidParameter(
-                    '%s config is not in %s' % (config_path, options)
+                    '%s config is invalid' % config_path
                 )
-    validator = metadata['_self'].get('validator', None)
-    logging.debug('validate by validator %s', validator)
-    if validator:
-        if not validator(config_key, config, **kwargs):
-            raise exception.InvalidParameter(
-                '%s config is invalid' % config_path
+        if isinstance(config, dict):
+            self._validate_children(
+                config_path, config, whole_check, kwargs
             )
-    if isinstance(config, dict):
-        _validate_config(
-            config_path, config, metadata, whole_check, **kwargs
-        )
-
 
-def _validate_config(
-    config_path, config, metadata, whole_check,
-    **kwargs
-):
-    logging.debug('validate config %s', config_path)
-    generals = {}
-    specified = {}
-    for key, value in metadata.items():
-        if key.startswith('$'):
-            generals[key] = value
-        elif key.startswith('_'):
-            pass
-        else:
-            specified[key] = value
-    config_keys = set(config.keys())
-    specified_keys = set(specified.keys())
-    intersect_keys = config_keys & specified_keys
-    not_found_keys = config_keys - specified_keys
-    redundant_keys = specified_keys - config_keys
-    for key in redundant_keys:
-        if '_self' not in specified[key]:
-            continue
-        if specified[key]['_self'].get('is_required', False):
-            raise exception.InvalidParameter(
-                '%s/%s does not find but it is required' % (
-                    config_path, key
+    def _validate_children(self, config_path, config, whole_check, kwargs):
+        for key in self.required_keys:
+            if key not in config:
+                raise exception.InvalidParameter(
+                    '%s/%s does not find but it is required' % (
+                        config_path, key
+                    )
                 )
-            )
-        if (
-            whole_check and
-            specified[key]['_self'].get(
-                'required_in_whole_config', False
-            )
-        ):
-            raise exception.InvalidParameter(
-                '%s/%s does not find but it is required in whole config' % (
-                    config_path, key
+        if whole_check:
+            for key in self.whole_required_keys:
+                if key not in config:
+                    raise exception.InvalidParameter(
+                        '%s/%s does not find '
+                        'but it is required in whole config' % (
+                            config_path, key
+                        )
+                    )
+        for key, value in config.iteritems():
+            child_path = '%s/%s' % (config_path, key)
+            if key in self.specified:
+                self.specified[key]._validate_self(
+                    child_path, key, value, whole_check, kwargs
                 )
-            )
-    for key in intersect_keys:
-        _validate_self(
-            '%s/%s' % (config_path, key),
-            key, config[key], specified[key], whole_check,
-            **kwargs
-        )
-    for key in not_found_keys:
-        if not generals:
-            raise exception.InvalidParameter(
-                'key %s missing in metadata %s' % (
-                    key, config_path
+                continue
+            if not self.generals:
+                raise exception.InvalidParameter(
+                    'key %s missing in metadata %s' % (
+                        key, config_path
+                    )
+                )
+            for general in self.generals:
+                general._validate_self(
+                    child_path, key, value, whole_check, kwargs
                 )
-            )
-        for general_key, general_value in generals.items():
-            _validate_self(
-                '%s/%s' % (config_path, key),
-                key, config[key], general_value, whole_check,
-                **kwargs
-            )
 
 
 def _autofill_self_config(
@@ -509,7 +569,12 @@ def _autofill_config(
 def validate_config_internal(
     config, metadata, whole_check, **kwargs
 ):
-    _validate_config('', config, metadata, whole_check, **kwargs)
+    """Validate config against metadata.
+
+    Callers validating many configs against the same metadata should
+    keep a ConfigValidator of the metadata instead.
+    """
+    ConfigValidator(metadata).validate(config, whole_check, **kwargs)
 
 
 def autofill_config_internal(
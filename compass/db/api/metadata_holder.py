@@ -18,6 +18,7 @@ import logging
 from compass.db.api import database
 from compass.db.api import metadata as metadata_api
 from compass.db.api import permission
+from compass.db.api import snapshot
 from compass.db.api import user as user_api
 from compass.db.api import utils
 from compass.db import exception
@@ -35,58 +36,84 @@ def load_metadatas(session):
 
 
 def load_os_metadatas_internal(session):
-    global OS_METADATA_MAPPING
     logging.info('load os metadatas into memory')
-    OS_METADATA_MAPPING = metadata_api.get_os_metadatas_internal(session)
+    OS_METADATA_SNAPSHOT.load(session)
 
 
 def load_package_metadatas_internal(session):
-    global PACKAGE_METADATA_MAPPING
     logging.info('load package metadatas into memory')
-    PACKAGE_METADATA_MAPPING = (
-        metadata_api.get_package_metadatas_internal(session)
-    )
+    PACKAGE_METADATA_SNAPSHOT.load(session)
+
+
+OS_METADATA_SNAPSHOT = snapshot.Snapshot(
+    'os_metadata', metadata_api.get_os_metadatas_internal
+)
+PACKAGE_METADATA_SNAPSHOT = snapshot.Snapshot(
+    'package_metadata', metadata_api.get_package_metadatas_internal
+)
 
 
-OS_METADATA_MAPPING = {}
-PACKAGE_METADATA_MAPPING = {}
+# compiled config validators: (snapshot name, id) to
+# (snapshot generation, validator).
+CONFIG_VALIDATORS = {}
 
 
 def _validate_config(
-    config, id, id_name, metadata_mapping, whole_check, **kwargs
+    session, config, id, id_name, metadata_snapshot, whole_check, **kwargs
 ):
+    metadata_mapping = metadata_snapshot.get(session)
     if id not in metadata_mapping:
         raise exception.InvalidParameter(
             '%s id %s is not found in metadata mapping' % (id_name, id)
         )
-    metadatas = metadata_mapping[id]
-    metadata_api.validate_config_internal(
-        config, metadatas, whole_check, **kwargs
-    )
+    key = (metadata_snapshot.name, id)
+    generation, validator = CONFIG_VALIDATORS.get(key, (None, None))
+    if generation != metadata_snapshot.generation:
+        validator = metadata_api.ConfigValidator(metadata_mapping[id])
+        CONFIG_VALIDATORS[key] = (metadata_snapshot.generation, validator)
+    validator.validate(config, whole_check, session=session, **kwargs)
 
 
 def validate_os_config(
     session, config, os_id, whole_check=False, **kwargs
 ):
-    if not OS_METADATA_MAPPING:
-        load_os_metadatas_internal(session)
     _validate_config(
-        config, os_id, 'os', OS_METADATA_MAPPING,
-        whole_check, session=session, **kwargs
+        session, config, os_id, 'os', OS_METADATA_SNAPSHOT,
+        whole_check, **kwargs
     )
 
 
 def validate_package_config(
     session, config, adapter_id, whole_check=False, **kwargs
 ):
-    if not PACKAGE_METADATA_MAPPING:
-        load_package_metadatas_internal(session)
     _validate_config(
-        config, adapter_id, 'adapter', PACKAGE_METADATA_MAPPING,
-        whole_check, session=session, **kwargs
+        session, config, adapter_id, 'adapter', PACKAGE_METADATA_SNAPSHOT,
+        whole_check, **kwargs
     )
 
 
+def get_metadatas_version_internal(session):
+    """Get version of os and package metadatas held in memory.
+
+    The version changes whenever the metadatas are reloaded.
+    """
+    OS_METADATA_SNAPSHOT.get(session)
+    PACKAGE_METADATA_SNAPSHOT.get(session)
+    return '%s.%s' % (
+        OS_METADATA_SNAPSHOT.generation,
+        PACKAGE_METADATA_SNAPSHOT.generation
+    )
+
+
+@database.run_in_session()
+@user_api.check_user_permission_in_session(
+    permission.PERMISSION_LIST_METADATAS
+)
+def get_metadatas_version(session, getter):
+    """Get version of metadatas."""
+    return get_metadatas_version_internal(session)
+
+
 def _filter_metadata(metadata, **kwargs):
     if not isinstance(metadata, dict):
         return metadata
@@ -116,14 +143,13 @@ def _filter_metadata(metadata, **kwargs):
 
 def get_package_metadata_internal(session, adapter_id):
     """get package metadata internal."""
-    if not PACKAGE_METADATA_MAPPING:
-        load_package_metadatas_internal(session)
-    if adapter_id not in PACKAGE_METADATA_MAPPING:
+    package_metadata_mapping = PACKAGE_METADATA_SNAPSHOT.get(session)
+    if adapter_id not in package_metadata_mapping:
         raise exception.RecordNotExists(
             'adpater %s does not exist' % adapter_id
         )
     return _filter_metadata(
-        PACKAGE_METADATA_MAPPING[adapter_id], session=session
+        package_metadata_mapping[adapter_id], session=session
     )
 
 
@@ -141,14 +167,13 @@ def get_package_metadata(session, getter, adapter_id, **kwargs):
 
 def get_os_metadata_internal(session, os_id):
     """get os metadata internal."""
-    if not OS_METADATA_MAPPING:
-        load_os_metadatas_internal(session)
-    if os_id not in OS_METADATA_MAPPING:
+    os_metadata_mapping = OS_METADATA_SNAPSHOT.get(session)
+    if os_id not in os_metadata_mapping:
         raise exception.RecordNotExists(
             'os %s does not exist' % os_id
         )
     return _filter_metadata(
-        OS_METADATA_MAPPING[os_id], session=session
+        os_metadata_mapping[os_id], session=session
     )
 
 
@@ -209,19 +234,17 @@ def _autofill_config(
 def autofill_os_config(
     session, config, os_id, **kwargs
 ):
-    if not OS_METADATA_MAPPING:
-        load_os_metadatas_internal(session)
+    os_metadata_mapping = OS_METADATA_SNAPSHOT.get(session)
     return _autofill_config(
-        config, os_id, 'os', OS_METADATA_MAPPING, session=session, **kwargs
+        config, os_id, 'os', os_metadata_mapping, session=session, **kwargs
     )
 
 
 def autofill_package_config(
     session, config, adapter_id, **kwargs
 ):
-    if not PACKAGE_METADATA_MAPPING:
-        load_package_metadatas_internal(session)
+    package_metadata_mapping = PACKAGE_METADATA_SNAPSHOT.get(session)
     return _autofill_config(
-        config, adapter_id, 'adapter', PACKAGE_METADATA_MAPPING,
+        config, adapter_id, 'adapter', package_metadata_mapping,
         session=session, **kwargs
     )
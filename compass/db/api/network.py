@@ -26,14 +26,25 @@ from compass.db import models
 
 SUPPORTED_FIELDS = ['subnet', 'name']
 RESP_FIELDS = [
-    'id', 'name', 'subnet', 'created_at', 'updated_at'
+    'id', 'name', 'subnet', 'gateway', 'ip_ranges', 'excluded_ip_ranges',
+    'created_at', 'updated_at'
 ]
 ADDED_FIELDS = ['subnet']
-OPTIONAL_ADDED_FIELDS = ['name']
+OPTIONAL_ADDED_FIELDS = [
+    'name', 'gateway', 'ip_ranges', 'excluded_ip_ranges'
+]
 IGNORE_FIELDS = [
     'id', 'created_at', 'updated_at'
 ]
-UPDATED_FIELDS = ['subnet', 'name']
+UPDATED_FIELDS = [
+    'subnet', 'name', 'gateway', 'ip_ranges', 'excluded_ip_ranges'
+]
+# fields deciding which ips in the subnet can be allocated.
+ALLOCATION_FIELDS = [
+    'subnet', 'gateway', 'ip_ranges', 'excluded_ip_ranges'
+]
+# max number of candidate ips checked against host networks in a query.
+ALLOCATION_BATCH_SIZE = 500
 
 
 def _check_subnet(subnet):
@@ -45,7 +56,168 @@ def _check_subnet(subnet):
             'subnet %s format unrecognized' % subnet)
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_FIELDS)
+def _check_ip_ranges(ip_ranges):
+    if not isinstance(ip_ranges, list):
+        raise exception.InvalidParameter(
+            'ip ranges %s type is not list' % ip_ranges
+        )
+    for ip_range in ip_ranges:
+        if not (isinstance(ip_range, list) and len(ip_range) == 2):
+            raise exception.InvalidParameter(
+                'ip range %s is not [start ip, end ip]' % ip_range
+            )
+        for ip in ip_range:
+            utils.check_ip(ip)
+        start, end = ip_range
+        if netaddr.IPAddress(start) > netaddr.IPAddress(end):
+            raise exception.InvalidParameter(
+                'ip range start %s is greater than end %s' % (start, end)
+            )
+
+
+def _get_allocatable_ip_set(subnet):
+    """Get the set of ips in subnet which can be allocated to hosts."""
+    network = netaddr.IPNetwork(subnet.subnet)
+    if subnet.ip_ranges:
+        ip_set = netaddr.IPSet()
+        for start, end in subnet.ip_ranges:
+            ip_set |= netaddr.IPSet(netaddr.IPRange(start, end))
+        ip_set &= netaddr.IPSet(network)
+    else:
+        ip_set = netaddr.IPSet(network)
+        if network.size > 2:
+            ip_set.remove(netaddr.IPAddress(network.first))
+            ip_set.remove(netaddr.IPAddress(network.last))
+    for start, end in subnet.excluded_ip_ranges or []:
+        ip_set -= netaddr.IPSet(netaddr.IPRange(start, end))
+    if subnet.gateway:
+        ip_set.remove(netaddr.IPAddress(subnet.gateway))
+    return ip_set
+
+
+def _rebuild_free_ranges(session, subnet):
+    """Rebuild free ranges of subnet from the ips used by host networks.
+
+    Ips taken from free ranges but not used by any host network are
+    freed again here.
+    """
+    network = netaddr.IPNetwork(subnet.subnet)
+    ip_set = _get_allocatable_ip_set(subnet)
+    ip_set -= netaddr.IPSet([
+        netaddr.IPAddress(ip_int)
+        for ip_int, in session.query(models.HostNetwork.ip_int).filter(
+            models.HostNetwork.ip_int.between(network.first, network.last)
+        ).with_for_update()
+    ])
+    # deleted free ranges are expunged, or their stale objects would be
+    # returned for new free ranges reusing their ids.
+    for free_range in utils.del_db_objects(
+        session, models.SubnetFreeRange, subnet_id=subnet.id
+    ):
+        session.expunge(free_range)
+    utils.add_db_objects(session, models.SubnetFreeRange, [
+        {
+            'subnet_id': subnet.id,
+            'ip_int_start': ip_range.first,
+            'ip_int_end': ip_range.last
+        }
+        for ip_range in ip_set.iter_ipranges()
+    ])
+    logging.info(
+        'rebuild free ranges of subnet %s: %s', subnet.subnet, ip_set
+    )
+
+
+def _take_free_ips(session, subnet, count):
+    """Take at most count ips from the free ranges of subnet.
+
+    Candidate ips are checked against host networks in batches since
+    host networks may use them without taking them from free ranges.
+    Host networks are read with locking reads, which see the rows
+    committed by the previous allocation in the subnet even when the
+    transaction snapshot is older.
+    """
+    ip_ints = []
+    free_ranges = session.query(models.SubnetFreeRange).filter_by(
+        subnet_id=subnet.id
+    ).order_by(
+        models.SubnetFreeRange.ip_int_start
+    ).with_for_update()
+    for free_range in free_ranges:
+        while (
+            len(ip_ints) < count and
+            free_range.ip_int_start <= free_range.ip_int_end
+        ):
+            start = free_range.ip_int_start
+            end = min(
+                free_range.ip_int_end,
+                start + min(count - len(ip_ints), ALLOCATION_BATCH_SIZE) - 1
+            )
+            candidates = range(start, end + 1)
+            used_ip_ints = set([
+                ip_int for ip_int, in session.query(
+                    models.HostNetwork.ip_int
+                ).filter(
+                    models.HostNetwork.ip_int.in_(candidates)
+                ).with_for_update()
+            ])
+            ip_ints.extend([
+                ip_int for ip_int in candidates
+                if ip_int not in used_ip_ints
+            ])
+            free_range.ip_int_start = end + 1
+        if free_range.ip_int_start > free_range.ip_int_end:
+            session.delete(free_range)
+        if len(ip_ints) >= count:
+            break
+    session.flush()
+    return ip_ints
+
+
+def lock_subnet_internal(session, subnet_id):
+    """Lock the subnet row until the session ends.
+
+    It should be called before reading host networks of the subnet.
+    The subnet is reloaded to see the settings committed before the
+    lock is taken.
+    """
+    with session.begin(subtransactions=True):
+        subnet = session.query(models.Subnet).filter_by(
+            id=subnet_id
+        ).populate_existing().with_for_update().first()
+    if not subnet:
+        raise exception.RecordNotExists(
+            'subnet %s does not exist' % subnet_id
+        )
+    return subnet
+
+
+def allocate_ips_internal(session, subnet, count):
+    """Allocate count free ips in subnet, in ascending order.
+
+    The subnet row is locked until the session ends, so parallel
+    allocations in the subnet do not get the same ips. Free ranges
+    are rebuilt when they do not have enough ips.
+
+    :return: list of allocated ip ints, less than count if the
+             subnet does not have enough free ips.
+    """
+    with session.begin(subtransactions=True):
+        subnet = lock_subnet_internal(session, subnet.id)
+        ip_ints = _take_free_ips(session, subnet, count)
+        if len(ip_ints) < count:
+            _rebuild_free_ranges(session, subnet)
+            ip_ints = _take_free_ips(session, subnet, count)
+        logging.debug(
+            'allocate %s ips in subnet %s: %s',
+            count, subnet.subnet, ip_ints
+        )
+        return ip_ints
+
+
+@utils.supported_filters(
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_SUBNETS
@@ -79,7 +251,12 @@ def get_subnet(
     ADDED_FIELDS, optional_support_keys=OPTIONAL_ADDED_FIELDS,
     ignore_support_keys=IGNORE_FIELDS
 )
-@utils.input_validates(subnet=_check_subnet)
+@utils.input_validates(
+    subnet=_check_subnet,
+    gateway=utils.check_ip,
+    ip_ranges=_check_ip_ranges,
+    excluded_ip_ranges=_check_ip_ranges
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_ADD_SUBNET
@@ -90,17 +267,24 @@ def add_subnet(
     subnet=None, **kwargs
 ):
     """Create a subnet."""
-    return utils.add_db_object(
+    subnet = utils.add_db_object(
         session, models.Subnet,
         exception_when_existing, subnet, **kwargs
     )
+    _rebuild_free_ranges(session, subnet)
+    return subnet
 
 
 @utils.supported_filters(
     optional_support_keys=UPDATED_FIELDS,
     ignore_support_keys=IGNORE_FIELDS
 )
-@utils.input_validates(subnet=_check_subnet)
+@utils.input_validates(
+    subnet=_check_subnet,
+    gateway=utils.check_ip,
+    ip_ranges=_check_ip_ranges,
+    excluded_ip_ranges=_check_ip_ranges
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_ADD_SUBNET
@@ -111,7 +295,10 @@ def update_subnet(session, updater, subnet_id, **kwargs):
     subnet = utils.get_db_object(
         session, models.Subnet, id=subnet_id
     )
-    return utils.update_db_object(session, subnet, **kwargs)
+    subnet = utils.update_db_object(session, subnet, **kwargs)
+    if any(key in kwargs for key in ALLOCATION_FIELDS):
+        _rebuild_free_ranges(session, subnet)
+    return subnet
 
 
 @utils.supported_filters([])
@@ -139,4 +326,7 @@ def del_subnet(session, deleter, subnet_id, **kwargs):
             )
         )
 
+    utils.del_db_objects(
+        session, models.SubnetFreeRange, subnet_id=subnet.id
+    )
     return utils.del_db_object(session, subnet)
@@ -266,7 +266,9 @@ def list_permissions_internal(session, **filters):
     return utils.list_db_objects(session, models.Permission, **filters)
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(PERMISSION_LIST_PERMISSIONS)
 @utils.wrap_to_dict(RESP_FIELDS)
@@ -294,16 +296,13 @@ def get_permission(
 
 def add_permissions_internal(session):
     """internal functions used by other db.api modules only."""
-    permissions = []
-    for permission in PERMISSIONS:
-        permissions.append(
-            utils.add_db_object(
-                session, models.Permission,
-                True,
-                permission.name,
-                alias=permission.alias,
-                description=permission.description
-            )
-        )
-
-    return permissions
+    return utils.add_db_objects(
+        session, models.Permission, [
+            {
+                'name': permission.name,
+                'alias': permission.alias,
+                'description': permission.description
+            }
+            for permission in PERMISSIONS
+        ]
+    )
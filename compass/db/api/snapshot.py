@@ -0,0 +1,170 @@
+# Copyright 2014 Huawei Technologies Co. Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Versioned snapshots of data shared by processes.
+
+Data built from database and held in memory, like adapters and
+metadatas, is versioned in the snapshot_version table. Each process
+checks the version at most every METADATA_SNAPSHOT_CHECK_INTERVAL
+and reloads the data when the version changes. If
+METADATA_SNAPSHOT_DIR is set, the data of each version is built once
+and pickled to a snapshot file there, which other processes load
+instead of building the data again.
+"""
+import cPickle as pickle
+import glob
+import logging
+import os
+import os.path
+import tempfile
+import threading
+import time
+import uuid
+
+from compass.db.api import utils
+from compass.db import models
+from compass.utils import setting_wrapper as setting
+from compass.utils import util
+
+
+# names of snapshots built from the tables filled by create_db.
+BOOTSTRAP_SNAPSHOTS = ['adapter', 'os_metadata', 'package_metadata']
+
+
+def get_version(session, name):
+    """Get version of snapshot name, None if it is never bumped."""
+    snapshot_version = utils.get_db_object(
+        session, models.SnapshotVersion, False, name=name
+    )
+    if not snapshot_version:
+        return None
+    return snapshot_version.version
+
+
+def bump_versions(session, names):
+    """Bump versions of snapshots after their data is changed."""
+    for name in names:
+        logging.info('bump version of snapshot %s', name)
+        utils.add_db_object(
+            session, models.SnapshotVersion, False, name,
+            version=uuid.uuid4().hex
+        )
+
+
+def _get_snapshot_path(name, version):
+    return os.path.join(
+        str(setting.METADATA_SNAPSHOT_DIR),
+        '%s.%s.snapshot' % (name, version)
+    )
+
+
+def _read_snapshot(snapshot_path):
+    """Read data from snapshot file snapshot_path."""
+    if not os.path.exists(snapshot_path):
+        return None
+    try:
+        with open(snapshot_path, 'rb') as snapshot_file:
+            return pickle.load(snapshot_file)
+    except Exception as error:
+        logging.error('failed to read snapshot %s', snapshot_path)
+        logging.exception(error)
+        return None
+
+
+def _write_snapshot(snapshot_path, data):
+    """Write data to snapshot file snapshot_path.
+
+    Snapshot files of other versions are removed afterwards.
+    """
+    try:
+        snapshot_dir = os.path.dirname(snapshot_path)
+        if not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir)
+        with os.fdopen(fd, 'wb') as snapshot_file:
+            pickle.dump(data, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, snapshot_path)
+    except Exception as error:
+        logging.error('failed to write snapshot %s', snapshot_path)
+        logging.exception(error)
+        return
+    name = os.path.basename(snapshot_path).split('.', 1)[0]
+    for path in glob.glob(
+        os.path.join(snapshot_dir, '%s.*.snapshot' % name)
+    ):
+        if path == snapshot_path:
+            continue
+        try:
+            os.remove(path)
+        except OSError as error:
+            logging.debug('failed to remove snapshot %s: %s', path, error)
+
+
+class Snapshot(object):
+    """Data built by build_func(session) and reloaded by version.
+
+    generation is increased each time the data is loaded in this
+    process.
+    """
+
+    def __init__(self, name, build_func):
+        self.name = name
+        self.build_func = build_func
+        self.data = None
+        self.version = None
+        self.generation = 0
+        self.expire_timestamp = 0
+        self.lock = threading.Lock()
+
+    def _load(self, session, version):
+        if not (setting.METADATA_SNAPSHOT_DIR and version):
+            return self.build_func(session)
+        snapshot_path = _get_snapshot_path(self.name, version)
+        data = _read_snapshot(snapshot_path)
+        if data is None:
+            data = self.build_func(session)
+            _write_snapshot(snapshot_path, data)
+        else:
+            logging.debug('load snapshot %s', snapshot_path)
+        return data
+
+    def load(self, session):
+        """Load the data of current version."""
+        with self.lock:
+            version = get_version(session, self.name)
+            self.data = self._load(session, version)
+            self.version = version
+            self.generation += 1
+            self.expire_timestamp = time.time() + util.parse_time_interval(
+                setting.METADATA_SNAPSHOT_CHECK_INTERVAL
+            )
+        return self.data
+
+    def get(self, session):
+        """Get the data, reloaded if its version is changed."""
+        if self.data is not None and time.time() < self.expire_timestamp:
+            return self.data
+        if self.data is None:
+            return self.load(session)
+        version = get_version(session, self.name)
+        if version != self.version:
+            logging.info(
+                'snapshot %s version changes from %s to %s',
+                self.name, self.version, version
+            )
+            return self.load(session)
+        self.expire_timestamp = time.time() + util.parse_time_interval(
+            setting.METADATA_SNAPSHOT_CHECK_INTERVAL
+        )
+        return self.data
@@ -17,7 +17,16 @@ import logging
 import netaddr
 import re
 
+from sqlalchemy import and_
+from sqlalchemy import cast
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import subqueryload
+
 from compass.db.api import database
+from compass.db.api import machine as machine_api
 from compass.db.api import permission
 from compass.db.api import user as user_api
 from compass.db.api import utils
@@ -96,6 +105,23 @@ RESP_MACHINES_HOSTS_FIELDS = [
 RESP_CLUSTER_FIELDS = [
     'name', 'id'
 ]
+# relationships accessed in SwitchMachine.to_dict, Machine.to_dict
+# and Host.to_dict when listing switch machines hosts.
+SWITCH_MACHINE_HOST_LOAD_PROFILE = [
+    joinedload('switch'),
+    joinedload('machine').subqueryload(
+        'switch_machines'
+    ).joinedload('switch'),
+    joinedload('machine').joinedload('host').joinedload('state'),
+    joinedload('machine').joinedload('host').joinedload('os_installer'),
+    joinedload('machine').joinedload('host').subqueryload(
+        'host_networks'
+    ).joinedload('subnet'),
+    joinedload('machine').joinedload('host').subqueryload(
+        'clusterhosts'
+    ).joinedload('cluster')
+]
+PORT_REGEX_CHARS = set('.^$*+?{}[]\\|()')
 
 
 def _check_filters(switch_filters):
@@ -150,7 +176,9 @@ def get_switch(
     )
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_SWITCHES
@@ -164,10 +192,10 @@ def list_switches(session, lister, **filters):
     if 'ip_int' in filters:
         return switches
     else:
-        return [
+        return utils.copy_page(switches, [
             switch for switch in switches
             if switch.ip != setting.DEFAULT_SWITCH_IP
-        ]
+        ])
 
 
 @utils.supported_filters([])
@@ -263,7 +291,9 @@ def patch_switch(session, updater, switch_id, **kwargs):
     return _update_switch(session, updater, switch_id, **kwargs)
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_FILTER_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=SUPPORTED_FILTER_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @database.run_in_session()
 @user_api.check_user_permission_in_session(
     permission.PERMISSION_LIST_SWITCH_FILTERS
@@ -329,9 +359,66 @@ def patch_switch_filter(session, updater, switch_id, **kwargs):
     return utils.update_db_object(session, switch, **kwargs)
 
 
-def get_switch_machines_internal(session, **filters):
+def _port_number_conditions(session, port_filter):
+    """Translate port number bounds of port filter to sql.
+
+    The number following the port prefix is got by casting the rest
+    of the port to integer, which only reads the leading digits
+    in mysql and sqlite. _filter_port still checks the listed ports.
+    """
+    if session.bind.dialect.name not in ['mysql', 'sqlite']:
+        return []
+    port_prefix = port_filter.get('startswith', '')
+    port_suffix = port_filter.get('endswith', '')
+    if (
+        PORT_REGEX_CHARS & set(port_prefix + port_suffix) or
+        port_suffix[:1].isdigit()
+    ):
+        return []
+    port_number = cast(
+        func.substr(models.SwitchMachine.port, len(port_prefix) + 1),
+        Integer
+    )
+    conditions = []
+    if 'resp_lt' in port_filter:
+        conditions.append(port_number < port_filter['resp_lt'])
+    if 'resp_le' in port_filter:
+        conditions.append(port_number <= port_filter['resp_le'])
+    if 'resp_gt' in port_filter:
+        conditions.append(port_number > port_filter['resp_gt'])
+    if 'resp_ge' in port_filter:
+        conditions.append(port_number >= port_filter['resp_ge'])
+    if port_filter.get('resp_range'):
+        conditions.append(or_(*[
+            port_number.between(port_start, port_end)
+            for port_start, port_end in port_filter['resp_range']
+        ]))
+    return conditions
+
+
+def _switch_machines_conditions(session, filters):
+    """Translate the response filters of switch machines to sql.
+
+    The translated tag and location filters are popped from filters.
+    """
+    conditions = []
+    if isinstance(filters.get('port'), dict):
+        conditions.extend(
+            _port_number_conditions(session, filters['port'])
+        )
+    machine_conditions = machine_api.pop_attributes_conditions(filters)
+    if machine_conditions:
+        conditions.append(
+            models.SwitchMachine.machine.has(and_(*machine_conditions))
+        )
+    return conditions
+
+
+def get_switch_machines_internal(session, load_profile=[], **filters):
+    conditions = _switch_machines_conditions(session, filters)
     return utils.list_db_objects(
-        session, models.SwitchMachine, **filters
+        session, models.SwitchMachine, load_profile=load_profile,
+        conditions=conditions, **filters
     )
 
 
@@ -396,10 +483,10 @@ def _filter_switch_machines(session, user, switch_machines, **filters):
     if 'ip_int' in filters:
         return switch_machines
     else:
-        return [
+        return utils.copy_page(switch_machines, [
             switch_machine for switch_machine in switch_machines
             if not switch_machine.filtered
-        ]
+        ])
 
 
 @user_api.check_user_permission_in_session(
@@ -421,27 +508,30 @@ def _filter_switch_machines_hosts(session, user, switch_machines, **filters):
     if 'ip_int' in filters:
         filtered_switch_machines = switch_machines
     else:
-        filtered_switch_machines = [
+        filtered_switch_machines = utils.copy_page(switch_machines, [
             switch_machine for switch_machine in switch_machines
             if not switch_machine.filtered
-        ]
+        ])
+    # Only convert the response fields so the deferred host config
+    # columns are not loaded once per host.
+    fields = filters.get('fields') or RESP_MACHINES_HOSTS_FIELDS
     switch_machines_hosts = []
     for switch_machine in filtered_switch_machines:
         machine = switch_machine.machine
         host = machine.host
         if host:
-            switch_machine_host_dict = host.to_dict()
+            switch_machine_host_dict = host.to_dict(fields)
         else:
-            switch_machine_host_dict = machine.to_dict()
+            switch_machine_host_dict = machine.to_dict(fields)
         switch_machine_host_dict.update(
-            switch_machine.to_dict()
+            switch_machine.to_dict(fields)
         )
         switch_machines_hosts.append(switch_machine_host_dict)
-    return switch_machines_hosts
+    return utils.copy_page(filtered_switch_machines, switch_machines_hosts)
 
 
 @utils.supported_filters(
-    optional_support_keys=SUPPORTED_MACHINES_FIELDS
+    optional_support_keys=SUPPORTED_MACHINES_FIELDS + utils.LIST_OPTION_FIELDS
 )
 @database.run_in_session()
 def list_switch_machines(session, getter, switch_id, **filters):
@@ -456,7 +546,9 @@ def list_switch_machines(session, getter, switch_id, **filters):
     ip_int='switch_ip_int'
 )
 @utils.supported_filters(
-    optional_support_keys=SUPPORTED_SWITCH_MACHINES_FIELDS
+    optional_support_keys=(
+        SUPPORTED_SWITCH_MACHINES_FIELDS + utils.LIST_OPTION_FIELDS
+    )
 )
 @database.run_in_session()
 def list_switchmachines(session, lister, **filters):
@@ -470,13 +562,16 @@ def list_switchmachines(session, lister, **filters):
 
 
 @utils.supported_filters(
-    optional_support_keys=SUPPORTED_MACHINES_HOSTS_FIELDS
+    optional_support_keys=(
+        SUPPORTED_MACHINES_HOSTS_FIELDS + utils.LIST_OPTION_FIELDS
+    )
 )
 @database.run_in_session()
 def list_switch_machines_hosts(session, getter, switch_id, **filters):
     """Get switch machines hosts."""
     switch_machines = get_switch_machines_internal(
-        session, switch_id=switch_id, **filters
+        session, switch_id=switch_id,
+        load_profile=SWITCH_MACHINE_HOST_LOAD_PROFILE, **filters
     )
     return _filter_switch_machines_hosts(
         session, getter, switch_machines, **filters
@@ -487,21 +582,23 @@ def list_switch_machines_hosts(session, getter, switch_id, **filters):
     ip_int='switch_ip_int'
 )
 @utils.supported_filters(
-    optional_support_keys=SUPPORTED_SWITCH_MACHINES_HOSTS_FIELDS
+    optional_support_keys=(
+        SUPPORTED_SWITCH_MACHINES_HOSTS_FIELDS + utils.LIST_OPTION_FIELDS
+    )
 )
 @database.run_in_session()
 def list_switchmachines_hosts(session, lister, **filters):
     """List switch machines hosts."""
     switch_machines = get_switch_machines_internal(
-        session, **filters
+        session, load_profile=SWITCH_MACHINE_HOST_LOAD_PROFILE, **filters
     )
     if 'ip_int' in filters:
         filtered_switch_machines = switch_machines
     else:
-        filtered_switch_machines = [
+        filtered_switch_machines = utils.copy_page(switch_machines, [
             switch_machine for switch_machine in switch_machines
             if switch_machine.switch_ip != setting.DEFAULT_SWITCH_IP
-        ]
+        ])
     return _filter_switch_machines_hosts(
         session, lister, filtered_switch_machines, **filters
     )
@@ -13,10 +13,17 @@
 # limitations under the License.
 
 """User database operations."""
+import collections
 import datetime
 import functools
+import logging
+import os
+import redis
+import threading
+import time
 
 from flask.ext.login import UserMixin
+from sqlalchemy.orm import joinedload
 
 from compass.db.api import database
 from compass.db.api import utils
@@ -49,6 +56,17 @@ PERMISSION_RESP_FIELDS = [
     'id', 'user_id', 'permission_id', 'name', 'alias', 'description',
     'created_at', 'updated_at'
 ]
+# user id to (expire time, set of permission names).
+USER_PERMISSIONS_CACHE = {}
+USER_PERMISSIONS_CACHE_GENERATION = 0
+USER_PERMISSIONS_CACHE_LOCK = threading.Lock()
+# token to (cache expire time, user id, user dict) in lru order.
+USER_TOKEN_CACHE = collections.OrderedDict()
+USER_TOKEN_CACHE_GENERATION = 0
+USER_TOKEN_CACHE_LOCK = threading.Lock()
+USER_TOKEN_CACHE_STATS = {'hits': 0, 'misses': 0, 'evictions': 0}
+# pid of the process listening cache invalidation broadcast.
+USER_CACHE_LISTENER_PID = None
 
 
 def _check_email(email):
@@ -74,6 +92,9 @@ def add_user_internal(
         session, models.User,
         exception_when_existing, email,
         **kwargs)
+    # user id may be reused after the user is deleted.
+    _clear_user_permissions_cache(user.id)
+    _clear_user_tokens_cache(user_id=user.id)
     _add_user_permissions(
         session, user,
         name=setting.COMPASS_DEFAULT_PERMISSIONS
@@ -81,16 +102,222 @@ def add_user_internal(
     return user
 
 
+def _clear_user_permissions_cache(user_id=None):
+    """Remove user permissions from local cache.
+
+    All cached user permissions are removed if user_id is not given.
+    """
+    global USER_PERMISSIONS_CACHE_GENERATION
+    with USER_PERMISSIONS_CACHE_LOCK:
+        USER_PERMISSIONS_CACHE_GENERATION += 1
+        if user_id is None:
+            USER_PERMISSIONS_CACHE.clear()
+        else:
+            USER_PERMISSIONS_CACHE.pop(user_id, None)
+
+
+def _clear_user_tokens_cache(user_id=None, token=None):
+    """Remove user tokens from local cache.
+
+    All cached user tokens are removed if neither user_id
+    nor token is given.
+    """
+    global USER_TOKEN_CACHE_GENERATION
+    with USER_TOKEN_CACHE_LOCK:
+        USER_TOKEN_CACHE_GENERATION += 1
+        if token is not None:
+            USER_TOKEN_CACHE.pop(token, None)
+        elif user_id is not None:
+            for cached_token, (_, cached_user_id, _) in (
+                USER_TOKEN_CACHE.items()
+            ):
+                if cached_user_id == user_id:
+                    del USER_TOKEN_CACHE[cached_token]
+        else:
+            USER_TOKEN_CACHE.clear()
+
+
+def _handle_user_cache_invalidation(message):
+    """Handle invalidation broadcast from other processes.
+
+    The message data is formatted as <kind>:<value>, kind is one of
+    permissions, user and token. Empty value means all.
+    """
+    data = message['data']
+    logging.debug('receive user cache invalidation: %s', data)
+    kind, _, value = data.partition(':')
+    if kind == 'token':
+        _clear_user_tokens_cache(token=value)
+        return
+    if value:
+        user_id = int(value)
+    else:
+        user_id = None
+    _clear_user_permissions_cache(user_id)
+    if kind == 'user':
+        _clear_user_tokens_cache(user_id=user_id)
+
+
+def _listen_user_cache_invalidation():
+    """Subscribe user cache invalidation broadcast in this process."""
+    global USER_CACHE_LISTENER_PID
+    if not setting.USER_CACHE_BROADCAST:
+        return
+    pid = os.getpid()
+    if USER_CACHE_LISTENER_PID == pid:
+        return
+    with USER_PERMISSIONS_CACHE_LOCK:
+        if USER_CACHE_LISTENER_PID == pid:
+            return
+        # the listener thread does not survive fork.
+        USER_CACHE_LISTENER_PID = pid
+        USER_PERMISSIONS_CACHE.clear()
+        with USER_TOKEN_CACHE_LOCK:
+            USER_TOKEN_CACHE.clear()
+        try:
+            pubsub = redis.Redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{
+                setting.USER_CACHE_CHANNEL: _handle_user_cache_invalidation
+            })
+            listener = pubsub.run_in_thread(sleep_time=1)
+            listener.daemon = True
+        except Exception as error:
+            logging.error(
+                'failed to subscribe user cache invalidation, '
+                'cached user permissions and tokens expire by duration only'
+            )
+            logging.exception(error)
+
+
+def _broadcast_user_cache_invalidation(kind, value=None):
+    if not setting.USER_CACHE_BROADCAST:
+        return
+    if value is None:
+        value = ''
+    try:
+        redis.Redis().publish(
+            setting.USER_CACHE_CHANNEL, '%s:%s' % (kind, value)
+        )
+    except Exception as error:
+        logging.error(
+            'failed to broadcast user cache invalidation %s %s',
+            kind, value
+        )
+        logging.exception(error)
+
+
+def invalidate_user_permissions(user_id=None):
+    """Invalidate cached user permissions in all processes."""
+    _clear_user_permissions_cache(user_id)
+    _broadcast_user_cache_invalidation('permissions', user_id)
+
+
+def invalidate_user(user_id=None):
+    """Invalidate cached user permissions and tokens in all processes."""
+    _clear_user_permissions_cache(user_id)
+    _clear_user_tokens_cache(user_id=user_id)
+    _broadcast_user_cache_invalidation('user', user_id)
+
+
+def invalidate_user_token(token):
+    """Invalidate cached user token in all processes."""
+    _clear_user_tokens_cache(token=token)
+    _broadcast_user_cache_invalidation('token', token)
+
+
+def _get_user_permission_names(session, user):
+    """Get permission names of the user.
+
+    The permission names are cached for USER_PERMISSION_CACHE_DURATION.
+    """
+    _listen_user_cache_invalidation()
+    now = time.time()
+    with USER_PERMISSIONS_CACHE_LOCK:
+        generation = USER_PERMISSIONS_CACHE_GENERATION
+        if user.id in USER_PERMISSIONS_CACHE:
+            expire_time, permission_names = USER_PERMISSIONS_CACHE[user.id]
+            if expire_time > now:
+                return permission_names
+            del USER_PERMISSIONS_CACHE[user.id]
+
+    permission_names = frozenset([
+        user_permission.name
+        for user_permission in utils.list_db_objects(
+            session, models.UserPermission,
+            load_profile=[joinedload('permission')], user_id=user.id
+        )
+    ])
+    duration = util.parse_time_interval(
+        setting.USER_PERMISSION_CACHE_DURATION
+    )
+    if duration > 0:
+        with USER_PERMISSIONS_CACHE_LOCK:
+            # do not cache permissions read before an invalidation.
+            if generation == USER_PERMISSIONS_CACHE_GENERATION:
+                USER_PERMISSIONS_CACHE[user.id] = (
+                    now + duration, permission_names
+                )
+    return permission_names
+
+
+def invalidate_user_permissions_cache():
+    """Invalidate user permissions after the decorated function.
+
+    It should be applied outside of database.run_in_session
+    so the invalidation happens after the session is committed.
+    In a shared session the invalidation waits for the session end.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user, user_id, *args, **kwargs):
+            try:
+                return func(user, user_id, *args, **kwargs)
+            finally:
+                database.call_after_session(
+                    invalidate_user_permissions, user_id
+                )
+        return wrapper
+    return decorator
+
+
+def invalidate_user_cache():
+    """Invalidate user permissions and tokens after the decorated function.
+
+    It should be applied outside of database.run_in_session.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user, user_id, *args, **kwargs):
+            try:
+                return func(user, user_id, *args, **kwargs)
+            finally:
+                database.call_after_session(invalidate_user, user_id)
+        return wrapper
+    return decorator
+
+
+def invalidate_user_token_cache():
+    """Invalidate user token after the decorated function.
+
+    It should be applied outside of database.run_in_session.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(user, token, *args, **kwargs):
+            try:
+                return func(user, token, *args, **kwargs)
+            finally:
+                database.call_after_session(invalidate_user_token, token)
+        return wrapper
+    return decorator
+
+
 def _check_user_permission(session, user, permission):
     """Check user has permission."""
     if user.is_admin:
         return
 
-    user_permission = utils.get_db_object(
-        session, models.UserPermission,
-        False, user_id=user.id, name=permission.name
-    )
-    if not user_permission:
+    if permission.name not in _get_user_permission_names(session, user):
         raise exception.Forbidden(
             'user %s does not have permission %s' % (
                 user.email, permission.name
@@ -236,8 +463,79 @@ def get_user_object(session, email, **kwargs):
     return UserWrapper(**user_dict)
 
 
+def _get_cached_user_dict(token):
+    """Get user dict of the token from cache and update stats."""
+    now = datetime.datetime.now()
+    with USER_TOKEN_CACHE_LOCK:
+        if token in USER_TOKEN_CACHE:
+            expire_timestamp, _, user_dict = USER_TOKEN_CACHE.pop(token)
+            if expire_timestamp > now:
+                USER_TOKEN_CACHE[token] = (
+                    expire_timestamp, user_dict['id'], user_dict
+                )
+                USER_TOKEN_CACHE_STATS['hits'] += 1
+                return dict(user_dict)
+        USER_TOKEN_CACHE_STATS['misses'] += 1
+        return None
+
+
+def _cache_user_dict(token, user_dict, generation):
+    """Cache user dict of the token.
+
+    The cached user dict is not used after the token expires.
+    """
+    duration = util.parse_time_interval(setting.USER_TOKEN_CACHE_DURATION)
+    if duration <= 0 or setting.USER_TOKEN_CACHE_SIZE <= 0:
+        return
+    expire_timestamp = min(
+        datetime.datetime.now() + datetime.timedelta(seconds=duration),
+        user_dict['expire_timestamp']
+    )
+    with USER_TOKEN_CACHE_LOCK:
+        # do not cache user read before an invalidation.
+        if generation != USER_TOKEN_CACHE_GENERATION:
+            return
+        USER_TOKEN_CACHE.pop(token, None)
+        USER_TOKEN_CACHE[token] = (
+            expire_timestamp, user_dict['id'], dict(user_dict)
+        )
+        while len(USER_TOKEN_CACHE) > setting.USER_TOKEN_CACHE_SIZE:
+            USER_TOKEN_CACHE.popitem(last=False)
+            USER_TOKEN_CACHE_STATS['evictions'] += 1
+
+
+@check_user_admin()
+def get_user_token_cache_stats(getter):
+    """Get hit rate counters of user token cache."""
+    with USER_TOKEN_CACHE_LOCK:
+        stats = dict(USER_TOKEN_CACHE_STATS)
+        stats['size'] = len(USER_TOKEN_CACHE)
+    requests = stats['hits'] + stats['misses']
+    if requests:
+        stats['hit_rate'] = float(stats['hits']) / requests
+    else:
+        stats['hit_rate'] = 0.0
+    return stats
+
+
+def get_user_object_from_token(token):
+    """Get user object from token.
+
+    The user of a token is cached for USER_TOKEN_CACHE_DURATION
+    but never longer than the token expire timestamp.
+    """
+    _listen_user_cache_invalidation()
+    user_dict = _get_cached_user_dict(token)
+    if user_dict:
+        return UserWrapper(**user_dict)
+    generation = USER_TOKEN_CACHE_GENERATION
+    user_dict = _get_user_dict_from_token(token)
+    _cache_user_dict(token, user_dict, generation)
+    return UserWrapper(**user_dict)
+
+
 @database.run_in_session()
-def get_user_object_from_token(session, token):
+def _get_user_dict_from_token(session, token):
     expire_timestamp = {
         'ge': datetime.datetime.now()
     }
@@ -254,7 +552,7 @@ def get_user_object_from_token(session, token):
     ).to_dict()
     user_dict['token'] = token
     user_dict['expire_timestamp'] = user_token.expire_timestamp
-    return UserWrapper(**user_dict)
+    return user_dict
 
 
 @utils.supported_filters()
@@ -270,6 +568,7 @@ def record_user_token(session, user, token, expire_timestamp):
 
 
 @utils.supported_filters()
+@invalidate_user_token_cache()
 @database.run_in_session()
 @utils.wrap_to_dict(RESP_TOKEN_FIELDS)
 def clean_user_token(session, user, token):
@@ -308,7 +607,7 @@ def get_current_user(
 
 
 @utils.supported_filters(
-    optional_support_keys=SUPPORTED_FIELDS
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
 )
 @check_user_admin()
 @database.run_in_session()
@@ -342,6 +641,7 @@ def add_user(
 
 @utils.supported_filters()
 @check_user_admin()
+@invalidate_user_cache()
 @database.run_in_session()
 @utils.wrap_to_dict(RESP_FIELDS)
 def del_user(session, deleter, user_id, **kwargs):
@@ -355,6 +655,7 @@ def del_user(session, deleter, user_id, **kwargs):
     ignore_support_keys=IGNORE_FIELDS
 )
 @utils.input_validates(email=_check_email)
+@invalidate_user_cache()
 @database.run_in_session()
 @utils.wrap_to_dict(RESP_FIELDS)
 def update_user(session, updater, user_id, **kwargs):
@@ -378,7 +679,11 @@ def update_user(session, updater, user_id, **kwargs):
     return utils.update_db_object(session, user, **kwargs)
 
 
-@utils.supported_filters(optional_support_keys=PERMISSION_SUPPORTED_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=(
+        PERMISSION_SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+    )
+)
 @check_user_admin_or_owner()
 @database.run_in_session()
 @utils.wrap_to_dict(PERMISSION_RESP_FIELDS)
@@ -408,6 +713,7 @@ def get_permission(
 
 @utils.supported_filters()
 @check_user_admin_or_owner()
+@invalidate_user_permissions_cache()
 @database.run_in_session()
 @utils.wrap_to_dict(PERMISSION_RESP_FIELDS)
 def del_permission(session, deleter, user_id, permission_id, **kwargs):
@@ -425,6 +731,7 @@ def del_permission(session, deleter, user_id, permission_id, **kwargs):
     ignore_support_keys=IGNORE_FIELDS
 )
 @check_user_admin()
+@invalidate_user_permissions_cache()
 @database.run_in_session()
 @utils.wrap_to_dict(PERMISSION_RESP_FIELDS)
 def add_permission(
@@ -451,6 +758,7 @@ def _get_permission_filters(permission_ids):
     ]
 )
 @check_user_admin()
+@invalidate_user_permissions_cache()
 @database.run_in_session()
 @utils.wrap_to_dict(PERMISSION_RESP_FIELDS)
 def update_permissions(
@@ -13,18 +13,31 @@
 # limitations under the License.
 
 """UserLog database operations."""
+import atexit
+import datetime
+import gzip
 import logging
+import os
+import Queue
+import simplejson as json
+import threading
+import time
 
 from compass.db.api import database
 from compass.db.api import user as user_api
 from compass.db.api import utils
 from compass.db import exception
 from compass.db import models
+from compass.utils import setting_wrapper as setting
+from compass.utils import util
 
 
 SUPPORTED_FIELDS = ['user_email', 'timestamp']
 USER_SUPPORTED_FIELDS = ['timestamp']
 RESP_FIELDS = ['user_id', 'logs', 'timestamp']
+USER_LOG_QUEUE_FULL_POLICIES = ['block', 'drop', 'sync']
+USER_ACTION_LOGGER = None
+USER_ACTION_LOGGER_LOCK = threading.Lock()
 
 
 @database.run_in_session()
@@ -35,7 +48,246 @@ def log_user_action(session, user_id, action):
     )
 
 
-@utils.supported_filters(optional_support_keys=USER_SUPPORTED_FIELDS)
+@database.run_in_session()
+def add_user_actions(session, user_actions):
+    """Add user actions in one bulk insert.
+
+    :param user_actions: list of dict with user_id, action and timestamp.
+    """
+    with session.begin(subtransactions=True):
+        logging.debug(
+            'session %s add %s user actions',
+            id(session), len(user_actions)
+        )
+        session.execute(models.UserLog.__table__.insert(), user_actions)
+
+
+class UserActionLogger(object):
+    """Buffer user actions and write them in bulk.
+
+    A background thread writes buffered user actions every
+    flush_interval seconds or when flush_size actions are buffered.
+    When the buffer is full, full_policy decides what to do with
+    the new action: block waits for room, drop discards it and
+    sync writes it in the caller.
+    """
+
+    def __init__(
+        self, queue_size=10000, flush_interval=0.5, flush_size=100,
+        full_policy='sync'
+    ):
+        if full_policy not in USER_LOG_QUEUE_FULL_POLICIES:
+            raise exception.InvalidParameter(
+                'user log queue full policy %s is not in %s' % (
+                    full_policy, USER_LOG_QUEUE_FULL_POLICIES
+                )
+            )
+        self.queue = Queue.Queue(queue_size)
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.full_policy = full_policy
+        self.dropped = 0
+        self.pid = os.getpid()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name='user_action_logger'
+        )
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background thread and write all buffered actions."""
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.flush()
+
+    def log(self, user_id, action):
+        user_action = {
+            'user_id': user_id,
+            'action': action,
+            'timestamp': datetime.datetime.now()
+        }
+        if self.full_policy == 'block':
+            self.queue.put(user_action)
+            return
+        try:
+            self.queue.put_nowait(user_action)
+        except Queue.Full:
+            if self.full_policy == 'drop':
+                self.dropped += 1
+                logging.error(
+                    'user action log queue is full, drop %s', user_action
+                )
+            else:
+                self._write([user_action])
+
+    def flush(self):
+        """Write all buffered actions in the caller."""
+        user_actions = []
+        while True:
+            try:
+                user_actions.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+        for start in range(0, len(user_actions), self.flush_size):
+            self._write(user_actions[start:start + self.flush_size])
+
+    def _get_user_actions(self):
+        user_actions = []
+        deadline = time.time() + self.flush_interval
+        while len(user_actions) < self.flush_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                user_actions.append(self.queue.get(timeout=timeout))
+            except Queue.Empty:
+                break
+        return user_actions
+
+    def _write(self, user_actions):
+        if not user_actions:
+            return
+        try:
+            add_user_actions(user_actions)
+        except Exception as error:
+            logging.error('failed to write user actions %s', user_actions)
+            logging.exception(error)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self._write(self._get_user_actions())
+
+
+def _get_user_action_logger():
+    global USER_ACTION_LOGGER
+    pid = os.getpid()
+    if USER_ACTION_LOGGER and USER_ACTION_LOGGER.pid == pid:
+        return USER_ACTION_LOGGER
+    with USER_ACTION_LOGGER_LOCK:
+        # the logger thread does not survive fork.
+        if not USER_ACTION_LOGGER or USER_ACTION_LOGGER.pid != pid:
+            user_action_logger = UserActionLogger(
+                setting.USER_LOG_QUEUE_SIZE,
+                setting.USER_LOG_FLUSH_INTERVAL,
+                setting.USER_LOG_FLUSH_SIZE,
+                setting.USER_LOG_QUEUE_FULL_POLICY
+            )
+            user_action_logger.start()
+            atexit.register(user_action_logger.stop)
+            USER_ACTION_LOGGER = user_action_logger
+        return USER_ACTION_LOGGER
+
+
+def log_user_action_buffered(user_id, action):
+    """Log user action in background if USER_LOG_BUFFERED is set."""
+    if not setting.USER_LOG_BUFFERED:
+        log_user_action(user_id, action)
+        return
+    _get_user_action_logger().log(user_id, action)
+
+
+def flush_user_actions():
+    """Write buffered user actions of this process."""
+    if USER_ACTION_LOGGER and USER_ACTION_LOGGER.pid == os.getpid():
+        USER_ACTION_LOGGER.flush()
+
+
+@database.run_in_session()
+def _prune_user_actions_batch(session, before, batch_size, archive_file=None):
+    """Archive and delete one batch of user actions older than before.
+
+    :returns: number of user actions deleted.
+    """
+    table = models.UserLog.__table__
+    user_actions = session.execute(
+        table.select().where(
+            table.c.timestamp < before
+        ).order_by(table.c.timestamp).limit(batch_size)
+    ).fetchall()
+    if not user_actions:
+        return 0
+    if archive_file:
+        for user_action in user_actions:
+            archive_file.write(json.dumps({
+                'id': user_action.id,
+                'user_id': user_action.user_id,
+                'action': user_action.action,
+                'timestamp': user_action.timestamp.isoformat()
+            }) + '\n')
+        archive_file.flush()
+    session.execute(
+        table.delete().where(
+            table.c.id.in_([user_action.id for user_action in user_actions])
+        )
+    )
+    logging.debug(
+        'session %s prune %s user actions before %s',
+        id(session), len(user_actions), before
+    )
+    return len(user_actions)
+
+
+def prune_user_actions(retention=None, batch_size=None, archive_dir=None):
+    """Delete user actions older than the retention window.
+
+    User actions are deleted in batches of batch_size, each in its
+    own transaction, so the user_log table is never locked for long.
+    If archive_dir is set, the deleted user actions are appended to
+    a gzip compressed json lines file in it before being deleted.
+
+    :returns: number of user actions deleted.
+    """
+    if retention is None:
+        retention = setting.USER_LOG_RETENTION
+    if batch_size is None:
+        batch_size = setting.USER_LOG_PRUNE_BATCH_SIZE
+    if archive_dir is None:
+        archive_dir = setting.USER_LOG_ARCHIVE_DIR
+    retention_seconds = util.parse_time_interval(retention)
+    if retention_seconds <= 0:
+        logging.info('user log retention is not set, skip pruning')
+        return 0
+    if batch_size <= 0:
+        raise exception.InvalidParameter(
+            'user log prune batch size %s is not positive' % batch_size
+        )
+    before = datetime.datetime.now() - datetime.timedelta(
+        seconds=retention_seconds
+    )
+    archive_file = None
+    if archive_dir:
+        if not os.path.exists(archive_dir):
+            os.makedirs(archive_dir)
+        archive_file = gzip.open(
+            os.path.join(
+                archive_dir,
+                'user_log-%s.jsonl.gz' % before.strftime('%Y%m%d%H%M%S')
+            ),
+            'ab'
+        )
+    pruned = 0
+    try:
+        while True:
+            batch_pruned = _prune_user_actions_batch(
+                before, batch_size, archive_file
+            )
+            pruned += batch_pruned
+            if batch_pruned < batch_size:
+                break
+    finally:
+        if archive_file:
+            archive_file.close()
+    logging.info('pruned %s user actions before %s', pruned, before)
+    return pruned
+
+
+@utils.supported_filters(
+    optional_support_keys=USER_SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @user_api.check_user_admin_or_owner()
 @database.run_in_session()
 @utils.wrap_to_dict(RESP_FIELDS)
@@ -47,7 +299,9 @@ def list_user_actions(session, lister, user_id, **filters):
     )
 
 
-@utils.supported_filters(optional_support_keys=SUPPORTED_FIELDS)
+@utils.supported_filters(
+    optional_support_keys=SUPPORTED_FIELDS + utils.LIST_OPTION_FIELDS
+)
 @user_api.check_user_admin()
 @database.run_in_session()
 @utils.wrap_to_dict(RESP_FIELDS)
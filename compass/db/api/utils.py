@@ -14,13 +14,23 @@
 
 """Utils for database usage."""
 
+import base64
+import datetime
 import functools
 import inspect
 import logging
 import netaddr
 import re
+import simplejson as json
 
+from sqlalchemy import and_
+from sqlalchemy import DateTime
+from sqlalchemy import false
 from sqlalchemy import or_
+from sqlalchemy.orm import defer
+from sqlalchemy.orm import undefer
+from sqlalchemy import Text
+from sqlalchemy import type_coerce
 
 from compass.db import exception
 from compass.db import models
@@ -77,6 +87,121 @@ def _between_condition(col_attr, value):
     return None
 
 
+def _is_json_column(col_attr):
+    column_property = getattr(col_attr, 'property', None)
+    columns = getattr(column_property, 'columns', [])
+    return (
+        len(columns) == 1 and
+        isinstance(columns[0].type, models.JSONEncoded)
+    )
+
+
+def _json_like_patterns(value):
+    """Get json texts which should be in the json text containing value.
+
+    Each item is a list of alternative json texts of a scalar in value.
+    """
+    if isinstance(value, dict):
+        patterns = []
+        for key, item in value.items():
+            if isinstance(key, basestring):
+                patterns.append([json.dumps(key)])
+            patterns.extend(_json_like_patterns(item))
+        return patterns
+    if isinstance(value, list):
+        patterns = []
+        for item in value:
+            patterns.extend(_json_like_patterns(item))
+        return patterns
+    if isinstance(value, basestring):
+        return [[json.dumps(value)]]
+    if isinstance(value, (int, long)):
+        # 0 and 1 are equal to False and True in python.
+        if value in [0, 1]:
+            return [[json.dumps(int(value)), json.dumps(bool(value))]]
+        return [[json.dumps(value)]]
+    return []
+
+
+def _json_like_condition(col_attr, value):
+    patterns = _json_like_patterns(value)
+    if not patterns:
+        return None
+    return and_(*[
+        or_(*[
+            type_coerce(col_attr, Text).like(
+                '%%%s%%' % re.sub(r'([/%_])', r'/\1', text),
+                escape='/'
+            )
+            for text in texts
+        ])
+        for texts in patterns
+    ])
+
+
+def json_contains_condition(col_attr, json_filter):
+    """Translate resp_eq or resp_in filter on json column to sql.
+
+    The condition is only a prefilter which matches the json text
+    of the column, the rows it returns still need to be checked by
+    general_filter_callback. None is returned if the filter can not
+    be translated.
+    """
+    if not _is_json_column(col_attr):
+        return None
+    if 'resp_eq' in json_filter:
+        return _json_like_condition(col_attr, json_filter['resp_eq'])
+    if 'resp_in' in json_filter and json_filter['resp_in']:
+        conditions = []
+        for value in json_filter['resp_in']:
+            condition = _json_like_condition(col_attr, value)
+            if condition is None:
+                return None
+            conditions.append(condition)
+        return or_(*conditions)
+    return None
+
+
+def model_load(query, load_profile):
+    """Apply eager load options to the query.
+
+    load_profile is a list of sqlalchemy loader options, e.g.
+    joinedload or subqueryload, which should cover the relationships
+    accessed when converting the queried objects to dict.
+    """
+    if not load_profile:
+        return query
+    return query.options(*load_profile)
+
+
+def model_defer(query, model, fields):
+    """Defer loading json columns which are not in fields.
+
+    json columns are the most expensive to load and decode.
+    Other columns are still loaded since they may be used to
+    compute the fields. Columns deferred in the model are loaded
+    with the query if they are in fields. A column is in fields by
+    its attribute key or its column name, e.g. _roles by roles.
+    """
+    if not fields:
+        return query
+    options = []
+    for prop in model.__mapper__.column_attrs:
+        key = prop.key
+        names = set([key] + [column.name for column in prop.columns])
+        if names & set(fields):
+            if prop.deferred:
+                options.append(undefer(key))
+        elif any(
+            isinstance(column.type, models.JSONEncoded)
+            for column in prop.columns
+        ):
+            options.append(defer(key))
+    if not options:
+        return query
+    return query.options(*options)
+
+
 def model_order_by(query, model, order_by):
     if not order_by:
         return query
@@ -100,6 +225,127 @@ def model_order_by(query, model, order_by):
     return query.order_by(*order_by_cols)
 
 
+PAGINATION_FIELDS = ['limit', 'cursor']
+LIST_OPTION_FIELDS = PAGINATION_FIELDS + ['fields']
+
+
+class ListPage(list):
+    """A page of listed objects.
+
+    next_cursor is the cursor to list the next page,
+    or None if there is no more page.
+    """
+    def __init__(self, items, next_cursor=None):
+        super(ListPage, self).__init__(items)
+        self.next_cursor = next_cursor
+
+
+def copy_page(data, items):
+    """Keep the next cursor of data when it is converted to items."""
+    if isinstance(data, ListPage):
+        return ListPage(items, data.next_cursor)
+    return items
+
+
+CURSOR_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def _get_keyset(model, order_by):
+    """Get (column, is_desc) of order_by appended by the primary key."""
+    keyset = []
+    for key in order_by:
+        if isinstance(key, tuple):
+            key, is_desc = key
+        else:
+            is_desc = False
+        if isinstance(key, basestring):
+            if hasattr(model, key):
+                col_attr = getattr(model, key)
+            else:
+                continue
+        else:
+            col_attr = key
+        keyset.append((col_attr, is_desc))
+    mapper = model.__mapper__
+    for column in mapper.primary_key:
+        keyset.append((
+            getattr(model, mapper.get_property_by_column(column).key),
+            False
+        ))
+    return keyset
+
+
+def _encode_cursor(keyset, db_object):
+    values = []
+    for col_attr, _ in keyset:
+        value = getattr(db_object, col_attr.key)
+        if isinstance(value, datetime.datetime):
+            value = value.strftime(CURSOR_DATETIME_FORMAT)
+        values.append(value)
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def _decode_cursor(keyset, cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        if not isinstance(values, list) or len(values) != len(keyset):
+            raise ValueError('cursor %s does not match keyset' % values)
+        for i, (col_attr, _) in enumerate(keyset):
+            if (
+                isinstance(col_attr.type, DateTime) and
+                isinstance(values[i], basestring)
+            ):
+                values[i] = datetime.datetime.strptime(
+                    values[i], CURSOR_DATETIME_FORMAT
+                )
+    except Exception as error:
+        logging.exception(error)
+        raise exception.InvalidParameter(
+            'cursor %s is invalid' % cursor
+        )
+    return values
+
+
+def _is_nullable(col_attr):
+    columns = getattr(getattr(col_attr, 'property', None), 'columns', None)
+    if columns:
+        return any(
+            getattr(column, 'nullable', True) for column in columns
+        )
+    return getattr(col_attr, 'nullable', True)
+
+
+def _keyset_after_condition(col_attr, is_desc, value):
+    """Get condition of the rows after value in order of col_attr.
+
+    Nulls are ordered before other values, as mysql and sqlite do.
+    """
+    if not _is_nullable(col_attr):
+        if is_desc:
+            return col_attr < value
+        return col_attr > value
+    if value is None:
+        if is_desc:
+            return false()
+        return col_attr.isnot(None)
+    if is_desc:
+        return or_(col_attr < value, col_attr.is_(None))
+    return col_attr > value
+
+
+def model_keyset_filter(query, keyset, cursor):
+    """Filter the query to the rows after the cursor in keyset order."""
+    values = _decode_cursor(keyset, cursor)
+    conditions = []
+    for i, (col_attr, is_desc) in enumerate(keyset):
+        equals = [
+            keyset[j][0] == values[j] for j in range(i)
+        ]
+        after = _keyset_after_condition(col_attr, is_desc, values[i])
+        conditions.append(and_(*(equals + [after])))
+    return query.filter(or_(*conditions))
+
+
 def model_filter(query, model, **filters):
     for key, value in filters.items():
         if isinstance(key, basestring):
@@ -169,6 +415,10 @@ def model_filter(query, model, **filters):
                     query, col_attr, value['between'],
                     _between_condition
                 )
+            if 'resp_eq' in value or 'resp_in' in value:
+                condition = json_contains_condition(col_attr, value)
+                if condition is not None:
+                    query = query.filter(condition)
         else:
             query = query.filter(col_attr == value)
 
@@ -189,10 +439,10 @@ def replace_output(**output_mapping):
 def _replace_output(data, **output_mapping):
     """Helper to replace output data."""
     if isinstance(data, list):
-        return [
+        return copy_page(data, [
             _replace_output(item, **output_mapping)
             for item in data
-        ]
+        ])
     info = {}
     for key, value in data.items():
         if key in output_mapping:
@@ -209,11 +459,21 @@ def _replace_output(data, **output_mapping):
 
 
 def wrap_to_dict(support_keys=[], **filters):
+    """Wrap the returned db objects into dict of support_keys.
+
+    If the function is called with fields, only support_keys in fields
+    are kept. Db objects only compute the kept keys in to_dict.
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            fields = kwargs.get('fields')
+            if fields:
+                keys = [key for key in support_keys if key in fields]
+            else:
+                keys = support_keys
             return _wrapper_dict(
-                func(*args, **kwargs), support_keys, **filters
+                func(*args, **kwargs), keys, **filters
             )
         return wrapper
     return decorator
@@ -222,12 +482,12 @@ def wrap_to_dict(support_keys=[], **filters):
 def _wrapper_dict(data, support_keys, **filters):
     """Helper for warpping db object into dictionary."""
     if isinstance(data, list):
-        return [
+        return copy_page(data, [
             _wrapper_dict(item, support_keys, **filters)
             for item in data
-        ]
+        ])
     if isinstance(data, models.HelperMixin):
-        data = data.to_dict()
+        data = data.to_dict(support_keys)
     if not isinstance(data, dict):
         raise exception.InvalidResponse(
             'response %s type is not dict' % data
@@ -393,13 +653,24 @@ def output_filters(missing_ok=False, **filter_callbacks):
         @functools.wraps(func)
         def wrapper(*args, **filters):
             filtered_obj_list = []
+            fields = filters.get('fields')
+            extra_fields = []
+            if fields:
+                # keys to filter on should be returned by func.
+                extra_fields = [
+                    key for key in filter_callbacks
+                    if key in filters and key not in fields
+                ]
+                filters = dict(filters, fields=fields + extra_fields)
             obj_list = func(*args, **filters)
             for obj in obj_list:
                 if filter_output(
                     filter_callbacks, filters, obj, missing_ok
                 ):
+                    for key in extra_fields:
+                        obj.pop(key, None)
                     filtered_obj_list.append(obj)
-            return filtered_obj_list
+            return copy_page(obj_list, filtered_obj_list)
         return wrapper
     return decorator
 
@@ -457,14 +728,17 @@ def output_validates(**kwargs_validators):
     return decorator
 
 
-def get_db_object(session, table, exception_when_missing=True, **kwargs):
+def get_db_object(
+    session, table, exception_when_missing=True, load_profile=[], **kwargs
+):
     """Get db object."""
     with session.begin(subtransactions=True):
         logging.debug(
             'session %s get db object %s from table %s',
             id(session), kwargs, table.__name__)
         db_object = model_filter(
-            model_query(session, table), table, **kwargs
+            model_load(model_query(session, table), load_profile),
+            table, **kwargs
         ).first()
         logging.debug(
             'session %s got db object %s', id(session), db_object
@@ -482,6 +756,25 @@ def get_db_object(session, table, exception_when_missing=True, **kwargs):
         )
 
 
+# constructor arg names and required arg names of tables.
+INIT_ARGS = {}
+ON_CONFLICT_POLICIES = ['error', 'ignore', 'update']
+# max number of bind params in one query of existing db objects.
+BULK_QUERY_SIZE = 500
+
+
+def _get_init_args(table):
+    """Get constructor arg names and required arg names of table."""
+    if table not in INIT_ARGS:
+        argspec = inspect.getargspec(table.__init__)
+        arg_names = argspec.args[1:]
+        arg_defaults = argspec.defaults or []
+        INIT_ARGS[table] = (
+            arg_names, arg_names[:len(arg_names) - len(arg_defaults)]
+        )
+    return INIT_ARGS[table]
+
+
 def add_db_object(session, table, exception_when_existing=True,
                   *args, **kwargs):
     """Create db object."""
@@ -489,13 +782,9 @@ def add_db_object(session, table, exception_when_existing=True,
         logging.debug(
             'session %s add object %s atributes %s to table %s',
             id(session), args, kwargs, table.__name__)
-        argspec = inspect.getargspec(table.__init__)
-        arg_names = argspec.args[1:]
-        arg_defaults = argspec.defaults
-        if not arg_defaults:
-            arg_defaults = []
+        arg_names, required_arg_names = _get_init_args(table)
         if not (
-            len(arg_names) - len(arg_defaults) <= len(args) <= len(arg_names)
+            len(required_arg_names) <= len(args) <= len(arg_names)
         ):
             raise exception.InvalidParameter(
                 'arg names %s does not match arg values %s' % (
@@ -531,22 +820,160 @@ def add_db_object(session, table, exception_when_existing=True,
         return db_object
 
 
-def list_db_objects(session, table, order_by=[], **filters):
-    """List db objects."""
+def _get_existing_db_objects(session, table, key_names, keys):
+    """Get db objects matching keys in bulk, indexed by key."""
+    db_objects = {}
+    chunk_size = max(1, BULK_QUERY_SIZE / len(key_names))
+    for i in range(0, len(keys), chunk_size):
+        chunk = keys[i:i + chunk_size]
+        if len(key_names) == 1:
+            condition = getattr(table, key_names[0]).in_(
+                [key[0] for key in chunk]
+            )
+        else:
+            condition = or_(*[
+                and_(*[
+                    getattr(table, key_name) == value
+                    for key_name, value in zip(key_names, key)
+                ])
+                for key in chunk
+            ])
+        for db_object in session.query(table).filter(condition):
+            db_objects[tuple(
+                getattr(db_object, key_name) for key_name in key_names
+            )] = db_object
+    return db_objects
+
+
+def add_db_objects(session, table, rows, on_conflict='error'):
+    """Create db objects in bulk.
+
+    Each row is a dict. Items keyed by the constructor args of table
+    identify the db object, other items are set as its attributes.
+    Existing db objects are queried in bulk and on_conflict decides
+    what to do with them: error raises DuplicatedRecord, ignore keeps
+    them unchanged and update sets the other items on them.
+    Db objects are flushed once and validated together.
+    They are returned in the order of rows.
+    """
+    if on_conflict not in ON_CONFLICT_POLICIES:
+        raise exception.InvalidParameter(
+            'on conflict %s is not in %s' % (
+                on_conflict, ON_CONFLICT_POLICIES
+            )
+        )
+    with session.begin(subtransactions=True):
+        logging.debug(
+            'session %s add %s objects to table %s',
+            id(session), len(rows), table.__name__
+        )
+        arg_names, required_arg_names = _get_init_args(table)
+        row_keys = []
+        group_keys = {}
+        for row in rows:
+            missing_arg_names = [
+                arg_name for arg_name in required_arg_names
+                if arg_name not in row
+            ]
+            if missing_arg_names:
+                raise exception.InvalidParameter(
+                    'arg names %s are missing in %s' % (
+                        missing_arg_names, row
+                    )
+                )
+            key_names = tuple(
+                arg_name for arg_name in arg_names if arg_name in row
+            )
+            key = tuple(row[key_name] for key_name in key_names)
+            row_keys.append((key_names, key))
+            if key_names:
+                group_keys.setdefault(key_names, []).append(key)
+        existing_db_objects = {}
+        for key_names, keys in group_keys.items():
+            existing_db_objects[key_names] = _get_existing_db_objects(
+                session, table, key_names, keys
+            )
+
+        db_objects = []
+        changed_db_objects = []
+        changed_ids = set()
+        for row, (key_names, key) in zip(rows, row_keys):
+            group_db_objects = existing_db_objects.setdefault(key_names, {})
+            db_object = group_db_objects.get(key) if key_names else None
+            if db_object is None:
+                db_object = table(**dict(zip(key_names, key)))
+                session.add(db_object)
+                if key_names:
+                    group_db_objects[key] = db_object
+            elif on_conflict == 'error':
+                raise exception.DuplicatedRecord(
+                    '%s exists in table %s' % (
+                        dict(zip(key_names, key)), table.__name__
+                    )
+                )
+            elif on_conflict == 'ignore':
+                db_objects.append(db_object)
+                continue
+            for name, value in row.items():
+                if name not in key_names:
+                    setattr(db_object, name, value)
+            db_objects.append(db_object)
+            if id(db_object) not in changed_ids:
+                changed_ids.add(id(db_object))
+                changed_db_objects.append(db_object)
+
+        session.flush()
+        exceptions = []
+        for db_object in changed_db_objects:
+            db_object.initialize()
+            try:
+                db_object.validate()
+            except exception.DatabaseException as error:
+                exceptions.append(error)
+        if len(exceptions) == 1:
+            raise exceptions[0]
+        if exceptions:
+            raise exception.MultiDatabaseException(exceptions)
+        logging.debug(
+            'session %s %s db objects added to table %s',
+            id(session), len(db_objects), table.__name__
+        )
+        return db_objects
+
+
+def list_db_objects(
+    session, table, order_by=[], load_profile=[],
+    limit=None, cursor=None, fields=None, conditions=[], **filters
+):
+    """List db objects.
+
+    If limit or cursor is given, db objects are listed in pages of
+    at most limit db objects, ordered by order_by and the primary key.
+    The returned ListPage carries the cursor of the next page.
+    If fields is given, json columns not in fields are not loaded.
+    conditions are extra sqlalchemy conditions the db objects match.
+    """
     with session.begin(subtransactions=True):
         logging.debug(
             'session %s list db objects by filters %s in table %s',
             id(session), filters, table.__name__
         )
-        db_objects = model_order_by(
-            model_filter(
-                model_query(session, table),
-                table,
-                **filters
+        query = model_filter(
+            model_defer(
+                model_load(model_query(session, table), load_profile),
+                table, fields
             ),
             table,
-            order_by
-        ).all()
+            **filters
+        )
+        if conditions:
+            query = query.filter(and_(*conditions))
+        if limit is None and cursor is None:
+            db_objects = model_order_by(query, table, order_by).all()
+        else:
+            db_objects = _list_db_objects_page(
+                query, table, order_by, limit, cursor
+            )
         logging.debug(
             'session %s got listed db objects: %s',
             id(session), db_objects
@@ -554,6 +981,28 @@ def list_db_objects(session, table, order_by=[], **filters):
         return db_objects
 
 
+def _list_db_objects_page(query, table, order_by, limit, cursor):
+    if limit is not None and (
+        not isinstance(limit, (int, long)) or limit <= 0
+    ):
+        raise exception.InvalidParameter(
+            'limit %r is not a positive integer' % limit
+        )
+    keyset = _get_keyset(table, order_by)
+    if cursor:
+        query = model_keyset_filter(query, keyset, cursor)
+    query = model_order_by(query, table, keyset)
+    if limit is None:
+        return ListPage(query.all())
+    db_objects = query.limit(limit + 1).all()
+    if len(db_objects) <= limit:
+        return ListPage(db_objects)
+    db_objects = db_objects[:limit]
+    return ListPage(
+        db_objects, _encode_cursor(keyset, db_objects[-1])
+    )
+
+
 def del_db_objects(session, table, **filters):
     """delete db objects."""
     with session.begin(subtransactions=True):
@@ -612,6 +1061,30 @@ def update_db_object(session, db_object, **kwargs):
         return db_object
 
 
+def bulk_update_db_objects(session, updates):
+    """Update db objects with one flush.
+
+    :param updates: list of (db_object, dict of attributes to set).
+    """
+    with session.begin(subtransactions=True):
+        logging.debug(
+            'session %s bulk update %s db objects',
+            id(session), len(updates)
+        )
+        for db_object, values in updates:
+            for key, value in values.items():
+                setattr(db_object, key, value)
+        session.flush()
+        for db_object, _ in updates:
+            db_object.update()
+            db_object.validate()
+        logging.debug(
+            'session %s %s db objects updated',
+            id(session), len(updates)
+        )
+        return [db_object for db_object, _ in updates]
+
+
 def del_db_object(session, db_object):
     """Delete db object."""
     with session.begin(subtransactions=True):
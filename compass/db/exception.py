@@ -92,14 +92,11 @@ class MultiDatabaseException(DatabaseException):
     def __init__(self, exceptions):
         super(MultiDatabaseException, self).__init__('multi exceptions')
         self.exceptions = exceptions
+        self.traceback = '\n'.join(
+            exception.traceback for exception in exceptions
+        )
         self.status_code = 400
 
-    @property
-    def traceback(self):
-        tracebacks = []
-        for exception in self.exceptions:
-            tracebacks.append(exception.trackback)
-
     def to_dict(self):
         dict_info = super(MultiDatabaseException, self).to_dict()
         dict_info.update({
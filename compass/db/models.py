@@ -28,9 +28,12 @@ from sqlalchemy import DateTime
 from sqlalchemy import Enum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.ext.mutable import Mutable
 from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import String
 from sqlalchemy import Table
@@ -63,12 +66,126 @@ class JSONEncoded(TypeDecorator):
         return value
 
 
+def _is_merge_changed(lhs, rhs):
+    """Check if util.merge_dict(lhs, rhs) changes lhs."""
+    if not isinstance(lhs, dict) or not isinstance(rhs, dict):
+        return lhs != rhs
+    for key, value in rhs.items():
+        if key not in lhs or _is_merge_changed(lhs[key], value):
+            return True
+    return False
+
+
+class MutableJSONDict(Mutable, dict):
+    """Json dict which marks its column changed on real changes.
+
+    Only changes of the top level items are tracked. Nested items
+    should be changed by merge or update, so unchanged json values
+    are not encoded and written again on flush.
+    """
+
+    @classmethod
+    def coerce(cls, key, value):
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict):
+            return cls(value)
+        raise exception.InvalidParameter(
+            '%s value %r is not a dict' % (key, value)
+        )
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        dict.update(self, state)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self.changed()
+
+    def clear(self):
+        if self:
+            dict.clear(self)
+            self.changed()
+
+    def pop(self, key, *args):
+        if key not in self:
+            return dict.pop(self, key, *args)
+        value = dict.pop(self, key)
+        self.changed()
+        return value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.get(self, key)
+
+    def update(self, *args, **kwargs):
+        value = dict(*args, **kwargs)
+        changed = any(
+            key not in self or self[key] != item
+            for key, item in value.items()
+        )
+        dict.update(self, value)
+        if changed:
+            self.changed()
+
+    def merge(self, value):
+        """Merge nested dict value into self like util.merge_dict."""
+        if _is_merge_changed(self, value):
+            util.merge_dict(self, value)
+
+
+# json dict columns tracking in place changes of their values.
+JSONEncodedDict = MutableJSONDict.as_mutable(JSONEncoded)
+
+
+def _patch_json_dict(obj, key, value):
+    """Merge value into json dict column key of obj."""
+    json_dict = getattr(obj, key)
+    if isinstance(json_dict, MutableJSONDict):
+        json_dict.merge(value)
+    else:
+        setattr(
+            obj, key, util.merge_dict(copy.deepcopy(json_dict), value)
+        )
+
+
+def _put_json_dict(obj, key, value):
+    """Update json dict column key of obj with top level items of value."""
+    json_dict = getattr(obj, key)
+    if isinstance(json_dict, MutableJSONDict):
+        json_dict.update(value)
+    else:
+        json_dict = dict(json_dict or {})
+        json_dict.update(value)
+        setattr(obj, key, json_dict)
+
+
 class TimestampMixin(object):
     created_at = Column(DateTime, default=lambda: datetime.datetime.now())
     updated_at = Column(DateTime, default=lambda: datetime.datetime.now(),
                         onupdate=lambda: datetime.datetime.now())
 
 
+def in_fields(fields, *keys):
+    """Check if any of keys is requested in fields.
+
+    fields None means all keys are requested.
+    """
+    if fields is None:
+        return True
+    for key in keys:
+        if key in fields:
+            return True
+    return False
+
+
 class HelperMixin(object):
     def initialize(self):
         self.update()
@@ -106,16 +223,25 @@ class HelperMixin(object):
                     )
                 )
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
+        """Convert to dict.
+
+        :param fields: keys to convert, None for all keys.
+                       The returned dict may have other keys too.
+        """
         keys = self.__mapper__.columns.keys()
         dict_info = {}
         for key in keys:
             if key.startswith('_'):
                 continue
+            if not in_fields(fields, key):
+                continue
             value = getattr(self, key)
             if value is not None:
                 if isinstance(value, datetime.datetime):
                     value = util.format_datetime(value)
+                elif isinstance(value, MutableJSONDict):
+                    value = dict(value)
                 dict_info[key] = value
         return dict_info
 
@@ -273,14 +399,14 @@ class MetadataMixin(HelperMixin):
                 'autofill callback %s is not callable' % value
             )
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
         self_dict_info = {}
         if self.field:
-            self_dict_info.update(self.field.to_dict())
+            self_dict_info.update(self.field.to_dict(fields))
         else:
             self_dict_info['field_type_data'] = 'dict'
             self_dict_info['field_type'] = dict
-        self_dict_info.update(super(MetadataMixin, self).to_dict())
+        self_dict_info.update(super(MetadataMixin, self).to_dict(fields))
         validator = self.validator
         if validator:
             self_dict_info['validator'] = validator
@@ -382,8 +508,8 @@ class FieldMixin(HelperMixin):
                 '%s is not callable' % value
             )
 
-    def to_dict(self):
-        dict_info = super(FieldMixin, self).to_dict()
+    def to_dict(self, fields=None):
+        dict_info = super(FieldMixin, self).to_dict(fields)
         dict_info['field_type'] = self.field_type
         validator = self.validator
         if validator:
@@ -479,6 +605,7 @@ class HostNetwork(BASE, TimestampMixin, HelperMixin):
 
     __table_args__ = (
         UniqueConstraint('host_id', 'interface', name='constraint'),
+        Index('host_network_subnet_id', 'subnet_id'),
     )
 
     def __init__(self, host_id, interface, **kwargs):
@@ -527,12 +654,16 @@ class HostNetwork(BASE, TimestampMixin, HelperMixin):
                 )
             )
 
-    def to_dict(self):
-        dict_info = super(HostNetwork, self).to_dict()
-        dict_info['ip'] = self.ip
-        dict_info['interface'] = self.interface
-        dict_info['netmask'] = self.netmask
-        dict_info['subnet'] = self.subnet.subnet
+    def to_dict(self, fields=None):
+        dict_info = super(HostNetwork, self).to_dict(fields)
+        if in_fields(fields, 'ip'):
+            dict_info['ip'] = self.ip
+        if in_fields(fields, 'interface'):
+            dict_info['interface'] = self.interface
+        if in_fields(fields, 'netmask'):
+            dict_info['netmask'] = self.netmask
+        if in_fields(fields, 'subnet'):
+            dict_info['subnet'] = self.subnet.subnet
         return dict_info
 
 
@@ -604,6 +735,10 @@ class ClusterHostState(BASE, StateMixin):
         ),
         primary_key=True
     )
+    __table_args__ = (
+        Index('clusterhost_state_state', 'state'),
+        Index('clusterhost_state_updated_at', 'updated_at'),
+    )
 
     def __str__(self):
         return 'ClusterHostState[%s state %s percentage %s]' % (
@@ -642,9 +777,13 @@ class ClusterHost(BASE, TimestampMixin, HelperMixin):
     )
     _roles = Column('roles', JSONEncoded, default=[])
     config_step = Column(String(80), default='')
-    package_config = Column(JSONEncoded, default={})
+    package_config = deferred(
+        Column(JSONEncodedDict, default={}), group='config'
+    )
     config_validated = Column(Boolean, default=False)
-    deployed_package_config = Column(JSONEncoded, default={})
+    deployed_package_config = deferred(
+        Column(JSONEncodedDict, default={}), group='config'
+    )
 
     log_history = relationship(
         ClusterHostLogHistory,
@@ -655,6 +794,7 @@ class ClusterHost(BASE, TimestampMixin, HelperMixin):
 
     __table_args__ = (
         UniqueConstraint('cluster_id', 'host_id', name='constraint'),
+        Index('clusterhost_host_id', 'host_id'),
     )
 
     state = relationship(
@@ -694,8 +834,7 @@ class ClusterHost(BASE, TimestampMixin, HelperMixin):
 
     @patched_package_config.setter
     def patched_package_config(self, value):
-        package_config = copy.deepcopy(self.package_config)
-        self.package_config = util.merge_dict(package_config, value)
+        _patch_json_dict(self, 'package_config', value)
         logging.debug(
             'patch clusterhost %s package_config: %s',
             self.clusterhost_id, value
@@ -708,9 +847,7 @@ class ClusterHost(BASE, TimestampMixin, HelperMixin):
 
     @put_package_config.setter
     def put_package_config(self, value):
-        package_config = copy.deepcopy(self.package_config)
-        package_config.update(value)
-        self.package_config = package_config
+        _put_json_dict(self, 'package_config', value)
         logging.debug(
             'put clusterhost %s package_config: %s',
             self.clusterhost_id, value
@@ -856,23 +993,26 @@ class ClusterHost(BASE, TimestampMixin, HelperMixin):
             host_state['state'] = 'INSTALLING'
         return host_state
 
-    def to_dict(self):
-        dict_info = self.host.to_dict()
-        dict_info.update(super(ClusterHost, self).to_dict())
-        state_dict = self.state_dict()
-        dict_info.update({
-            'distributed_system_name': self.distributed_system_name,
-            'distributed_system_installed': self.distributed_system_installed,
-            'reinstall_distributed_system': self.reinstall_distributed_system,
-            'owner': self.owner,
-            'clustername': self.clustername,
-            'name': self.name,
-            'state': state_dict['state']
-        })
-        roles = self.roles
-        dict_info['roles'] = [
-            role.to_dict() for role in roles
-        ]
+    def to_dict(self, fields=None):
+        dict_info = self.host.to_dict(fields)
+        dict_info.update(super(ClusterHost, self).to_dict(fields))
+        properties = {
+            'distributed_system_name': lambda: self.distributed_system_name,
+            'distributed_system_installed': (
+                lambda: self.distributed_system_installed
+            ),
+            'reinstall_distributed_system': (
+                lambda: self.reinstall_distributed_system
+            ),
+            'owner': lambda: self.owner,
+            'clustername': lambda: self.clustername,
+            'name': lambda: self.name,
+            'state': lambda: self.state_dict()['state'],
+            'roles': lambda: [role.to_dict() for role in self.roles]
+        }
+        for key, get_value in properties.items():
+            if in_fields(fields, key):
+                dict_info[key] = get_value()
         return dict_info
 
 
@@ -885,6 +1025,10 @@ class HostState(BASE, StateMixin):
         ForeignKey('host.id', onupdate='CASCADE', ondelete='CASCADE'),
         primary_key=True
     )
+    __table_args__ = (
+        Index('host_state_state', 'state'),
+        Index('host_state_updated_at', 'updated_at'),
+    )
 
     def __str__(self):
         return 'HostState[%s state %s percentage %s]' % (
@@ -925,9 +1069,13 @@ class Host(BASE, TimestampMixin, HelperMixin):
     name = Column(String(80), unique=True, nullable=True)
     os_id = Column(Integer, ForeignKey('os.id'))
     config_step = Column(String(80), default='')
-    os_config = Column(JSONEncoded, default={})
+    os_config = deferred(
+        Column(JSONEncodedDict, default={}), group='config'
+    )
     config_validated = Column(Boolean, default=False)
-    deployed_os_config = Column(JSONEncoded, default={})
+    deployed_os_config = deferred(
+        Column(JSONEncodedDict, default={}), group='config'
+    )
     os_name = Column(String(80))
     creator_id = Column(Integer, ForeignKey('user.id'))
     owner = Column(String(80))
@@ -994,8 +1142,7 @@ class Host(BASE, TimestampMixin, HelperMixin):
 
     @patched_os_config.setter
     def patched_os_config(self, value):
-        os_config = copy.deepcopy(self.os_config)
-        self.os_config = util.merge_dict(os_config, value)
+        _patch_json_dict(self, 'os_config', value)
         logging.debug('patch host os config in %s: %s', self.id, value)
         self.config_validated = False
 
@@ -1005,9 +1152,7 @@ class Host(BASE, TimestampMixin, HelperMixin):
 
     @put_os_config.setter
     def put_os_config(self, value):
-        os_config = copy.deepcopy(self.os_config)
-        os_config.update(value)
-        self.os_config = os_config
+        _put_json_dict(self, 'os_config', value)
         logging.debug('put host os config in %s: %s', self.id, value)
         self.config_validated = False
 
@@ -1068,27 +1213,34 @@ class Host(BASE, TimestampMixin, HelperMixin):
     def state_dict(self):
         return self.state.to_dict()
 
-    def to_dict(self):
-        dict_info = self.machine.to_dict()
-        dict_info.update(super(Host, self).to_dict())
-        state_dict = self.state_dict()
+    def _mgmt_ip(self):
         ip = None
         for host_network in self.host_networks:
             if host_network.is_mgmt:
                 ip = host_network.ip
-        dict_info.update({
-            'machine_id': self.machine.id,
-            'os_installed': self.os_installed,
-            'hostname': self.hostname,
-            'ip': ip,
-            'networks': [
+        return ip
+
+    def to_dict(self, fields=None):
+        dict_info = self.machine.to_dict(fields)
+        dict_info.update(super(Host, self).to_dict(fields))
+        properties = {
+            'machine_id': lambda: self.machine.id,
+            'os_installed': lambda: self.os_installed,
+            'hostname': lambda: self.hostname,
+            'ip': self._mgmt_ip,
+            'networks': lambda: [
                 host_network.to_dict()
                 for host_network in self.host_networks
             ],
-            'os_installer': self.os_installer.to_dict(),
-            'clusters': [cluster.to_dict() for cluster in self.clusters],
-            'state': state_dict['state']
-        })
+            'os_installer': lambda: self.os_installer.to_dict(),
+            'clusters': lambda: [
+                cluster.to_dict() for cluster in self.clusters
+            ],
+            'state': lambda: self.state_dict()['state']
+        }
+        for key, get_value in properties.items():
+            if in_fields(fields, key):
+                dict_info[key] = get_value()
         return dict_info
 
 
@@ -1123,8 +1275,10 @@ class ClusterState(BASE, StateMixin):
             self.id, self.state, self.percentage
         )
 
-    def to_dict(self):
-        dict_info = super(ClusterState, self).to_dict()
+    def to_dict(self, fields=None):
+        dict_info = super(ClusterState, self).to_dict(fields)
+        if not in_fields(fields, 'status'):
+            return dict_info
         dict_info['status'] = {
             'total_hosts': self.total_hosts,
             'installing_hosts': self.installing_hosts,
@@ -1205,10 +1359,10 @@ class Cluster(BASE, TimestampMixin, HelperMixin):
     distributed_system_name = Column(
         String(80), nullable=True
     )
-    os_config = Column(JSONEncoded, default={})
-    package_config = Column(JSONEncoded, default={})
-    deployed_os_config = Column(JSONEncoded, default={})
-    deployed_package_config = Column(JSONEncoded, default={})
+    os_config = Column(JSONEncodedDict, default={})
+    package_config = Column(JSONEncodedDict, default={})
+    deployed_os_config = Column(JSONEncodedDict, default={})
+    deployed_package_config = Column(JSONEncodedDict, default={})
     config_validated = Column(Boolean, default=False)
     adapter_id = Column(Integer, ForeignKey('adapter.id'))
     adapter_name = Column(String(80))
@@ -1332,8 +1486,7 @@ class Cluster(BASE, TimestampMixin, HelperMixin):
 
     @patched_os_config.setter
     def patched_os_config(self, value):
-        os_config = copy.deepcopy(self.os_config)
-        self.os_config = util.merge_dict(os_config, value)
+        _patch_json_dict(self, 'os_config', value)
         logging.debug('patch cluster %s os config: %s', self.id, value)
         self.config_validated = False
 
@@ -1343,9 +1496,7 @@ class Cluster(BASE, TimestampMixin, HelperMixin):
 
     @put_os_config.setter
     def put_os_config(self, value):
-        os_config = copy.deepcopy(self.os_config)
-        os_config.update(value)
-        self.os_config = os_config
+        _put_json_dict(self, 'os_config', value)
         logging.debug('put cluster %s os config: %s', self.id, value)
         self.config_validated = False
 
@@ -1355,8 +1506,7 @@ class Cluster(BASE, TimestampMixin, HelperMixin):
 
     @patched_package_config.setter
     def patched_package_config(self, value):
-        package_config = copy.deepcopy(self.package_config)
-        self.package_config = util.merge_dict(package_config, value)
+        _patch_json_dict(self, 'package_config', value)
         logging.debug('patch cluster %s package config: %s', self.id, value)
         self.config_validated = False
 
@@ -1366,9 +1516,7 @@ class Cluster(BASE, TimestampMixin, HelperMixin):
 
     @put_package_config.setter
     def put_package_config(self, value):
-        package_config = dict(self.package_config)
-        package_config.update(value)
-        self.package_config = package_config
+        _put_json_dict(self, 'package_config', value)
         logging.debug('put cluster %s package config: %s', self.id, value)
         self.config_validated = False
 
@@ -1379,12 +1527,13 @@ class Cluster(BASE, TimestampMixin, HelperMixin):
     def state_dict(self):
         return self.state.to_dict()
 
-    def to_dict(self):
-        dict_info = super(Cluster, self).to_dict()
-        dict_info['distributed_system_installed'] = (
-            self.distributed_system_installed
-        )
-        if self.flavor:
+    def to_dict(self, fields=None):
+        dict_info = super(Cluster, self).to_dict(fields)
+        if in_fields(fields, 'distributed_system_installed'):
+            dict_info['distributed_system_installed'] = (
+                self.distributed_system_installed
+            )
+        if in_fields(fields, 'flavor') and self.flavor:
             dict_info['flavor'] = self.flavor.to_dict()
         return dict_info
 
@@ -1417,9 +1566,9 @@ class UserPermission(BASE, HelperMixin, TimestampMixin):
     def name(self):
         return self.permission.name
 
-    def to_dict(self):
-        dict_info = self.permission.to_dict()
-        dict_info.update(super(UserPermission, self).to_dict())
+    def to_dict(self, fields=None):
+        dict_info = self.permission.to_dict(fields)
+        dict_info.update(super(UserPermission, self).to_dict(fields))
         return dict_info
 
 
@@ -1459,6 +1608,12 @@ class UserToken(BASE, HelperMixin):
     expire_timestamp = Column(
         DateTime, default=lambda: datetime.datetime.now()
     )
+    __table_args__ = (
+        Index(
+            'user_token_user_id_expire_timestamp',
+            'user_id', 'expire_timestamp'
+        ),
+    )
 
     def __init__(self, token, **kwargs):
         self.token = token
@@ -1483,6 +1638,10 @@ class UserLog(BASE, HelperMixin):
     )
     action = Column(Text)
     timestamp = Column(DateTime, default=lambda: datetime.datetime.now())
+    __table_args__ = (
+        Index('user_log_user_id_timestamp', 'user_id', 'timestamp'),
+        Index('user_log_timestamp', 'timestamp'),
+    )
 
     @hybrid_property
     def user_email(self):
@@ -1564,12 +1723,13 @@ class User(BASE, HelperMixin, TimestampMixin):
 
         return permissions
 
-    def to_dict(self):
-        dict_info = super(User, self).to_dict()
-        dict_info['permissions'] = [
-            permission.to_dict()
-            for permission in self.permissions
-        ]
+    def to_dict(self, fields=None):
+        dict_info = super(User, self).to_dict(fields)
+        if in_fields(fields, 'permissions'):
+            dict_info['permissions'] = [
+                permission.to_dict()
+                for permission in self.permissions
+            ]
         return dict_info
 
 
@@ -1591,6 +1751,8 @@ class SwitchMachine(BASE, HelperMixin, TimestampMixin):
     vlans = Column(JSONEncoded, default=[])
     __table_args__ = (
         UniqueConstraint('switch_id', 'machine_id', name='constraint'),
+        Index('switch_machine_machine_id', 'machine_id'),
+        Index('switch_machine_switch_id_port', 'switch_id', 'port'),
     )
 
     def __init__(self, switch_id, machine_id, **kwargs):
@@ -1718,19 +1880,84 @@ class SwitchMachine(BASE, HelperMixin, TimestampMixin):
                         return denied
         return not unmatched_allowed
 
-    def to_dict(self):
-        dict_info = self.machine.to_dict()
-        dict_info.update(super(SwitchMachine, self).to_dict())
-        dict_info['switch_ip'] = self.switch.ip
+    def to_dict(self, fields=None):
+        dict_info = self.machine.to_dict(fields)
+        dict_info.update(super(SwitchMachine, self).to_dict(fields))
+        if in_fields(fields, 'switch_ip'):
+            dict_info['switch_ip'] = self.switch.ip
         return dict_info
 
 
+class MachineAttribute(BASE, HelperMixin):
+    """Machine tag and location items indexed by key and value."""
+    __tablename__ = 'machine_attribute'
+    NAMESPACES = ['tag', 'location']
+    MAX_KEY_LENGTH = 80
+    MAX_VALUE_LENGTH = 255
+    # mysql indexes a prefix of value to keep the index key within
+    # the 767 bytes limit of innodb, also for utf8mb4.
+    INDEXED_VALUE_LENGTH = 100
+
+    id = Column(Integer, primary_key=True)
+    machine_id = Column(
+        Integer,
+        ForeignKey(
+            'machine.id',
+            onupdate='CASCADE', ondelete='CASCADE'
+        )
+    )
+    namespace = Column(
+        Enum(*NAMESPACES, name='machine_attribute_namespace'),
+        nullable=False
+    )
+    key = Column(String(MAX_KEY_LENGTH), nullable=False)
+    value = Column(String(MAX_VALUE_LENGTH), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            'machine_id', 'namespace', 'key', name='constraint'
+        ),
+        Index(
+            'machine_attribute_namespace_key_value',
+            'namespace', 'key', 'value',
+            mysql_length={'value': INDEXED_VALUE_LENGTH}
+        ),
+    )
+
+    def __init__(self, namespace, key, **kwargs):
+        self.namespace = namespace
+        self.key = key
+        super(MachineAttribute, self).__init__(**kwargs)
+
+    def __str__(self):
+        return 'MachineAttribute[%s:%s.%s]' % (
+            self.machine_id, self.namespace, self.key
+        )
+
+    @classmethod
+    def encode(cls, key, value):
+        """Get the json encoded value stored for the key.
+
+        None is returned if the item can not be indexed.
+        """
+        if not isinstance(key, basestring) or (
+            len(key) > cls.MAX_KEY_LENGTH
+        ):
+            return None
+        if isinstance(value, (dict, list)):
+            return None
+        encoded_value = json.dumps(value)
+        if len(encoded_value) > cls.MAX_VALUE_LENGTH:
+            return None
+        return encoded_value
+
+
 class Machine(BASE, HelperMixin, TimestampMixin):
     """Machine table."""
     __tablename__ = 'machine'
     id = Column(Integer, primary_key=True)
     mac = Column(String(24), unique=True, nullable=False)
-    ipmi_credentials = Column(JSONEncoded, default={})
+    ipmi_credentials = Column(JSONEncodedDict, default={})
     tag = Column(JSONEncoded, default={})
     location = Column(JSONEncoded, default={})
 
@@ -1747,11 +1974,43 @@ class Machine(BASE, HelperMixin, TimestampMixin):
         cascade='all, delete-orphan',
         backref=backref('machine')
     )
+    attributes = relationship(
+        MachineAttribute,
+        passive_deletes=True, passive_updates=True,
+        cascade='all, delete-orphan',
+        backref=backref('machine')
+    )
 
     def __init__(self, mac, **kwargs):
         self.mac = mac
         super(Machine, self).__init__(**kwargs)
 
+    def update(self):
+        self._update_attributes()
+        super(Machine, self).update()
+
+    def _update_attributes(self):
+        """Sync machine attributes with tag and location."""
+        attributes = {}
+        for namespace in MachineAttribute.NAMESPACES:
+            items = getattr(self, namespace)
+            if not isinstance(items, dict):
+                continue
+            for key, value in items.items():
+                encoded_value = MachineAttribute.encode(key, value)
+                if encoded_value is not None:
+                    attributes[(namespace, key)] = encoded_value
+        for attribute in list(self.attributes):
+            attribute_key = (attribute.namespace, attribute.key)
+            if attribute_key in attributes:
+                attribute.value = attributes.pop(attribute_key)
+            else:
+                self.attributes.remove(attribute)
+        for (namespace, key), value in attributes.items():
+            self.attributes.append(
+                MachineAttribute(namespace, key, value=value)
+            )
+
     def __str__(self):
         return 'Machine[%s:%s]' % (self.id, self.mac)
 
@@ -1772,8 +2031,7 @@ class Machine(BASE, HelperMixin, TimestampMixin):
     def patched_ipmi_credentials(self, value):
         if not value:
             return
-        ipmi_credentials = copy.deepcopy(self.ipmi_credentials)
-        self.ipmi_credentials = util.merge_dict(ipmi_credentials, value)
+        _patch_json_dict(self, 'ipmi_credentials', value)
 
     @property
     def patched_tag(self):
@@ -1785,7 +2043,7 @@ class Machine(BASE, HelperMixin, TimestampMixin):
             return
         tag = copy.deepcopy(self.tag)
         tag.update(value)
-        self.tag = value
+        self.tag = tag
 
     @property
     def patched_location(self):
@@ -1799,20 +2057,21 @@ class Machine(BASE, HelperMixin, TimestampMixin):
         location.update(value)
         self.location = location
 
-    def to_dict(self):
+    def to_dict(self, fields=None):
         dict_info = {}
-        dict_info['switches'] = [
-            {
-                'switch_ip': switch_machine.switch_ip,
-                'port': switch_machine.port,
-                'vlans': switch_machine.vlans
-            }
-            for switch_machine in self.switch_machines
-            if not switch_machine.filtered
-        ]
-        if dict_info['switches']:
-            dict_info.update(dict_info['switches'][0])
-        dict_info.update(super(Machine, self).to_dict())
+        if in_fields(fields, 'switches', 'switch_ip', 'port', 'vlans'):
+            dict_info['switches'] = [
+                {
+                    'switch_ip': switch_machine.switch_ip,
+                    'port': switch_machine.port,
+                    'vlans': switch_machine.vlans
+                }
+                for switch_machine in self.switch_machines
+                if not switch_machine.filtered
+            ]
+            if dict_info['switches']:
+                dict_info.update(dict_info['switches'][0])
+        dict_info.update(super(Machine, self).to_dict(fields))
         return dict_info
 
 
@@ -1821,7 +2080,7 @@ class Switch(BASE, HelperMixin, TimestampMixin):
     __tablename__ = 'switch'
     id = Column(Integer, primary_key=True)
     ip_int = Column('ip', BigInteger, unique=True, nullable=False)
-    credentials = Column(JSONEncoded, default={})
+    credentials = Column(JSONEncodedDict, default={})
     vendor = Column(String(256), nullable=True)
     state = Column(Enum('initialized', 'unreachable', 'notsupported',
                         'repolling', 'error', 'under_monitoring',
@@ -1969,8 +2228,7 @@ class Switch(BASE, HelperMixin, TimestampMixin):
     def patched_credentials(self, value):
         if not value:
             return
-        credentials = copy.deepcopy(self.credentials)
-        self.credentials = util.merge_dict(credentials, value)
+        _patch_json_dict(self, 'credentials', value)
 
     @property
     def filters(self):
@@ -2003,10 +2261,12 @@ class Switch(BASE, HelperMixin, TimestampMixin):
         filters = list(self.filters)
         self.filters = self.parse_filters(value) + filters
 
-    def to_dict(self):
-        dict_info = super(Switch, self).to_dict()
-        dict_info['ip'] = self.ip
-        dict_info['filters'] = self.format_filters(self._filters)
+    def to_dict(self, fields=None):
+        dict_info = super(Switch, self).to_dict(fields)
+        if in_fields(fields, 'ip'):
+            dict_info['ip'] = self.ip
+        if in_fields(fields, 'filters'):
+            dict_info['filters'] = self.format_filters(self._filters)
         return dict_info
 
 
@@ -2095,9 +2355,9 @@ class AdapterOS(BASE, HelperMixin):
         self.adapter_id = adapter_id
         super(AdapterOS, self).__init__(**kwargs)
 
-    def to_dict(self):
-        dict_info = self.os.to_dict()
-        dict_info.update(super(AdapterOS, self).to_dict())
+    def to_dict(self, fields=None):
+        dict_info = self.os.to_dict(fields)
+        dict_info.update(super(AdapterOS, self).to_dict(fields))
         return dict_info
 
 
@@ -2211,10 +2471,10 @@ class AdapterFlavorRole(BASE, HelperMixin):
                 )
             )
 
-    def to_dict(self):
-        dict_info = super(AdapterFlavorRole, self).to_dict()
+    def to_dict(self, fields=None):
+        dict_info = super(AdapterFlavorRole, self).to_dict(fields)
         dict_info.update(
-            self.role.to_dict()
+            self.role.to_dict(fields)
         )
         return dict_info
 
@@ -2297,8 +2557,8 @@ class AdapterFlavor(BASE, HelperMixin):
                 'template is not set in adapter flavor %s' % self.id
             )
 
-    def to_dict(self):
-        dict_info = super(AdapterFlavor, self).to_dict()
+    def to_dict(self, fields=None):
+        dict_info = super(AdapterFlavor, self).to_dict(fields)
         dict_info['roles'] = [
             flavor_role.to_dict()
             for flavor_role in self.ordered_flavor_roles
@@ -2590,8 +2850,8 @@ class Adapter(BASE, HelperMixin):
         else:
             return []
 
-    def to_dict(self):
-        dict_info = super(Adapter, self).to_dict()
+    def to_dict(self, fields=None):
+        dict_info = super(Adapter, self).to_dict(fields)
         dict_info.update({
             'supported_oses': [
                 adapter_os.to_dict()
@@ -2696,6 +2956,35 @@ class PackageInstaller(BASE, InstallerMixin):
         return 'PackageInstaller[%s:%s]' % (self.id, self.alias)
 
 
+class SubnetFreeRange(BASE, HelperMixin):
+    """Range of ips in a subnet not allocated yet."""
+    __tablename__ = 'subnet_free_range'
+
+    id = Column(Integer, primary_key=True)
+    subnet_id = Column(
+        Integer,
+        ForeignKey('subnet.id', onupdate='CASCADE', ondelete='CASCADE')
+    )
+    ip_int_start = Column(BigInteger, nullable=False)
+    ip_int_end = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('subnet_id', 'ip_int_start', name='constraint'),
+    )
+
+    def __init__(self, subnet_id, ip_int_start, **kwargs):
+        self.subnet_id = subnet_id
+        self.ip_int_start = ip_int_start
+        super(SubnetFreeRange, self).__init__(**kwargs)
+
+    def __str__(self):
+        return 'SubnetFreeRange[%s:%s-%s]' % (
+            self.subnet_id,
+            netaddr.IPAddress(self.ip_int_start),
+            netaddr.IPAddress(self.ip_int_end)
+        )
+
+
 class Subnet(BASE, TimestampMixin, HelperMixin):
     """network table."""
     __tablename__ = 'subnet'
@@ -2703,6 +2992,12 @@ class Subnet(BASE, TimestampMixin, HelperMixin):
     id = Column(Integer, primary_key=True)
     name = Column(String(80), unique=True, nullable=True)
     subnet = Column(String(80), unique=True, nullable=False)
+    gateway = Column(String(80), nullable=True)
+    # list of [start ip, end ip] to allocate ips from,
+    # empty for all ips in the subnet.
+    ip_ranges = Column(JSONEncoded, default=[])
+    # list of [start ip, end ip] never allocated.
+    excluded_ip_ranges = Column(JSONEncoded, default=[])
 
     host_networks = relationship(
         HostNetwork,
@@ -2718,8 +3013,45 @@ class Subnet(BASE, TimestampMixin, HelperMixin):
     def __str__(self):
         return 'Subnet[%s:%s]' % (self.id, self.subnet)
 
-    def to_dict(self):
-        dict_info = super(Subnet, self).to_dict()
-        if not self.name:
+    def validate(self):
+        super(Subnet, self).validate()
+        subnet = netaddr.IPNetwork(self.subnet)
+        if self.gateway and netaddr.IPAddress(self.gateway) not in subnet:
+            raise exception.InvalidParameter(
+                'gateway %s is not in subnet %s' % (
+                    self.gateway, self.subnet
+                )
+            )
+        for start, end in (
+            list(self.ip_ranges or []) + list(self.excluded_ip_ranges or [])
+        ):
+            if not (
+                netaddr.IPAddress(start) in subnet and
+                netaddr.IPAddress(end) in subnet
+            ):
+                raise exception.InvalidParameter(
+                    'ip range %s-%s is not in subnet %s' % (
+                        start, end, self.subnet
+                    )
+                )
+
+    def to_dict(self, fields=None):
+        dict_info = super(Subnet, self).to_dict(fields)
+        if in_fields(fields, 'name') and not self.name:
             dict_info['name'] = self.subnet
         return dict_info
+
+
+class SnapshotVersion(BASE, TimestampMixin, HelperMixin):
+    """Version of data snapshot shared by processes."""
+    __tablename__ = 'snapshot_version'
+
+    name = Column(String(80), primary_key=True)
+    version = Column(String(36), nullable=False)
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        super(SnapshotVersion, self).__init__(**kwargs)
+
+    def __str__(self):
+        return 'SnapshotVersion[%s:%s]' % (self.name, self.version)
@@ -15,13 +15,29 @@
 """Validator methods."""
 import logging
 import netaddr
+import os
 import re
 import socket
+import threading
+import time
+
+from multiprocessing import pool
+from multiprocessing import TimeoutError
 
 from compass.utils import setting_wrapper as setting
 from compass.utils import util
 
 
+# resolved dns names: name to (expire timestamp, resolvable).
+DNS_CACHE = {}
+DNS_CACHE_LOCK = threading.Lock()
+# dns names being resolved: name to async result.
+DNS_PENDING = {}
+DNS_RESOLVER_POOL = None
+# pid of the process the resolver pool is created in.
+DNS_RESOLVER_PID = None
+
+
 def is_valid_ip(name, ip_addr, **kwargs):
     """Valid the format of an IP address."""
     if isinstance(ip_addr, list):
@@ -80,17 +96,102 @@ def is_valid_gateway(name, ip_addr, **kwargs):
     return False
 
 
-def is_valid_dns(name, dns, **kwargs):
-    """Valid the format of DNS."""
-    if isinstance(dns, list):
-        return all([is_valid_dns(name, item, **kwargs) for item in dns])
-    if is_valid_ip(dns):
-        return True
+def _resolve_dns(dns):
+    """Resolve dns name and cache if it is resolvable."""
     try:
         socket.gethostbyname_ex(dns)
-    except Exception:
-        logging.debug('%s invalid dns name %s', name, dns)
-        return False
+        resolvable = True
+    except Exception as error:
+        logging.debug('failed to resolve %s: %s', dns, error)
+        resolvable = False
+    if resolvable:
+        duration = setting.DNS_CACHE_DURATION
+    else:
+        duration = setting.DNS_CACHE_NEGATIVE_DURATION
+    with DNS_CACHE_LOCK:
+        DNS_CACHE[dns] = (
+            time.time() + util.parse_time_interval(duration), resolvable
+        )
+        DNS_PENDING.pop(dns, None)
+    return resolvable
+
+
+def _get_dns_resolver_pool():
+    global DNS_RESOLVER_POOL
+    global DNS_RESOLVER_PID
+    pid = os.getpid()
+    if DNS_RESOLVER_PID != pid:
+        # the pool threads do not survive fork.
+        DNS_RESOLVER_POOL = pool.ThreadPool(
+            setting.DNS_RESOLVER_CONCURRENCY
+        )
+        DNS_RESOLVER_PID = pid
+        DNS_PENDING.clear()
+    return DNS_RESOLVER_POOL
+
+
+def resolve_dns_names(dns_names, timeout=None):
+    """Check if dns names are resolvable.
+
+    Cached results are used until they expire. Other names are
+    resolved concurrently by a bounded pool of threads, and all of
+    them are waited for at most timeout. A name still being resolved
+    at timeout keeps resolving in background and is cached when done.
+
+    :param timeout: time interval like '5s', default
+                    setting.DNS_RESOLVE_TIMEOUT.
+    :return: dict of name to resolvable, None if it times out.
+    """
+    if timeout is None:
+        timeout = setting.DNS_RESOLVE_TIMEOUT
+    deadline = time.time() + util.parse_time_interval(timeout)
+    results = {}
+    pending = {}
+    with DNS_CACHE_LOCK:
+        now = time.time()
+        for dns in dns_names:
+            if dns in DNS_CACHE:
+                expire_timestamp, resolvable = DNS_CACHE[dns]
+                if now < expire_timestamp:
+                    results[dns] = resolvable
+                    continue
+                del DNS_CACHE[dns]
+            if dns not in DNS_PENDING:
+                DNS_PENDING[dns] = _get_dns_resolver_pool().apply_async(
+                    _resolve_dns, (dns,)
+                )
+            pending[dns] = DNS_PENDING[dns]
+    for dns, result in pending.items():
+        try:
+            results[dns] = result.get(max(deadline - time.time(), 0))
+        except TimeoutError:
+            logging.error('resolve %s timeout after %s', dns, timeout)
+            results[dns] = None
+    return results
+
+
+def is_valid_dns(name, dns, **kwargs):
+    """Valid the format of DNS.
+
+    DNS which is not an ip address should be resolvable in
+    setting.DNS_RESOLVE_TIMEOUT.
+    """
+    if not isinstance(dns, list):
+        dns = [dns]
+    dns_names = []
+    for item in dns:
+        if is_valid_ip(name, item):
+            continue
+        if not isinstance(item, basestring):
+            logging.debug('%s invalid dns %s', name, item)
+            return False
+        dns_names.append(item)
+    if not dns_names:
+        return True
+    for dns_name, resolvable in resolve_dns_names(dns_names).items():
+        if not resolvable:
+            logging.debug('%s invalid dns name %s', name, dns_name)
+            return False
     return True
 
 
@@ -18,8 +18,11 @@
 """
 import logging
 
+from celery import states
 from celery.signals import celeryd_init
 from celery.signals import setup_logging
+from celery.signals import task_postrun
+from celery.signals import task_prerun
 
 from compass.actions import clean
 from compass.actions import delete
@@ -29,6 +32,7 @@ from compass.actions import update_progress
 from compass.db.api import adapter_holder as adapter_api
 from compass.db.api import database
 from compass.db.api import metadata_holder as metadata_api
+from compass.db.api import user_log as user_log_api
 
 from compass.tasks.client import celery
 from compass.utils import flags
@@ -55,6 +59,42 @@ def tasks_setup_logging(**_):
     logsetting.init()
 
 
+@task_prerun.connect()
+def begin_task_session(task=None, **_):
+    """Share one database session in the task if configured.
+
+    Tasks opt in with the scoped_session task option. Long running
+    tasks, and tasks whose progress should be seen before they end,
+    should not opt in since the session is committed at the task end.
+    """
+    if setting.REQUEST_SCOPED_SESSION and getattr(
+        task, 'scoped_session', False
+    ):
+        database.begin_session()
+
+
+@task_postrun.connect()
+def end_task_session(state=None, **_):
+    """Commit the task session if the task succeeded."""
+    if not database.in_session():
+        return
+    try:
+        database.end_session(commit=(state == states.SUCCESS))
+    except Exception as error:
+        logging.exception(error)
+
+
+@task_prerun.connect()
+def begin_task_query_stats(**_):
+    database.begin_query_stats()
+
+
+@task_postrun.connect()
+def end_task_query_stats(task=None, **_):
+    """Aggregate query stats of the task after its session is committed."""
+    database.end_query_stats(task.name)
+
+
 @celery.task(name='compass.tasks.pollswitch')
 def pollswitch(
     poller_email, ip_addr, credentials,
@@ -246,3 +286,13 @@ def update_clusters_progress():
         update_progress.update_progress()
     except Exception as error:
         logging.exception(error)
+
+
+@celery.task(name='compass.tasks.prune_user_logs')
+def prune_user_logs():
+    """Delete user logs older than the user log retention window."""
+    logging.info('prune_user_logs')
+    try:
+        user_log_api.prune_user_actions()
+    except Exception as error:
+        logging.exception(error)
@@ -248,6 +248,39 @@ class TestUserAPI(ApiTestCase):
         self.assertEqual(count, 1)
         self.assertEqual(return_value.status_code, 200)
 
+    def test_show_user_token_cache_stats(self):
+        url = '/users/token/cache'
+        self.get(url)
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertGreater(resp['hits'], 0)
+        self.assertIn('hit_rate', resp)
+
+
+class TestMetricsAPI(ApiTestCase):
+    """Test metrics api."""
+
+    def setUp(self):
+        super(TestMetricsAPI, self).setUp()
+
+    def tearDown(self):
+        super(TestMetricsAPI, self).tearDown()
+
+    def test_query_stats_headers(self):
+        return_value = self.get('/users')
+        self.assertEqual(return_value.status_code, 200)
+        self.assertGreater(int(return_value.headers['X-DB-Queries']), 0)
+        self.assertGreaterEqual(float(return_value.headers['X-DB-Time']), 0)
+
+    def test_show_database_metrics(self):
+        self.get('/users')
+        return_value = self.get('/metrics/database')
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertGreater(resp['list_users']['calls'], 0)
+        self.assertGreater(resp['list_users']['queries'], 0)
+
 
 class TestClusterAPI(ApiTestCase):
     """Test cluster api."""
@@ -449,6 +482,26 @@ class TestClusterAPI(ApiTestCase):
         return_value = self.put(url, data)
         self.assertEqual(return_value.status_code, 200)
 
+    def test_update_cluster_hosts_config(self):
+        # update cluster hosts roles with one failed host
+        url = '/clusters/1/hosts/config'
+        data = [
+            {'host_id': 1, 'roles': ['allinone-compute']},
+            {'host_id': 99, 'roles': ['allinone-compute']}
+        ]
+        return_value = self.put(url, data)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual([1], [host['host_id'] for host in resp['hosts']])
+        self.assertEqual(
+            [99], [host['host_id'] for host in resp['failed_hosts']]
+        )
+
+        # give a non-existed cluster_id
+        url = '/clusters/99/hosts/config'
+        return_value = self.put(url, data)
+        self.assertEqual(return_value.status_code, 404)
+
     def test_delete_cluster_host(self):
         # delete a cluster_host successfully
         url = '/clusters/1/hosts/1'
@@ -460,6 +513,46 @@ class TestClusterAPI(ApiTestCase):
         return_value = self.delete(url)
         self.assertEqual(return_value.status_code, 404)
 
+    def test_list_cluster_host_states(self):
+        # list cluster host states successfully
+        url = '/clusters/1/hosts/states'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(len(resp), 1)
+        self.assertEqual(resp[0]['host_id'], 1)
+        self.assertEqual(resp[0]['state'], 'UNINITIALIZED')
+
+        # no state changed since the given timestamp
+        url = '/clusters/1/hosts/states?since=2100-01-01%2000:00:00'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        self.assertEqual(json.loads(return_value.get_data()), [])
+
+        # give an invalid timestamp
+        url = '/clusters/1/hosts/states?since=xxx'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 400)
+
+        # give a non-existed cluster_id
+        url = '/clusters/99/hosts/states'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 404)
+
+    def test_list_clusterhost_states(self):
+        # list clusterhost states successfully
+        url = '/clusterhosts/states?cluster_id=1'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(len(resp), 1)
+        self.assertEqual(resp[0]['cluster_id'], 1)
+
+        # cluster_id is required
+        url = '/clusterhosts/states'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 400)
+
 
 class TestSubnetAPI(ApiTestCase):
     """Test subnet api."""
@@ -723,6 +816,69 @@ class TestAdapterAPI(ApiTestCase):
         self.assertEqual(return_value.status_code, 404)
 
 
+class TestMetadataAPI(ApiTestCase):
+    """Test metadata api."""
+
+    def setUp(self):
+        super(TestMetadataAPI, self).setUp()
+        self.adapter_name, self.adapter_id, self.os_id, _ = (
+            self._get_adapter_info()
+        )
+
+    def tearDown(self):
+        super(TestMetadataAPI, self).tearDown()
+
+    def _get_if_none_match(self, url, etag):
+        return self.test_client.get(
+            url, headers={
+                setting.USER_AUTH_HEADER_NAME: self.token,
+                'If-None-Match': '"%s"' % etag
+            }
+        )
+
+    def test_show_metadata_etag(self):
+        for url in [
+            '/adapters',
+            '/adapters/%s/metadata' % self.adapter_id,
+            '/oses/%s/metadata' % self.os_id,
+            '/adapters/%s/oses/%s/metadata' % (self.adapter_id, self.os_id),
+            '/clusters/1/metadata'
+        ]:
+            return_value = self.get(url)
+            self.assertEqual(return_value.status_code, 200)
+            etag, _ = return_value.get_etag()
+            self.assertTrue(etag)
+            self.assertEqual(etag, self.get(url).get_etag()[0])
+            return_value = self._get_if_none_match(url, etag)
+            self.assertEqual(return_value.status_code, 304)
+            self.assertEqual('', return_value.get_data())
+            return_value = self._get_if_none_match(url, 'xxx')
+            self.assertEqual(return_value.status_code, 200)
+            self.assertTrue(json.loads(return_value.get_data()))
+
+    def test_show_metadata_etag_after_reload(self):
+        url = '/oses/%s/metadata' % self.os_id
+        return_value = self.get(url)
+        etag, _ = return_value.get_etag()
+        with mock.patch.object(
+            metadata_api.OS_METADATA_SNAPSHOT, 'build_func'
+        ) as mock_build:
+            mock_build.return_value = {self.os_id: {}}
+            metadata_api.load_metadatas()
+        return_value = self._get_if_none_match(url, etag)
+        self.assertEqual(return_value.status_code, 200)
+        self.assertNotEqual(etag, return_value.get_etag()[0])
+        self.assertEqual(
+            {'os_config': {}}, json.loads(return_value.get_data())
+        )
+
+    def test_show_metadata_not_exist(self):
+        return_value = self.get('/oses/99/metadata')
+        self.assertEqual(return_value.status_code, 404)
+        return_value = self.get('/clusters/99/metadata')
+        self.assertEqual(return_value.status_code, 404)
+
+
 class TestHostAPI(ApiTestCase):
     """Test host api."""
 
@@ -810,6 +966,38 @@ class TestHostAPI(ApiTestCase):
         resp = json.loads(return_value.get_data())
         self.assertEqual([], resp)
 
+    def test_list_hosts_pagination(self):
+        url = '/hosts?limit=1'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(['test_host1'], [host['name'] for host in resp])
+        link = return_value.headers['Link']
+        self.assertTrue(link.endswith('; rel="next"'))
+        url = link[link.index('/hosts'):link.index('>')]
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(['test_hosts2'], [host['name'] for host in resp])
+        self.assertNotIn('Link', return_value.headers)
+
+    def test_list_hosts_streamed(self):
+        return_value = self.get('/hosts')
+        self.assertEqual(return_value.status_code, 200)
+        self.assertTrue(return_value.is_streamed)
+        compact = return_value.get_data()
+        self.assertNotIn('\n', compact.rstrip())
+        return_value = self.get('/hosts?pretty=1')
+        self.assertEqual(return_value.status_code, 200)
+        pretty = return_value.get_data()
+        self.assertIn('\n    {', pretty)
+        self.assertEqual(json.loads(compact), json.loads(pretty))
+
+    def test_list_hosts_invalid_cursor(self):
+        url = '/hosts?limit=1&cursor=xxx'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 400)
+
     def test_show_host(self):
         #show a host successfully
         url = '/hosts/1'
@@ -828,6 +1016,19 @@ class TestHostAPI(ApiTestCase):
         return_value = self.get(url)
         self.assertEqual(return_value.status_code, 200)
 
+    def test_list_hosts_fields(self):
+        url = '/hosts?fields=name,mac'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(
+            [
+                {'name': 'test_host1', 'mac': '28:6e:d4:46:c4:25'},
+                {'name': 'test_hosts2', 'mac': '00:0c:29:bf:eb:1d'}
+            ],
+            resp
+        )
+
     def test_show_machine_or_host(self):
         url = '/machines-hosts/1'
         return_value = self.get(url)
@@ -879,6 +1080,44 @@ class TestHostAPI(ApiTestCase):
         self.assertEqual(count, 2)
         self.assertEqual(return_value.status_code, 200)
 
+    def test_allocate_subnet_ips(self):
+        # allocate ips of host networks from subnet
+        url = '/subnets/1/allocate'
+        data = [
+            {'host_id': 1, 'interface': 'eth2'},
+            {'host_id': 2, 'interface': 'eth0', 'is_mgmt': True},
+            {'host_id': 1, 'interface': 'eth0'}
+        ]
+        return_value = self.post(url, data)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(
+            ['10.172.20.1', '10.172.20.2'],
+            [host_network['ip'] for host_network in resp['host_networks']]
+        )
+        self.assertEqual(
+            [{'host_id': 1, 'interface': 'eth0'}],
+            [
+                {
+                    'host_id': host_network['host_id'],
+                    'interface': host_network['interface']
+                }
+                for host_network in resp['failed_host_networks']
+            ]
+        )
+
+        # add host network with auto ip
+        url = '/hosts/2/networks'
+        data = {'interface': 'eth1', 'ip': 'auto', 'subnet_id': 1}
+        return_value = self.post(url, data)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(resp['ip'], '10.172.20.3')
+
+        # give a non-existed subnet_id
+        url = '/subnets/99/allocate'
+        return_value = self.post(url, [])
+        self.assertEqual(return_value.status_code, 404)
+
     def test_show_host_network(self):
         url = '/hosts/1/networks/1'
         return_value = self.get(url)
@@ -925,6 +1164,24 @@ class TestSwitchMachines(ApiTestCase):
         resp = json.loads(return_value.get_data())
         self.assertEqual(resp, [])
 
+    def test_list_switch_machines_fields(self):
+        url = '/switches/2/machines?fields=mac,port,switch_ip'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual(2, len(resp))
+        for switch_machine in resp:
+            self.assertEqual(
+                set(['mac', 'port', 'switch_ip']), set(switch_machine)
+            )
+
+    def test_list_switch_machines_fields_with_filter(self):
+        url = '/switches/2/machines?fields=mac&vlans=88'
+        return_value = self.get(url)
+        self.assertEqual(return_value.status_code, 200)
+        resp = json.loads(return_value.get_data())
+        self.assertEqual([{'mac': '28:6e:d4:46:c4:25'}], resp)
+
     def test_add_switch_machine(self):
         # add a switch machine successfully
         url = '/switches/2/machines'
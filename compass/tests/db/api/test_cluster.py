@@ -13,6 +13,7 @@
 # limitations under the License.
 
 
+import copy
 import datetime
 import logging
 import mock
@@ -1327,6 +1328,122 @@ class TestPatchClusterHostConfig(ClusterTestCase):
         )
 
 
+class TestUpdateClusterHostsConfig(ClusterTestCase):
+    """Test update configs of cluster hosts in batch."""
+
+    def setUp(self):
+        super(TestUpdateClusterHostsConfig, self).setUp()
+
+    def tearDown(self):
+        super(TestUpdateClusterHostsConfig, self).tearDown()
+
+    def test_update_cluster_hosts_config(self):
+        result = cluster.update_cluster_hosts_config(
+            self.user_object,
+            self.cluster_id,
+            data=[{
+                'clusterhost_id': self.clusterhost_id[0],
+                'os_config': self.os_configs,
+                'package_config': self.package_configs,
+                'roles': ['allinone-compute']
+            }, {
+                'host_id': self.host_id[1],
+                'package_config': self.package_configs
+            }]
+        )
+        self.assertEqual([], result['failed_hosts'])
+        self.assertItemsEqual(
+            self.host_id, [host['host_id'] for host in result['hosts']]
+        )
+        config = cluster.get_cluster_host_config(
+            self.user_object,
+            self.cluster_id,
+            self.host_id[0]
+        )
+        self.assertItemsEqual(config['os_config'], self.os_configs)
+        self.assertItemsEqual(config['package_config'], self.package_configs)
+        clusterhost = cluster.get_cluster_host(
+            self.user_object,
+            self.cluster_id,
+            self.host_id[0]
+        )
+        self.assertEqual(
+            ['allinone-compute'],
+            [role['name'] for role in clusterhost['roles']]
+        )
+
+    def test_partial_failure(self):
+        result = cluster.update_cluster_hosts_config(
+            self.user_object,
+            self.cluster_id,
+            data=[{
+                'clusterhost_id': self.clusterhost_id[0],
+                'package_config': self.package_configs,
+                'roles': ['invalid_role']
+            }, {
+                'host_id': self.host_id[1],
+                'package_config': self.package_configs
+            }, {
+                'host_id': 100,
+                'package_config': self.package_configs
+            }]
+        )
+        self.assertEqual(
+            [self.host_id[1]],
+            [host['host_id'] for host in result['hosts']]
+        )
+        self.assertEqual(
+            [{'clusterhost_id': self.clusterhost_id[0]}, {'host_id': 100}],
+            [
+                dict([
+                    (key, value) for key, value in failed_host.items()
+                    if key != 'message'
+                ])
+                for failed_host in result['failed_hosts']
+            ]
+        )
+        config = cluster.get_cluster_host_config(
+            self.user_object,
+            self.cluster_id,
+            self.host_id[0]
+        )
+        self.assertEqual({}, config['package_config'])
+
+    def test_patch_cluster_hosts_config(self):
+        cluster.update_cluster_host(
+            self.user_object,
+            self.cluster_id,
+            self.host_id[0],
+            roles=['allinone-compute']
+        )
+        cluster.update_cluster_hosts_config(
+            self.user_object,
+            self.cluster_id,
+            data=[{
+                'host_id': self.host_id[0],
+                'package_config': {
+                    'security': self.package_configs['security']
+                }
+            }]
+        )
+        result = cluster.patch_cluster_hosts_config(
+            self.user_object,
+            self.cluster_id,
+            data=[{
+                'host_id': self.host_id[0],
+                'package_config': {
+                    'network_mapping': self.package_configs['network_mapping']
+                },
+                'roles': ['allinone-compute']
+            }]
+        )
+        self.assertEqual([], result['failed_hosts'])
+        self.assertItemsEqual(
+            self.package_configs.keys(),
+            result['hosts'][0]['package_config'].keys()
+        )
+
+
 class TestPatchClusterhostConfig(ClusterTestCase):
     """Test patch clusterhost config."""
 
@@ -1564,6 +1681,102 @@ class TestReviewCluster(ClusterTestCase):
         self.assertItemsEqual(host_package_config, self.package_configs)
         self.assertItemsEqual(host_os_config, self.os_configs)
 
+    def test_review_cluster_host_configs(self):
+        host.add_host_network(
+            self.user_object,
+            self.host_id[1],
+            interface='eth0',
+            ip='10.145.88.1',
+            subnet_id=self.subnet_ids[0],
+            is_mgmt=True
+        )
+        host.add_host_network(
+            self.user_object,
+            self.host_id[1],
+            interface='eth1',
+            ip='10.145.88.11',
+            subnet_id=self.subnet_ids[0],
+            is_promiscuous=True
+        )
+        cluster.update_cluster_host(
+            self.user_object,
+            self.cluster_id,
+            self.host_id[1],
+            roles=['allinone-compute']
+        )
+        sizes = ['1G', '2G']
+        for i, size in enumerate(sizes):
+            os_configs = copy.deepcopy(self.os_configs)
+            os_configs['partition']['/home'] = {
+                'max_size': '100G',
+                'percentage': 10,
+                'size': size
+            }
+            cluster.update_clusterhost_config(
+                self.user_object,
+                self.clusterhost_id[i],
+                os_config=os_configs,
+                package_config=self.package_configs
+            )
+        cluster.review_cluster(
+            self.user_object,
+            self.cluster_id,
+            review={
+                'hosts': self.host_id
+            }
+        )
+        for i, size in enumerate(sizes):
+            host_config = host.get_host_config(
+                self.user_object, self.host_id[i]
+            )
+            self.assertEqual(
+                size, host_config['os_config']['partition']['/home']['size']
+            )
+        cluster_config = cluster.get_cluster_config(
+            self.user_object, self.cluster_id
+        )
+        self.assertNotIn('/home', cluster_config['os_config']['partition'])
+
+    def test_review_cluster_errors(self):
+        host.add_host_network(
+            self.user_object,
+            self.host_id[0],
+            interface='eth2',
+            ip='10.145.88.20',
+            subnet_id=self.subnet_ids[0],
+            is_mgmt=True
+        )
+        with self.assertRaises(exception.MultiDatabaseException) as context:
+            cluster.review_cluster(
+                self.user_object,
+                self.cluster_id,
+                review={
+                    'hosts': self.host_id
+                }
+            )
+        messages = [
+            error.to_dict()['message']
+            for error in context.exception.exceptions
+        ]
+        self.assertEqual(2, len(messages))
+        self.assertTrue(any(
+            'multi interfaces set mgmt' in message for message in messages
+        ))
+        self.assertTrue(any(
+            'does not have any network' in message for message in messages
+        ))
+
+    def test_review_cluster_error(self):
+        self.assertRaises(
+            exception.InvalidParameter,
+            cluster.review_cluster,
+            self.user_object,
+            self.cluster_id,
+            review={
+                'hosts': self.host_id
+            }
+        )
+
 
 class TestDeployedCluster(ClusterTestCase):
     """Test deployed cluster."""
@@ -1713,6 +1926,64 @@ class TestGetClusterhostSelfState(ClusterTestCase):
         self.assertEqual(clusterhost_state['state'], 'UNINITIALIZED')
 
 
+class TestListClusterHostStates(ClusterTestCase):
+    """Test list cluster host states."""
+
+    def setUp(self):
+        super(TestListClusterHostStates, self).setUp()
+
+    def tearDown(self):
+        super(TestListClusterHostStates, self).tearDown()
+
+    def test_list_cluster_host_states(self):
+        states = cluster.list_cluster_host_states(
+            self.user_object,
+            self.cluster_id
+        )
+        self.assertItemsEqual(
+            [state['host_id'] for state in states],
+            self.host_id
+        )
+        for state in states:
+            self.assertEqual(state['cluster_id'], self.cluster_id)
+            self.assertEqual(state['state'], 'UNINITIALIZED')
+
+    def test_list_cluster_host_states_since(self):
+        since = datetime.datetime.now()
+        cluster.update_clusterhost_state(
+            self.user_object,
+            self.clusterhost_id[0],
+            state='INSTALLING'
+        )
+        states = cluster.list_cluster_host_states(
+            self.user_object,
+            self.cluster_id,
+            since=since
+        )
+        self.assertEqual(
+            [state['clusterhost_id'] for state in states],
+            [self.clusterhost_id[0]]
+        )
+
+    def test_list_clusterhost_states(self):
+        states = cluster.list_clusterhost_states(
+            self.user_object,
+            cluster_id=self.cluster_id
+        )
+        self.assertItemsEqual(
+            [state['clusterhost_id'] for state in states],
+            self.clusterhost_id
+        )
+
+    def test_non_exist_cluster_id(self):
+        self.assertRaises(
+            exception.RecordNotExists,
+            cluster.list_cluster_host_states,
+            self.user_object,
+            99
+        )
+
+
 class TestUpdateClusterHostState(ClusterTestCase):
     """Test update cluster host state."""
 
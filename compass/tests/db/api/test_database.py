@@ -0,0 +1,381 @@
+# Copyright 2014 Huawei Technologies Co. Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import mock
+import os
+import unittest2
+
+
+os.environ['COMPASS_IGNORE_SETTING'] = 'true'
+
+
+from compass.utils import setting_wrapper as setting
+reload(setting)
+
+
+from base import BaseTest
+from compass.db.api import adapter as adapter_api
+from compass.db.api import database
+from compass.db.api import permission
+from compass.db.api import utils
+from compass.db import exception
+from compass.db import models
+from compass.utils import flags
+from compass.utils import logsetting
+
+
+@database.run_in_session()
+def _add_permission(session, name):
+    utils.add_db_object(session, models.Permission, True, name)
+
+
+@database.run_in_session()
+def _get_permission(session, name):
+    return utils.get_db_object(
+        session, models.Permission, False, name=name
+    )
+
+
+class TestSession(BaseTest):
+    """Test database session."""
+
+    def setUp(self):
+        super(TestSession, self).setUp()
+
+    def tearDown(self):
+        super(TestSession, self).tearDown()
+
+    def test_nested_session(self):
+        with database.session() as session:
+            _add_permission('test1')
+            self.assertTrue(database.in_session())
+            self.assertIs(session, database.current_session())
+            self.assertIsNotNone(_get_permission('test1'))
+        self.assertFalse(database.in_session())
+        self.assertIsNotNone(_get_permission('test1'))
+
+    def test_nested_session_rollback(self):
+        def add_permission_fail(name):
+            with database.session():
+                _add_permission(name)
+                raise Exception('test')
+
+        with database.session():
+            _add_permission('test1')
+            self.assertRaises(
+                exception.DatabaseException,
+                add_permission_fail, 'test2'
+            )
+            _add_permission('test3')
+        self.assertIsNotNone(_get_permission('test1'))
+        self.assertIsNone(_get_permission('test2'))
+        self.assertIsNotNone(_get_permission('test3'))
+
+    def test_session_rollback(self):
+        def add_permissions():
+            with database.session():
+                _add_permission('test1')
+                raise Exception('test')
+
+        self.assertRaises(exception.DatabaseException, add_permissions)
+        self.assertIsNone(_get_permission('test1'))
+
+    def test_end_session_rollback(self):
+        database.begin_session()
+        _add_permission('test1')
+        database.end_session(commit=False)
+        self.assertFalse(database.in_session())
+        self.assertIsNone(_get_permission('test1'))
+
+    def test_begin_session_twice(self):
+        database.begin_session()
+        try:
+            self.assertRaises(
+                exception.DatabaseException,
+                database.begin_session
+            )
+        finally:
+            database.end_session()
+
+    def test_call_after_session(self):
+        calls = []
+        database.call_after_session(calls.append, 'outside')
+        self.assertEqual(['outside'], calls)
+        database.begin_session()
+        database.call_after_session(calls.append, 'inside')
+        self.assertEqual(['outside'], calls)
+        database.end_session()
+        self.assertEqual(['outside', 'inside'], calls)
+
+    def test_call_after_session_rollback(self):
+        calls = []
+        database.begin_session()
+        database.call_after_session(calls.append, 'inside')
+        database.end_session(commit=False)
+        self.assertEqual(['inside'], calls)
+
+
+class TestQueryStats(BaseTest):
+    """Test query stats."""
+
+    def setUp(self):
+        super(TestQueryStats, self).setUp()
+        database.QUERY_METRICS.clear()
+
+    def tearDown(self):
+        database.QUERY_METRICS.clear()
+        super(TestQueryStats, self).tearDown()
+
+    def test_query_stats(self):
+        self.assertIsNone(database.end_query_stats())
+        database.begin_query_stats()
+        _get_permission('test1')
+        _get_permission('test2')
+        stats = database.end_query_stats('test')
+        self.assertGreaterEqual(stats['queries'], 2)
+        metrics = database.get_query_metrics()['test']
+        self.assertEqual(1, metrics['calls'])
+        self.assertEqual(stats['queries'], metrics['queries'])
+        self.assertIsNone(database.end_query_stats())
+
+    def test_slow_query_log(self):
+        setting.DB_SLOW_QUERY_THRESHOLD = 1e-9
+        with mock.patch('logging.warning') as mock_warning:
+            permission.list_permissions(self.user_object)
+        self.assertTrue(mock_warning.called)
+        self.assertTrue(
+            mock_warning.call_args[0][2].startswith(
+                'permission.list_permissions:'
+            )
+        )
+
+    def test_query_stats_after_failed_query(self):
+        connection = database.ENGINE.connect()
+        try:
+            self.assertRaises(
+                Exception, connection.execute, 'SELECT * FROM unknown'
+            )
+            database.begin_query_stats()
+            connection.execute('SELECT 1')
+            stats = database.end_query_stats()
+            self.assertNotIn('query_start_time', connection.info)
+        finally:
+            connection.close()
+        self.assertEqual(1, stats['queries'])
+
+
+class TestCreateDb(BaseTest):
+    """Test create database from conf dirs."""
+
+    def setUp(self):
+        super(TestCreateDb, self).setUp()
+
+    def tearDown(self):
+        super(TestCreateDb, self).tearDown()
+
+    def test_create_db_stages(self):
+        database.drop_db()
+        stage_times = database.create_db()
+        stages = [stage for stage, _ in stage_times]
+        self.assertEqual('load configs', stages[0])
+        self.assertIn('package_metadata', stages)
+        for _, seconds in stage_times:
+            self.assertGreaterEqual(seconds, 0)
+        with database.session() as session:
+            self.assertTrue(session.query(models.Adapter).count())
+            self.assertTrue(
+                session.query(models.PackageConfigMetadata).count()
+            )
+
+    def test_check_bootstrap_configs(self):
+        configs = database._load_bootstrap_configs()
+        configs['adapter_flavor'][0]['FLAVORS'][0].setdefault(
+            'roles', []
+        ).append('unknown_role')
+        self.assertRaises(
+            exception.InvalidParameter,
+            database._check_bootstrap_configs, configs
+        )
+
+    def test_add_oses_clears_parent(self):
+        configs = [
+            {'NAME': 'test_parent_os'},
+            {'NAME': 'test_os', 'PARENT': 'test_parent_os'}
+        ]
+        with database.session() as session:
+            adapter_api.add_oses_internal(session, configs=configs)
+        del configs[1]['PARENT']
+        with database.session() as session:
+            oses = adapter_api.add_oses_internal(
+                session, False, configs=configs
+            )
+            parent_ids = [system.parent_id for system in oses]
+        self.assertEqual([None, None], parent_ids)
+
+    def test_check_bootstrap_configs_parent(self):
+        configs = database._load_bootstrap_configs()
+        configs['os'][0]['PARENT'] = 'unknown_os'
+        self.assertRaises(
+            exception.InvalidParameter,
+            database._check_bootstrap_configs, configs
+        )
+
+
+class TestUpgradeDb(BaseTest):
+    """Test upgrade database."""
+
+    def setUp(self):
+        super(TestUpgradeDb, self).setUp()
+
+    def tearDown(self):
+        super(TestUpgradeDb, self).tearDown()
+
+    def test_upgrade_db(self):
+        with database.session() as session:
+            utils.add_db_object(
+                session, models.Machine, True,
+                '28:6e:d4:46:c4:25', tag={'rack': 'r1'}
+            )
+        database.ENGINE.execute('DROP INDEX switch_machine_machine_id')
+        database.ENGINE.execute('DROP TABLE machine_attribute')
+        self.assertItemsEqual(
+            ['machine_attribute', 'switch_machine_machine_id'],
+            database.upgrade_db()
+        )
+        self.assertEqual([], database.upgrade_db())
+        with database.session() as session:
+            attributes = [
+                (attribute.namespace, attribute.key, attribute.value)
+                for attribute in session.query(models.MachineAttribute)
+            ]
+        self.assertEqual([('tag', 'rack', '"r1"')], attributes)
+
+    def test_upgrade_db_columns(self):
+        database.ENGINE.execute('DROP TABLE subnet')
+        database.ENGINE.execute(
+            'CREATE TABLE subnet ('
+            'id INTEGER NOT NULL PRIMARY KEY, '
+            'created_at DATETIME, updated_at DATETIME, '
+            'name VARCHAR(80) UNIQUE, subnet VARCHAR(80) NOT NULL UNIQUE)'
+        )
+        database.ENGINE.execute(
+            "INSERT INTO subnet (id, subnet) VALUES (1, '10.0.0.0/24')"
+        )
+        self.assertItemsEqual(
+            ['subnet.gateway', 'subnet.ip_ranges',
+             'subnet.excluded_ip_ranges'],
+            database.upgrade_db()
+        )
+        self.assertEqual([], database.upgrade_db())
+        with database.session() as session:
+            subnet = session.query(models.Subnet).one()
+            self.assertIsNone(subnet.gateway)
+            subnet.gateway = '10.0.0.1'
+        with database.session() as session:
+            subnet = session.query(models.Subnet).one()
+            self.assertEqual('10.0.0.1', subnet.gateway)
+
+
+class TestQueryPlan(BaseTest):
+    """Test hot queries use indexes."""
+
+    def setUp(self):
+        super(TestQueryPlan, self).setUp()
+
+    def tearDown(self):
+        super(TestQueryPlan, self).tearDown()
+
+    def _query_plan(self, query):
+        statement = query.statement.compile(dialect=database.ENGINE.dialect)
+        params = [
+            statement.params[name] for name in statement.positiontup
+        ]
+        return ' '.join([
+            row['detail'] for row in database.ENGINE.execute(
+                'EXPLAIN QUERY PLAN %s' % statement, params
+            )
+        ])
+
+    def test_hot_queries_use_indexes(self):
+        now = datetime.datetime.now()
+        with database.session() as session:
+            for index_name, query in [
+                (
+                    'switch_machine_machine_id',
+                    session.query(models.SwitchMachine).filter_by(
+                        machine_id=1
+                    )
+                ),
+                (
+                    'switch_machine_switch_id_port',
+                    session.query(models.SwitchMachine).filter_by(
+                        switch_id=1, port='1'
+                    )
+                ),
+                (
+                    'clusterhost_host_id',
+                    session.query(models.ClusterHost).filter_by(
+                        host_id=1
+                    )
+                ),
+                (
+                    'host_state_updated_at',
+                    session.query(models.HostState).filter(
+                        models.HostState.updated_at > now
+                    )
+                ),
+                (
+                    'clusterhost_state_state',
+                    session.query(models.ClusterHostState).filter_by(
+                        state='INSTALLING'
+                    )
+                ),
+                (
+                    'host_network_subnet_id',
+                    session.query(models.HostNetwork).filter_by(
+                        subnet_id=1
+                    )
+                ),
+                (
+                    'user_token_user_id_expire_timestamp',
+                    session.query(models.UserToken).filter(
+                        models.UserToken.user_id == 1,
+                        models.UserToken.expire_timestamp < now
+                    )
+                ),
+                (
+                    'user_log_timestamp',
+                    session.query(models.UserLog).filter(
+                        models.UserLog.timestamp < now
+                    )
+                ),
+                (
+                    'machine_attribute_namespace_key_value',
+                    session.query(models.MachineAttribute).filter_by(
+                        namespace='tag', key='rack', value='"r1"'
+                    )
+                )
+            ]:
+                query_plan = self._query_plan(query)
+                self.assertIn(
+                    'INDEX %s' % index_name, query_plan,
+                    '%s: %s' % (index_name, query_plan)
+                )
+
+
+if __name__ == '__main__':
+    flags.init()
+    logsetting.init()
+    unittest2.main()
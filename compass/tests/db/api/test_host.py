@@ -20,6 +20,7 @@ import os
 import sys
 import unittest2
 
+from sqlalchemy import event
 
 os.environ['COMPASS_IGNORE_SETTING'] = 'true'
 
@@ -41,6 +42,7 @@ from compass.db.api import network
 from compass.db.api import switch
 from compass.db.api import user as user_api
 from compass.db import exception
+from compass.db import models
 from compass.utils import flags
 from compass.utils import logsetting
 from compass.utils import util
@@ -247,6 +249,93 @@ class TestListHosts(HostTestCase):
             self.assertIn(item, ['newname1', 'newname2'])
 
 
+class TestListHostsQueryCount(HostTestCase):
+    """Test query count of listing hosts does not grow with hosts."""
+
+    def setUp(self):
+        super(TestListHostsQueryCount, self).setUp()
+        self.statements = []
+        event.listen(
+            database.ENGINE, 'before_cursor_execute',
+            self._count_statement
+        )
+
+    def tearDown(self):
+        event.remove(
+            database.ENGINE, 'before_cursor_execute',
+            self._count_statement
+        )
+        super(TestListHostsQueryCount, self).tearDown()
+
+    def _count_statement(self, *args, **kwargs):
+        self.statements.append(args[2])
+
+    def _add_hosts(self, count):
+        with database.session() as session:
+            template = session.query(models.Host).get(self.host_ids[0])
+            for i in range(count):
+                machine = models.Machine(mac='00:00:00:00:%02x:%02x' % (
+                    i / 256, i % 256
+                ))
+                session.add(machine)
+                session.flush()
+                session.add(models.SwitchMachine(
+                    self.switch_id, machine.id, port=str(i)
+                ))
+                session.add(models.Host(
+                    machine.id, name='host%s' % i,
+                    os_id=template.os_id, os_name=template.os_name,
+                    os_installer_id=template.os_installer_id,
+                    creator_id=template.creator_id, owner=template.owner
+                ))
+                session.add(models.ClusterHost(
+                    self.cluster_id, machine.id
+                ))
+
+    def _query_count(self, func, **kwargs):
+        self.statements = []
+        result = func(self.user_object, **kwargs)
+        return len(self.statements), result
+
+    def test_list_hosts(self):
+        expected, _ = self._query_count(host.list_hosts)
+        self._add_hosts(1000)
+        count, hosts = self._query_count(host.list_hosts)
+        self.assertEqual(len(hosts), 1002)
+        self.assertEqual(count, expected)
+
+    def test_list_machines_or_hosts(self):
+        expected, _ = self._query_count(host.list_machines_or_hosts)
+        self._add_hosts(1000)
+        count, hosts = self._query_count(host.list_machines_or_hosts)
+        self.assertEqual(len(hosts), 1002)
+        self.assertEqual(count, expected)
+
+    def test_list_hosts_fields(self):
+        fields = ['name', 'mac', 'os_installed', 'tag']
+        expected, _ = self._query_count(host.list_hosts, fields=fields)
+        self._add_hosts(1000)
+        count, hosts = self._query_count(host.list_hosts, fields=fields)
+        self.assertEqual(len(hosts), 1002)
+        self.assertEqual(count, expected)
+        for host_dict in hosts:
+            self.assertEqual(set(fields), set(host_dict))
+
+    def test_list_clusterhosts(self):
+        expected, _ = self._query_count(cluster.list_clusterhosts)
+        self._add_hosts(1000)
+        count, clusterhosts = self._query_count(cluster.list_clusterhosts)
+        self.assertEqual(len(clusterhosts), 1002)
+        self.assertEqual(count, expected)
+
+    def test_list_switchmachines_hosts(self):
+        expected, _ = self._query_count(switch.list_switchmachines_hosts)
+        self._add_hosts(1000)
+        count, hosts = self._query_count(switch.list_switchmachines_hosts)
+        self.assertEqual(len(hosts), 1002)
+        self.assertEqual(count, expected)
+
+
 class TestListMachinesOrHosts(HostTestCase):
     """Test list machines or hosts."""
 
@@ -676,6 +765,75 @@ class TestPatchHostConfig(HostTestCase):
         )
 
 
+class TestHostConfigTracking(HostTestCase):
+    """Test host config json is only decoded and written when needed."""
+
+    def setUp(self):
+        super(TestHostConfigTracking, self).setUp()
+        self.os_configs['partition'].update(
+            ('/large_config_value%s' % i, {
+                'max_size': '1G', 'percentage': 0, 'size': '1G'
+            })
+            for i in range(500)
+        )
+        for host_id in self.host_ids:
+            host.update_host_config(
+                self.user_object, host_id, os_config=self.os_configs
+            )
+        self.statements = []
+        event.listen(
+            database.ENGINE, 'before_cursor_execute',
+            self._add_statement
+        )
+
+    def tearDown(self):
+        event.remove(
+            database.ENGINE, 'before_cursor_execute',
+            self._add_statement
+        )
+        super(TestHostConfigTracking, self).tearDown()
+
+    def _add_statement(self, *args, **kwargs):
+        self.statements.append(args[2])
+
+    def _config_updates(self):
+        return [
+            statement for statement in self.statements
+            if statement.startswith('UPDATE') and 'os_config' in statement
+        ]
+
+    def test_patch_unchanged_host_config(self):
+        host.patch_host_config(
+            self.user_object, self.host_ids[0],
+            os_config={'general': {'ntp_server': '127.0.0.1'}}
+        )
+        self.assertEqual(self._config_updates(), [])
+
+    def test_patch_changed_host_config(self):
+        host.patch_host_config(
+            self.user_object, self.host_ids[0],
+            os_config={'general': {'ntp_server': '127.0.0.2'}}
+        )
+        self.assertEqual(len(self._config_updates()), 1)
+        os_config = host.get_host_config(
+            self.user_object, self.host_ids[0]
+        )['os_config']
+        self.assertEqual(os_config['general']['ntp_server'], '127.0.0.2')
+        self.assertEqual(os_config['general']['domain'], 'ods.com')
+        self.assertIn('/large_config_value0', os_config['partition'])
+
+    def test_list_hosts_not_load_config(self):
+        with mock.patch.object(
+            models.json, 'loads', wraps=models.json.loads
+        ) as mock_loads:
+            hosts = host.list_hosts(self.user_object)
+        self.assertEqual(len(hosts), len(self.host_ids))
+        for call_args in mock_loads.call_args_list:
+            self.assertNotIn('large_config_value', call_args[0][0])
+        for statement in self.statements:
+            self.assertNotIn('host.os_config', statement)
+
+
 class TestDelHostConfig(HostTestCase):
     """Test delete host config."""
 
@@ -846,6 +1004,24 @@ class TestAddHostNetwork(HostTestCase):
             subnet_id=self.subnet_ids[0]
         )
 
+    def test_auto_ip(self):
+        for interface in ['eth1', 'eth2']:
+            host.add_host_network(
+                self.user_object,
+                self.host_ids[0],
+                interface=interface,
+                ip='auto',
+                subnet_id=self.subnet_ids[0]
+            )
+        host_networks = host.list_host_networks(
+            self.user_object,
+            self.host_ids[0]
+        )
+        self.assertItemsEqual(
+            ['10.145.88.0', '10.145.88.1', '10.145.88.2'],
+            [host_network['ip'] for host_network in host_networks]
+        )
+
 
 class TestAddHostNetworks(HostTestCase):
     """Test add host networks."""
@@ -891,6 +1067,91 @@ class TestAddHostNetworks(HostTestCase):
         self.assertIn('10.145.88.0', fail_ip)
 
 
+class TestAllocateHostNetworks(HostTestCase):
+    """Test allocate host networks."""
+
+    def setUp(self):
+        super(TestAllocateHostNetworks, self).setUp()
+
+    def tearDown(self):
+        super(TestAllocateHostNetworks, self).tearDown()
+
+    def test_allocate_host_networks(self):
+        result = host.allocate_host_networks(
+            self.user_object,
+            self.subnet_ids[0],
+            data=[
+                {'host_id': self.host_ids[0], 'interface': 'eth1'},
+                {'host_id': self.host_ids[1], 'interface': 'eth1'},
+                {'host_id': 99, 'interface': 'eth1'},
+                {'host_id': self.host_ids[1], 'interface': 'eth2'}
+            ]
+        )
+        self.assertEqual(
+            [
+                (self.host_ids[0], 'eth1', '10.145.88.1'),
+                (self.host_ids[1], 'eth2', '10.145.88.2')
+            ],
+            [
+                (
+                    host_network['host_id'], host_network['interface'],
+                    host_network['ip']
+                )
+                for host_network in result['host_networks']
+            ]
+        )
+        self.assertEqual(
+            [self.host_ids[1], 99],
+            [
+                host_network['host_id']
+                for host_network in result['failed_host_networks']
+            ]
+        )
+
+    def test_allocate_host_networks_invalid(self):
+        result = host.allocate_host_networks(
+            self.user_object,
+            self.subnet_ids[0],
+            data=[
+                {
+                    'host_id': self.host_ids[0],
+                    'interface': 'eth1',
+                    'is_mgmt': True
+                },
+                {
+                    'host_id': self.host_ids[1],
+                    'interface': 'eth2',
+                    'is_mgmt': True
+                },
+                {
+                    'host_id': self.host_ids[1],
+                    'interface': 'eth3',
+                    'is_mgmt': True
+                },
+                {
+                    'host_id': self.host_ids[1],
+                    'interface': 'eth4',
+                    'is_promiscuous': 'yes'
+                },
+                {'host_id': self.host_ids[0], 'interface': 'eth5'}
+            ]
+        )
+        self.assertEqual(
+            [(self.host_ids[1], 'eth2'), (self.host_ids[0], 'eth5')],
+            [
+                (host_network['host_id'], host_network['interface'])
+                for host_network in result['host_networks']
+            ]
+        )
+        self.assertEqual(
+            ['eth1', 'eth3', 'eth4'],
+            [
+                host_network['interface']
+                for host_network in result['failed_host_networks']
+            ]
+        )
+
+
 class TestUpdateHostNetwork(HostTestCase):
     """Test update host network."""
 
@@ -30,6 +30,7 @@ from compass.db.api import machine
 from compass.db.api import switch
 from compass.db.api import user as user_api
 from compass.db import exception
+from compass.db import models
 from compass.utils import flags
 from compass.utils import logsetting
 
@@ -76,6 +77,44 @@ class TestListMachines(BaseTest):
         list_machine = machine.list_machines(self.user_object)
         self.assertIsNotNone(list_machine)
 
+    def test_list_machines_by_attributes(self):
+        for mac, tag, location in [
+            ('28:6e:d4:46:c4:25', {'rack': 'r1'}, {'row': 1}),
+            ('28:6e:d4:46:c4:26', {'rack': 'r2'}, {'row': 1}),
+            ('28:6e:d4:46:c4:27', {'rack': 'r1'}, {'row': 2})
+        ]:
+            switch.add_switch_machine(
+                self.user_object,
+                1,
+                mac=mac,
+                port='1',
+                tag=tag,
+                location=location
+            )
+        filters = {
+            'tag': {'resp_in': [{'rack': 'r1'}]},
+            'location': {'resp_eq': {'row': 1}}
+        }
+        with database.session() as session:
+            conditions = machine.pop_attributes_conditions(filters)
+            self.assertEqual({}, filters)
+            machines = session.query(models.Machine).filter(
+                *conditions
+            ).all()
+            self.assertEqual(
+                ['28:6e:d4:46:c4:25'],
+                [machine_object.mac for machine_object in machines]
+            )
+        list_machine = machine.list_machines(
+            self.user_object,
+            tag={'resp_in': [{'rack': 'r1'}]},
+            location={'resp_eq': {'row': 1}}
+        )
+        self.assertEqual(
+            ['28:6e:d4:46:c4:25'],
+            [machine_dict['mac'] for machine_dict in list_machine]
+        )
+
 
 class TestUpdateMachine(BaseTest):
     """Test update machine."""
@@ -132,6 +171,30 @@ class TestPatchMachine(BaseTest):
             item in patch_machine[0].items() for item in expected.items()
         )
 
+    def test_patch_machine_attributes(self):
+        switch.add_switch_machine(
+            self.user_object,
+            1,
+            mac='28:6e:d4:46:c4:25',
+            port='1',
+            tag={'rack': 'r1', 'row': 1}
+        )
+        machine.patch_machine(
+            self.user_object,
+            1,
+            tag={'rack': 'r2'},
+            location={'room': 'a' * 300}
+        )
+        with database.session() as session:
+            attributes = session.query(models.MachineAttribute).all()
+            self.assertItemsEqual(
+                [('tag', 'rack', '"r2"'), ('tag', 'row', '1')],
+                [
+                    (attribute.namespace, attribute.key, attribute.value)
+                    for attribute in attributes
+                ]
+            )
+
 
 class TestDelMachine(BaseTest):
     """Test delete machine."""
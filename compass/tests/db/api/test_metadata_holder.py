@@ -262,6 +262,92 @@ class TestGetPackageOsMetadata(MetadataTestCase):
         )
 
 
+class TestValidateConfig(MetadataTestCase):
+    """Test validate config by compiled validators."""
+
+    METADATA = {
+        'general': {
+            '_self': {
+                'field_type': dict,
+                'required_in_whole_config': True
+            },
+            'language': {
+                '_self': {
+                    'is_required': True,
+                    'options': ['EN', 'CN'],
+                    'required_in_options': True
+                }
+            },
+            'servers': {
+                '_self': {
+                    'field_type': list,
+                    'options': ['a', 'b'],
+                    'required_in_options': True
+                }
+            }
+        },
+        'partition': {
+            '$partition': {
+                '_self': {'field_type': dict},
+                'size': {
+                    '_self': {
+                        'field_type': int,
+                        'validator': lambda key, value, **kwargs: value > 0
+                    }
+                }
+            }
+        }
+    }
+
+    def setUp(self):
+        super(TestValidateConfig, self).setUp()
+        self.validator = metadata_api.ConfigValidator(self.METADATA)
+
+    def tearDown(self):
+        super(TestValidateConfig, self).tearDown()
+
+    def test_validate_config(self):
+        config = {
+            'general': {'language': 'EN', 'servers': ['a']},
+            'partition': {'/var': {'size': 1}, '/home': {'size': 2}}
+        }
+        self.validator.validate(config, True)
+        self.validator.validate({'partition': {}}, False)
+
+    def test_validate_invalid_config(self):
+        for config, whole_check in [
+            ({'partition': {}}, True),
+            ({'general': {}}, False),
+            ({'general': {'language': 'JP'}}, False),
+            ({'general': {'language': 'EN', 'servers': ['c']}}, False),
+            ({'general': {'language': 1}}, False),
+            ({'partition': {'/var': {'size': 0}}}, False),
+            ({'partition': {'/var': {'unknown': 1}}}, False),
+            ({'unknown': {}}, False)
+        ]:
+            self.assertRaises(
+                exception.InvalidParameter,
+                self.validator.validate, config, whole_check
+            )
+
+    def test_validate_os_config_reloaded(self):
+        config = {
+            'server_credentials': {'username': 'root', 'password': 'root'}
+        }
+        with database.session() as session:
+            metadata.validate_os_config(session, config, self.os_id)
+            with mock.patch.object(
+                metadata.OS_METADATA_SNAPSHOT, 'build_func'
+            ) as mock_build:
+                mock_build.return_value = {self.os_id: {}}
+                metadata.load_os_metadatas_internal(session)
+            self.assertRaises(
+                exception.InvalidParameter,
+                metadata.validate_os_config,
+                session, config, self.os_id
+            )
+
+
 if __name__ == '__main__':
     flags.init()
     logsetting.init()
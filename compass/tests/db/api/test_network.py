@@ -15,6 +15,7 @@
 
 import datetime
 import logging
+import netaddr
 import os
 import unittest2
 
@@ -30,7 +31,9 @@ from base import BaseTest
 from compass.db.api import database
 from compass.db.api import network
 from compass.db.api import user as user_api
+from compass.db.api import utils
 from compass.db import exception
+from compass.db import models
 from compass.utils import flags
 from compass.utils import logsetting
 
@@ -180,6 +183,107 @@ class TestDelSubnet(BaseTest):
         )
 
 
+class TestAllocateIps(BaseTest):
+    """Test allocate ips in subnet."""
+
+    def setUp(self):
+        super(TestAllocateIps, self).setUp()
+        self.subnet_id = network.add_subnet(
+            self.user_object,
+            subnet='10.145.89.0/24',
+            gateway='10.145.89.1',
+            ip_ranges=[['10.145.89.1', '10.145.89.20']],
+            excluded_ip_ranges=[['10.145.89.5', '10.145.89.9']]
+        )['id']
+
+    def tearDown(self):
+        super(TestAllocateIps, self).tearDown()
+
+    def _allocate(self, count):
+        with database.session() as session:
+            subnet = utils.get_db_object(
+                session, models.Subnet, id=self.subnet_id
+            )
+            return [
+                str(netaddr.IPAddress(ip_int))
+                for ip_int in network.allocate_ips_internal(
+                    session, subnet, count
+                )
+            ]
+
+    def test_allocate_ips(self):
+        self.assertEqual(
+            ['10.145.89.2', '10.145.89.3', '10.145.89.4', '10.145.89.10'],
+            self._allocate(4)
+        )
+        self.assertEqual(['10.145.89.11'], self._allocate(1))
+        with database.session() as session:
+            self.assertEqual(
+                [(12, 20)],
+                [
+                    (
+                        free_range.ip_int_start & 0xff,
+                        free_range.ip_int_end & 0xff
+                    )
+                    for free_range in utils.list_db_objects(
+                        session, models.SubnetFreeRange
+                    )
+                ]
+            )
+
+    def test_not_enough_ips(self):
+        self.assertEqual(14, len(self._allocate(20)))
+
+    def test_update_subnet_rebuilds_free_ranges(self):
+        self._allocate(12)
+        network.update_subnet(
+            self.user_object,
+            self.subnet_id,
+            ip_ranges=[['10.145.89.100', '10.145.89.101']]
+        )
+        self.assertEqual(
+            ['10.145.89.100', '10.145.89.101'], self._allocate(3)
+        )
+
+    def test_lock_subnet(self):
+        with database.session() as session:
+            subnet = utils.get_db_object(
+                session, models.Subnet, id=self.subnet_id
+            )
+            session.execute(
+                models.Subnet.__table__.update().values(
+                    gateway='10.145.89.2'
+                )
+            )
+            self.assertIs(
+                subnet,
+                network.lock_subnet_internal(session, self.subnet_id)
+            )
+            self.assertEqual('10.145.89.2', subnet.gateway)
+        with database.session() as session:
+            self.assertRaises(
+                exception.RecordNotExists,
+                network.lock_subnet_internal,
+                session, 100
+            )
+
+    def test_invalid_ip_ranges(self):
+        self.assertRaises(
+            exception.InvalidParameter,
+            network.update_subnet,
+            self.user_object,
+            self.subnet_id,
+            ip_ranges=[['10.145.89.20', '10.145.89.1']]
+        )
+        self.assertRaises(
+            exception.InvalidParameter,
+            network.update_subnet,
+            self.user_object,
+            self.subnet_id,
+            excluded_ip_ranges=[['10.145.90.1', '10.145.90.2']]
+        )
+
+
 if __name__ == '__main__':
     flags.init()
     unittest2.main()
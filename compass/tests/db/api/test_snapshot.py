@@ -0,0 +1,115 @@
+# Copyright 2014 Huawei Technologies Co. Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest2
+
+
+os.environ['COMPASS_IGNORE_SETTING'] = 'true'
+
+
+from compass.utils import setting_wrapper as setting
+reload(setting)
+
+
+from base import BaseTest
+from compass.db.api import adapter_holder
+from compass.db.api import database
+from compass.db.api import metadata_holder
+from compass.db.api import snapshot
+from compass.utils import flags
+from compass.utils import logsetting
+
+
+class TestSnapshot(BaseTest):
+    """Test versioned snapshot."""
+
+    def setUp(self):
+        super(TestSnapshot, self).setUp()
+        setting.METADATA_SNAPSHOT_CHECK_INTERVAL = '0s'
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.builds = []
+
+    def tearDown(self):
+        shutil.rmtree(self.snapshot_dir)
+        super(TestSnapshot, self).tearDown()
+
+    def _build(self, session):
+        self.builds.append(len(self.builds))
+        return {'build': len(self.builds)}
+
+    def _bump(self, name):
+        with database.session() as session:
+            snapshot.bump_versions(session, [name])
+
+    def _get(self, test_snapshot):
+        with database.session() as session:
+            return test_snapshot.get(session)
+
+    def test_create_db_bumps_versions(self):
+        with database.session() as session:
+            for name in snapshot.BOOTSTRAP_SNAPSHOTS:
+                self.assertIsNotNone(snapshot.get_version(session, name))
+            self.assertIsNone(snapshot.get_version(session, 'test'))
+
+    def test_reload_when_version_changes(self):
+        test_snapshot = snapshot.Snapshot('test', self._build)
+        self.assertEqual({'build': 1}, self._get(test_snapshot))
+        self.assertEqual({'build': 1}, self._get(test_snapshot))
+        self._bump('test')
+        self.assertEqual({'build': 2}, self._get(test_snapshot))
+        self.assertEqual({'build': 2}, self._get(test_snapshot))
+
+    def test_not_checked_in_interval(self):
+        setting.METADATA_SNAPSHOT_CHECK_INTERVAL = '1h'
+        test_snapshot = snapshot.Snapshot('test', self._build)
+        self._get(test_snapshot)
+        self._bump('test')
+        self.assertEqual({'build': 1}, self._get(test_snapshot))
+
+    def test_shared_snapshot_file(self):
+        setting.METADATA_SNAPSHOT_DIR = self.snapshot_dir
+        self._bump('test')
+        test_snapshot = snapshot.Snapshot('test', self._build)
+        other_snapshot = snapshot.Snapshot('test', self._build)
+        self.assertEqual({'build': 1}, self._get(test_snapshot))
+        self.assertEqual({'build': 1}, self._get(other_snapshot))
+        self.assertEqual(1, len(self.builds))
+        self._bump('test')
+        self.assertEqual({'build': 2}, self._get(other_snapshot))
+        self.assertEqual({'build': 2}, self._get(test_snapshot))
+        self.assertEqual(1, len(os.listdir(self.snapshot_dir)))
+
+    def test_holders_load_shared_snapshot_file(self):
+        setting.METADATA_SNAPSHOT_DIR = self.snapshot_dir
+        adapter_holder.load_adapters()
+        metadata_holder.load_metadatas()
+        self.assertEqual(3, len(os.listdir(self.snapshot_dir)))
+        os_metadatas = dict(
+            metadata_holder.OS_METADATA_SNAPSHOT.data
+        )
+        metadata_holder.OS_METADATA_SNAPSHOT.data = None
+        with database.session() as session:
+            self.assertEqual(
+                os_metadatas,
+                metadata_holder.OS_METADATA_SNAPSHOT.get(session)
+            )
+
+
+if __name__ == '__main__':
+    flags.init()
+    logsetting.init()
+    unittest2.main()
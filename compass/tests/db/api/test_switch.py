@@ -331,6 +331,50 @@ class TestListSwitchMachines(BaseTest):
         )
         self.assertIsNotNone(list_switch_machines)
 
+    def test_list_switch_machines_filters_in_sql(self):
+        switch.add_switch(
+            self.user_object,
+            ip='2887583784'
+        )
+        for mac, port, vlans in [
+            ('28:6e:d4:46:c4:25', 'ae1/10', [88]),
+            ('28:6e:d4:46:c4:26', 'ae1/20', [88, 100]),
+            ('28:6e:d4:46:c4:27', 'ae1/30', [100]),
+            ('28:6e:d4:46:c4:28', 'xe1/20', [88])
+        ]:
+            switch.add_switch_machine(
+                self.user_object,
+                2,
+                mac=mac,
+                port=port,
+                vlans=vlans
+            )
+        filters = {
+            'port': {
+                'startswith': 'ae1/',
+                'resp_ge': 15,
+                'resp_range': [(10, 20), (30, 40)]
+            },
+            'vlans': {'resp_in': [88]}
+        }
+        with database.session() as session:
+            switch_machines = switch.get_switch_machines_internal(
+                session, switch_id=2, **filters
+            )
+            self.assertEqual(
+                ['28:6e:d4:46:c4:26'],
+                [switch_machine.mac for switch_machine in switch_machines]
+            )
+        list_switch_machines = switch.list_switch_machines(
+            self.user_object,
+            2,
+            **filters
+        )
+        self.assertEqual(
+            ['28:6e:d4:46:c4:26'],
+            [switch_machine['mac'] for switch_machine in list_switch_machines]
+        )
+
 
 class TestListSwitchmachines(BaseTest):
     """Test list switch machines."""
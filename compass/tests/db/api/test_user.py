@@ -14,6 +14,7 @@
 
 import datetime
 import logging
+import mock
 import os
 import unittest2
 
@@ -27,6 +28,7 @@ reload(setting)
 
 from base import BaseTest
 from compass.db.api import database
+from compass.db.api import switch
 from compass.db.api import user as user_api
 from compass.db import exception
 from compass.utils import flags
@@ -350,6 +352,223 @@ class TestUpdatePermissions(BaseTest):
         self.assertEqual(result, 'list_switches')
 
 
+class TestUserPermissionsCache(BaseTest):
+    """Test user permissions cache."""
+
+    def setUp(self):
+        super(TestUserPermissionsCache, self).setUp()
+        user_api.add_user(
+            self.user_object,
+            email='dummy@abc.com',
+            password='dummy',
+            is_admin=False
+        )
+        self.dummy_object = user_api.get_user_object('dummy@abc.com')
+
+    def tearDown(self):
+        super(TestUserPermissionsCache, self).tearDown()
+
+    def test_permissions_cached(self):
+        self.assertRaises(
+            exception.Forbidden,
+            switch.list_switches,
+            self.dummy_object
+        )
+        self.assertIn(self.dummy_object.id, user_api.USER_PERMISSIONS_CACHE)
+        with mock.patch.object(
+            user_api.utils, 'list_db_objects'
+        ) as mock_list:
+            self.assertRaises(
+                exception.Forbidden,
+                switch.list_switches,
+                self.dummy_object
+            )
+            self.assertFalse(mock_list.called)
+
+    def test_add_del_permission(self):
+        self.assertRaises(
+            exception.Forbidden,
+            switch.list_switches,
+            self.dummy_object
+        )
+        user_api.add_permission(
+            self.user_object,
+            self.dummy_object.id,
+            permission_id=2
+        )
+        self.assertIsNotNone(switch.list_switches(self.dummy_object))
+        user_api.del_permission(
+            self.user_object,
+            self.dummy_object.id,
+            2
+        )
+        self.assertRaises(
+            exception.Forbidden,
+            switch.list_switches,
+            self.dummy_object
+        )
+
+    def test_update_permissions(self):
+        self.assertRaises(
+            exception.Forbidden,
+            switch.list_switches,
+            self.dummy_object
+        )
+        user_api.update_permissions(
+            self.user_object,
+            self.dummy_object.id,
+            add_permissions=2
+        )
+        self.assertIsNotNone(switch.list_switches(self.dummy_object))
+
+    def test_update_user(self):
+        switch.list_switches(self.user_object)
+        self.assertRaises(
+            exception.Forbidden,
+            switch.list_switches,
+            self.dummy_object
+        )
+        user_api.update_user(
+            self.user_object,
+            self.dummy_object.id,
+            active=True
+        )
+        self.assertNotIn(
+            self.dummy_object.id, user_api.USER_PERMISSIONS_CACHE
+        )
+
+    def test_update_user_in_session(self):
+        self.assertRaises(
+            exception.Forbidden,
+            switch.list_switches,
+            self.dummy_object
+        )
+        database.begin_session()
+        try:
+            user_api.update_user(
+                self.user_object,
+                self.dummy_object.id,
+                active=True
+            )
+            self.assertIn(
+                self.dummy_object.id, user_api.USER_PERMISSIONS_CACHE
+            )
+        finally:
+            database.end_session()
+        self.assertNotIn(
+            self.dummy_object.id, user_api.USER_PERMISSIONS_CACHE
+        )
+
+    def test_broadcast_invalidation(self):
+        setting.USER_CACHE_BROADCAST = True
+        with mock.patch.object(user_api.redis, 'Redis') as mock_redis:
+            user_api.invalidate_user_permissions(self.dummy_object.id)
+            mock_redis.return_value.publish.assert_called_once_with(
+                setting.USER_CACHE_CHANNEL,
+                'permissions:%s' % self.dummy_object.id
+            )
+
+    def test_receive_invalidation(self):
+        self.assertRaises(
+            exception.Forbidden,
+            switch.list_switches,
+            self.dummy_object
+        )
+        user_api._handle_user_cache_invalidation({
+            'data': 'permissions:%s' % self.dummy_object.id
+        })
+        self.assertNotIn(
+            self.dummy_object.id, user_api.USER_PERMISSIONS_CACHE
+        )
+
+
+class TestUserTokenCache(BaseTest):
+    """Test user token cache."""
+
+    def setUp(self):
+        super(TestUserTokenCache, self).setUp()
+        self.expire_timestamp = (
+            datetime.datetime.now() + datetime.timedelta(seconds=10000)
+        )
+        user_api.record_user_token(
+            self.user_object,
+            'test_token',
+            self.expire_timestamp
+        )
+        user_api.get_user_object_from_token('test_token')
+
+    def tearDown(self):
+        super(TestUserTokenCache, self).tearDown()
+
+    def test_token_cached(self):
+        stats = user_api.get_user_token_cache_stats(self.user_object)
+        with mock.patch.object(
+            user_api, '_get_user_dict_from_token'
+        ) as mock_get:
+            user_object = user_api.get_user_object_from_token('test_token')
+            self.assertFalse(mock_get.called)
+        self.assertEqual(user_object.email, setting.COMPASS_ADMIN_EMAIL)
+        new_stats = user_api.get_user_token_cache_stats(self.user_object)
+        self.assertEqual(new_stats['hits'], stats['hits'] + 1)
+        self.assertEqual(new_stats['misses'], stats['misses'])
+
+    def test_cache_capped_by_token_expire_timestamp(self):
+        expire_timestamp, _, _ = user_api.USER_TOKEN_CACHE['test_token']
+        self.assertLessEqual(expire_timestamp, self.expire_timestamp)
+        user_api.record_user_token(
+            self.user_object,
+            'expiring_token',
+            datetime.datetime.now() + datetime.timedelta(seconds=1)
+        )
+        user_api.get_user_object_from_token('expiring_token')
+        expire_timestamp, _, _ = user_api.USER_TOKEN_CACHE['expiring_token']
+        self.assertLessEqual(
+            expire_timestamp,
+            datetime.datetime.now() + datetime.timedelta(seconds=1)
+        )
+
+    def test_clean_user_token(self):
+        user_api.clean_user_token(self.user_object, 'test_token')
+        self.assertNotIn('test_token', user_api.USER_TOKEN_CACHE)
+        self.assertRaises(
+            exception.Unauthorized,
+            user_api.get_user_object_from_token,
+            'test_token'
+        )
+
+    def test_update_user(self):
+        user_api.update_user(
+            self.user_object,
+            self.user_object.id,
+            firstname='a'
+        )
+        self.assertNotIn('test_token', user_api.USER_TOKEN_CACHE)
+
+    def test_lru_eviction(self):
+        setting.USER_TOKEN_CACHE_SIZE = 1
+        stats = user_api.get_user_token_cache_stats(self.user_object)
+        user_api.record_user_token(
+            self.user_object,
+            'other_token',
+            self.expire_timestamp
+        )
+        user_api.get_user_object_from_token('other_token')
+        self.assertEqual(
+            user_api.USER_TOKEN_CACHE.keys(), ['other_token']
+        )
+        self.assertEqual(
+            user_api.get_user_token_cache_stats(
+                self.user_object
+            )['evictions'],
+            stats['evictions'] + stats['size']
+        )
+
+    def test_receive_token_invalidation(self):
+        user_api._handle_user_cache_invalidation({
+            'data': 'token:test_token'
+        })
+        self.assertNotIn('test_token', user_api.USER_TOKEN_CACHE)
+
 if __name__ == '__main__':
     flags.init()
     logsetting.init()
@@ -13,8 +13,12 @@
 # limitations under the License.
 
 import datetime
+import gzip
 import logging
 import os
+import shutil
+import simplejson as json
+import tempfile
 import unittest2
 
 
@@ -87,6 +91,48 @@ class TestListActions(BaseTest):
         self.assertIsNotNone(action)
 
 
+class TestListActionsPages(BaseTest):
+    """Test list actions in pages."""
+
+    def setUp(self):
+        super(TestListActionsPages, self).setUp()
+        now = datetime.datetime.now()
+        user_log.add_user_actions([
+            {
+                'user_id': self.user_object.id,
+                'action': '/testaction%s' % i,
+                'timestamp': now - datetime.timedelta(seconds=i % 3)
+            }
+            for i in range(7)
+        ])
+
+    def tearDown(self):
+        super(TestListActionsPages, self).tearDown()
+
+    def test_list_actions_pages(self):
+        actions = user_log.list_actions(self.user_object)
+        pages = []
+        cursor = None
+        while True:
+            page = user_log.list_actions(
+                self.user_object, limit=3, cursor=cursor
+            )
+            pages.append(page)
+            cursor = page.next_cursor
+            if not cursor:
+                break
+        self.assertEqual(
+            [3, 3, 1], [len(listed_page) for listed_page in pages]
+        )
+        self.assertEqual(
+            [action['timestamp'] for action in actions],
+            [
+                action['timestamp']
+                for listed_page in pages for action in listed_page
+            ]
+        )
+
+
 class TestDelUserActions(BaseTest):
     """Test delete user actions."""
 
@@ -135,6 +181,136 @@ class TestDelActions(BaseTest):
         self.assertEqual([], del_action)
 
 
+class TestUserActionLogger(BaseTest):
+    """Test buffered user action logger."""
+
+    def setUp(self):
+        super(TestUserActionLogger, self).setUp()
+
+    def tearDown(self):
+        super(TestUserActionLogger, self).tearDown()
+
+    def _count_actions(self):
+        return len(user_log.list_user_actions(
+            self.user_object,
+            self.user_object.id
+        ))
+
+    def test_flush(self):
+        logger = user_log.UserActionLogger(flush_size=2)
+        for i in range(5):
+            logger.log(self.user_object.id, '/testaction%s' % i)
+        self.assertEqual(0, self._count_actions())
+        logger.flush()
+        self.assertEqual(5, self._count_actions())
+
+    def test_stop(self):
+        logger = user_log.UserActionLogger()
+        logger.log(self.user_object.id, '/testaction')
+        logger.stop()
+        self.assertEqual(1, self._count_actions())
+
+    def test_queue_full_sync(self):
+        logger = user_log.UserActionLogger(queue_size=1)
+        logger.log(self.user_object.id, '/testaction1')
+        logger.log(self.user_object.id, '/testaction2')
+        self.assertEqual(1, self._count_actions())
+        logger.flush()
+        self.assertEqual(2, self._count_actions())
+
+    def test_queue_full_drop(self):
+        logger = user_log.UserActionLogger(
+            queue_size=1, full_policy='drop'
+        )
+        logger.log(self.user_object.id, '/testaction1')
+        logger.log(self.user_object.id, '/testaction2')
+        self.assertEqual(1, logger.dropped)
+        logger.flush()
+        self.assertEqual(1, self._count_actions())
+
+    def test_invalid_full_policy(self):
+        self.assertRaises(
+            exception.InvalidParameter,
+            user_log.UserActionLogger,
+            full_policy='xxx'
+        )
+
+    def test_log_user_action_unbuffered(self):
+        user_log.log_user_action_buffered(
+            self.user_object.id, '/testaction'
+        )
+        self.assertEqual(1, self._count_actions())
+
+
+class TestPruneUserActions(BaseTest):
+    """Test prune user actions."""
+
+    def setUp(self):
+        super(TestPruneUserActions, self).setUp()
+        now = datetime.datetime.now()
+        user_log.add_user_actions([
+            {
+                'user_id': self.user_object.id,
+                'action': '/oldaction%s' % i,
+                'timestamp': now - datetime.timedelta(days=10, seconds=i)
+            }
+            for i in range(5)
+        ] + [{
+            'user_id': self.user_object.id,
+            'action': '/newaction',
+            'timestamp': now
+        }])
+        self.archive_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.archive_dir)
+        super(TestPruneUserActions, self).tearDown()
+
+    def _count_actions(self):
+        return len(user_log.list_user_actions(
+            self.user_object,
+            self.user_object.id
+        ))
+
+    def test_prune(self):
+        pruned = user_log.prune_user_actions(
+            retention='1d', batch_size=2, archive_dir=''
+        )
+        self.assertEqual(5, pruned)
+        self.assertEqual(1, self._count_actions())
+
+    def test_prune_archive(self):
+        user_log.prune_user_actions(
+            retention='1d', batch_size=2, archive_dir=self.archive_dir
+        )
+        archive_files = os.listdir(self.archive_dir)
+        self.assertEqual(1, len(archive_files))
+        archive_file = gzip.open(
+            os.path.join(self.archive_dir, archive_files[0])
+        )
+        try:
+            actions = [json.loads(line)['action'] for line in archive_file]
+        finally:
+            archive_file.close()
+        self.assertItemsEqual(
+            ['/oldaction%s' % i for i in range(5)], actions
+        )
+
+    def test_prune_without_retention(self):
+        pruned = user_log.prune_user_actions(
+            retention='', archive_dir=''
+        )
+        self.assertEqual(0, pruned)
+        self.assertEqual(6, self._count_actions())
+
+    def test_prune_invalid_batch_size(self):
+        self.assertRaises(
+            exception.InvalidParameter,
+            user_log.prune_user_actions,
+            retention='1d', batch_size=0, archive_dir=''
+        )
+
+
 if __name__ == '__main__':
     flags.init()
     logsetting.init()
@@ -16,6 +16,8 @@ import logging
 import os
 import unittest2
 
+from sqlalchemy import event
+from sqlalchemy import inspect
 
 os.environ['COMPASS_IGNORE_SETTING'] = 'true'
 
@@ -256,6 +258,34 @@ class TestModelFilter(unittest2.TestCase):
 
         self.assertEqual([3, 4, 5, 6], key_list)
 
+    def test_filter_with_dict_resp_in_json(self):
+        with database.session() as session:
+            for mac, tag in [
+                ('00:00:00:00:00:01', {'rack': 'r1', 'usage': '10%'}),
+                ('00:00:00:00:00:02', {'rack': 'r2', 'usage': '10_'}),
+                ('00:00:00:00:00:03', {'rack': 'r1', 'enabled': True})
+            ]:
+                utils.add_db_object(
+                    session, models.Machine, True, mac, tag=tag
+                )
+            query = utils.model_query(session, models.Machine)
+            machines = utils.model_filter(
+                query, models.Machine,
+                tag={'resp_in': [{'usage': '10%'}, {'enabled': 1}]}
+            )
+            self.assertItemsEqual(
+                ['00:00:00:00:00:01', '00:00:00:00:00:03'],
+                [machine.mac for machine in machines.all()]
+            )
+            machines = utils.model_filter(
+                query, models.Machine,
+                tag={'resp_eq': {'rack': 'r1'}}
+            )
+            self.assertItemsEqual(
+                ['00:00:00:00:00:01', '00:00:00:00:00:03'],
+                [machine.mac for machine in machines.all()]
+            )
+
     def test_filter_with_other_type(self):
         with database.session() as session:
             query = utils.model_query(session, models.Permission)
@@ -420,6 +450,125 @@ class TestAddDbObject(unittest2.TestCase):
             self.assertEqual('test1', db_objs.alias)
 
 
+class TestAddDbObjects(unittest2.TestCase):
+    def setUp(self):
+        super(TestAddDbObjects, self).setUp()
+        reload(setting)
+        setting.CONFIG_DIR = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            'data'
+        )
+        database.init('sqlite://')
+        database.create_db()
+        self.statements = []
+        event.listen(
+            database.ENGINE, 'before_cursor_execute',
+            self._add_statement
+        )
+
+    def tearDown(self):
+        event.remove(
+            database.ENGINE, 'before_cursor_execute',
+            self._add_statement
+        )
+        database.drop_db()
+        reload(setting)
+        super(TestAddDbObjects, self).tearDown()
+
+    def _add_statement(self, *args, **kwargs):
+        self.statements.append(args[2])
+
+    def _selects(self):
+        return [
+            statement for statement in self.statements
+            if statement.startswith('SELECT')
+        ]
+
+    def test_add_objects(self):
+        with database.session() as session:
+            self.statements = []
+            db_objs = utils.add_db_objects(
+                session, models.Permission, [
+                    {'name': 'test%s' % i, 'alias': 'alias%s' % i}
+                    for i in range(1000)
+                ]
+            )
+            self.assertEqual(
+                len(self._selects()), 1000 / utils.BULK_QUERY_SIZE
+            )
+            self.assertEqual(
+                [db_obj.name for db_obj in db_objs],
+                ['test%s' % i for i in range(1000)]
+            )
+            self.assertEqual('alias1', db_objs[1].alias)
+            self.assertIsNotNone(db_objs[1].id)
+
+    def test_add_duplicate_error(self):
+        with self.assertRaises(exception.DuplicatedRecord):
+            with database.session() as session:
+                utils.add_db_object(session, models.Permission, True, 'test')
+                utils.add_db_objects(
+                    session, models.Permission,
+                    [{'name': 'test1'}, {'name': 'test'}]
+                )
+
+    def test_add_duplicate_in_rows(self):
+        with self.assertRaises(exception.DuplicatedRecord):
+            with database.session() as session:
+                utils.add_db_objects(
+                    session, models.Permission,
+                    [{'name': 'test'}, {'name': 'test'}]
+                )
+
+    def test_add_duplicate_ignore(self):
+        with database.session() as session:
+            db_obj = utils.add_db_object(
+                session, models.Permission, True, 'test', alias='test'
+            )
+            db_objs = utils.add_db_objects(
+                session, models.Permission, [
+                    {'name': 'test', 'alias': 'changed'},
+                    {'name': 'test1', 'alias': 'test1'}
+                ],
+                on_conflict='ignore'
+            )
+            self.assertIs(db_objs[0], db_obj)
+            self.assertEqual('test', db_obj.alias)
+            self.assertEqual('test1', db_objs[1].alias)
+
+    def test_add_duplicate_update(self):
+        with database.session() as session:
+            db_obj = utils.add_db_object(
+                session, models.AdapterRole, True, 'test', 1, alias='test'
+            )
+            db_objs = utils.add_db_objects(
+                session, models.AdapterRole, [
+                    {'name': 'test', 'adapter_id': 1, 'alias': 'changed'},
+                    {'name': 'test', 'adapter_id': 2, 'alias': 'test2'}
+                ],
+                on_conflict='update'
+            )
+            self.assertIs(db_objs[0], db_obj)
+            self.assertEqual('changed', db_obj.alias)
+            self.assertIsNot(db_objs[1], db_obj)
+            self.assertEqual(2, db_objs[1].adapter_id)
+
+    def test_add_with_missing_args(self):
+        with self.assertRaises(exception.InvalidParameter):
+            with database.session() as session:
+                utils.add_db_objects(
+                    session, models.AdapterRole, [{'name': 'test'}]
+                )
+
+    def test_add_with_invalid_on_conflict(self):
+        with self.assertRaises(exception.InvalidParameter):
+            with database.session() as session:
+                utils.add_db_objects(
+                    session, models.Permission, [{'name': 'test'}],
+                    on_conflict='replace'
+                )
+
+
 class TestListDbObjects(unittest2.TestCase):
     def setUp(self):
         super(TestListDbObjects, self).setUp()
@@ -480,6 +629,88 @@ class TestListDbObjects(unittest2.TestCase):
                     models.Dummy,
                 )
 
+    def _list_pages(self, limit, order_by=[]):
+        pages = []
+        cursor = None
+        while True:
+            with database.session() as session:
+                page = utils.list_db_objects(
+                    session, models.Permission, order_by=order_by,
+                    limit=limit, cursor=cursor
+                )
+                pages.append([obj.name for obj in page])
+            cursor = page.next_cursor
+            if not cursor:
+                return pages
+
+    def test_list_pages(self):
+        with database.session() as session:
+            names = [
+                obj.name for obj in utils.list_db_objects(
+                    session, models.Permission, order_by=['id']
+                )
+            ]
+        pages = self._list_pages(10)
+        for page in pages[:-1]:
+            self.assertEqual(10, len(page))
+        self.assertEqual(names, sum(pages, []))
+
+    def test_list_pages_order_by_desc(self):
+        with database.session() as session:
+            names = [
+                obj.name for obj in utils.list_db_objects(
+                    session, models.Permission,
+                    order_by=[('name', True)]
+                )
+            ]
+        pages = self._list_pages(7, order_by=[('name', True)])
+        self.assertEqual(names, sum(pages, []))
+
+    def test_list_pages_order_by_nullable(self):
+        with database.session() as session:
+            for permission in utils.list_db_objects(
+                session, models.Permission
+            )[::3]:
+                permission.alias = None
+        for order_by in [['alias'], [('alias', True)]]:
+            with database.session() as session:
+                names = [
+                    obj.name for obj in utils.list_db_objects(
+                        session, models.Permission, order_by=order_by
+                    )
+                ]
+            pages = self._list_pages(4, order_by=order_by)
+            self.assertEqual(names, sum(pages, []))
+
+    def test_list_fields_by_column_name(self):
+        with database.session() as session:
+            switches = utils.list_db_objects(
+                session, models.Switch, fields=['ip', 'filters']
+            )
+            self.assertTrue(switches)
+            for switch in switches:
+                self.assertNotIn('_filters', inspect(switch).unloaded)
+        with database.session() as session:
+            switches = utils.list_db_objects(
+                session, models.Switch, fields=['ip']
+            )
+            for switch in switches:
+                self.assertIn('_filters', inspect(switch).unloaded)
+
+    def test_list_invalid_limit(self):
+        with self.assertRaises(exception.InvalidParameter):
+            with database.session() as session:
+                utils.list_db_objects(
+                    session, models.Permission, limit=0
+                )
+
+    def test_list_invalid_cursor(self):
+        with self.assertRaises(exception.InvalidParameter):
+            with database.session() as session:
+                utils.list_db_objects(
+                    session, models.Permission, limit=1, cursor='xxx'
+                )
+
 
 class TestDelDbObjects(unittest2.TestCase):
     def setUp(self):
@@ -0,0 +1,112 @@
+# Copyright 2014 Huawei Technologies Co. Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+import os
+import socket
+import threading
+import time
+import unittest2
+
+
+os.environ['COMPASS_IGNORE_SETTING'] = 'true'
+
+
+from compass.utils import setting_wrapper as setting
+reload(setting)
+
+
+from compass.db import validator
+from compass.utils import flags
+from compass.utils import logsetting
+
+
+class TestIsValidDns(unittest2.TestCase):
+    """Test dns validator."""
+
+    def setUp(self):
+        super(TestIsValidDns, self).setUp()
+        reload(setting)
+        validator.DNS_CACHE.clear()
+        self.resolved = []
+        self.resolve_event = threading.Event()
+        self.resolve_event.set()
+
+    def tearDown(self):
+        self.resolve_event.set()
+        validator.DNS_CACHE.clear()
+        reload(setting)
+        super(TestIsValidDns, self).tearDown()
+
+    def _gethostbyname_ex(self, dns):
+        self.resolve_event.wait()
+        self.resolved.append(dns)
+        if dns.startswith('unknown'):
+            raise socket.gaierror('unknown host %s' % dns)
+        return (dns, [], ['127.0.0.1'])
+
+    def test_is_valid_dns(self):
+        with mock.patch.object(
+            socket, 'gethostbyname_ex', self._gethostbyname_ex
+        ):
+            self.assertTrue(validator.is_valid_dns('dns', '127.0.0.1'))
+            self.assertTrue(validator.is_valid_dns('dns', 'compass'))
+            self.assertTrue(validator.is_valid_dns(
+                'dns', ['127.0.0.1', 'compass', 'ods.com']
+            ))
+            self.assertFalse(validator.is_valid_dns(
+                'dns', ['compass', 'unknown.ods.com']
+            ))
+            self.assertFalse(validator.is_valid_dns('dns', None))
+        self.assertItemsEqual(
+            ['compass', 'ods.com', 'unknown.ods.com'], self.resolved
+        )
+
+    def test_cache_expired(self):
+        setting.DNS_CACHE_DURATION = '1h'
+        setting.DNS_CACHE_NEGATIVE_DURATION = '0s'
+        with mock.patch.object(
+            socket, 'gethostbyname_ex', self._gethostbyname_ex
+        ):
+            for _ in range(2):
+                validator.is_valid_dns('dns', 'compass')
+                validator.is_valid_dns('dns', 'unknown')
+        self.assertEqual(
+            ['compass', 'unknown', 'unknown'], self.resolved
+        )
+
+    def test_timeout(self):
+        setting.DNS_RESOLVE_TIMEOUT = '1s'
+        self.resolve_event.clear()
+        with mock.patch.object(
+            socket, 'gethostbyname_ex', self._gethostbyname_ex
+        ):
+            self.assertFalse(validator.is_valid_dns(
+                'dns', ['compass', 'ods.com']
+            ))
+            self.resolve_event.set()
+            for _ in range(50):
+                if len(validator.DNS_CACHE) == 2:
+                    break
+                time.sleep(0.1)
+            self.assertTrue(validator.is_valid_dns(
+                'dns', ['compass', 'ods.com']
+            ))
+        self.assertItemsEqual(['compass', 'ods.com'], self.resolved)
+
+
+if __name__ == '__main__':
+    flags.init()
+    logsetting.init()
+    unittest2.main()
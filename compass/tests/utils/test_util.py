@@ -13,7 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import datetime
+import mock
 import os
+import shutil
+import tempfile
 import unittest2
 
 
@@ -311,6 +314,82 @@ class TestLoadConfigs(unittest2.TestCase):
         self.assertEqual([], loaded)
 
 
+class TestCompileConfig(unittest2.TestCase):
+    """Test compile config with code cache."""
+
+    def setUp(self):
+        super(TestCompileConfig, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.config_path = os.path.join(self.tmp_dir, 'test.conf')
+        self._write_config("TEST = 'a'\n")
+        util.CONFIG_CODE_CACHE.clear()
+
+    def tearDown(self):
+        util.CONFIG_CODE_CACHE.clear()
+        shutil.rmtree(self.tmp_dir)
+        super(TestCompileConfig, self).tearDown()
+
+    def _write_config(self, content, mtime=1000000000):
+        with open(self.config_path, 'w') as config_file:
+            config_file.write(content)
+        os.utime(self.config_path, (mtime, mtime))
+
+    def _eval_config(self):
+        config_locals = {}
+        exec util.compile_config(
+            self.config_path, self.cache_dir
+        ) in {}, config_locals
+        return config_locals
+
+    def test_compile_config(self):
+        self.assertEqual(self._eval_config(), {'TEST': 'a'})
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_compile_config_from_cache_dir(self):
+        self._eval_config()
+        util.CONFIG_CODE_CACHE.clear()
+        self._write_config("TEST = 'b'\n")
+        self.assertEqual(self._eval_config(), {'TEST': 'a'})
+
+    def test_compile_changed_config(self):
+        self._eval_config()
+        self._write_config("TEST = 'b'\n", mtime=1000000001)
+        self.assertEqual(self._eval_config(), {'TEST': 'b'})
+        util.CONFIG_CODE_CACHE.clear()
+        self.assertEqual(self._eval_config(), {'TEST': 'b'})
+
+    def test_compile_config_broken_cache(self):
+        self._eval_config()
+        util.CONFIG_CODE_CACHE.clear()
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'w') as cache_file:
+                cache_file.write('broken')
+        self.assertEqual(self._eval_config(), {'TEST': 'a'})
+
+    def test_compile_config_writable_cache(self):
+        self._eval_config()
+        util.CONFIG_CODE_CACHE.clear()
+        self._write_config("TEST = 'b'\n")
+        for name in os.listdir(self.cache_dir):
+            os.chmod(os.path.join(self.cache_dir, name), 0o666)
+        self.assertEqual(self._eval_config(), {'TEST': 'b'})
+
+    def test_compile_config_cache_of_other_user(self):
+        self._eval_config()
+        util.CONFIG_CODE_CACHE.clear()
+        self._write_config("TEST = 'b'\n")
+        for name in os.listdir(self.cache_dir):
+            cache_path = os.path.join(self.cache_dir, name)
+            with mock.patch.object(os, 'getuid') as mock_getuid:
+                mock_getuid.return_value = os.stat(cache_path).st_uid + 1
+                self.assertEqual(self._eval_config(), {'TEST': 'b'})
+
+    def test_compile_config_unwritable_cache_dir(self):
+        self.cache_dir = self.config_path
+        self.assertEqual(self._eval_config(), {'TEST': 'a'})
+
+
 if __name__ == '__main__':
     flags.init()
     logsetting.init()
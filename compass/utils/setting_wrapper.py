@@ -27,6 +27,8 @@ import os.path
 CONFIG_DIR = '/etc/compass'
 SQLALCHEMY_DATABASE_URI = 'sqlite://'
 SQLALCHEMY_DATABASE_POOL_TYPE = 'static'
+REQUEST_SCOPED_SESSION = True
+DB_SLOW_QUERY_THRESHOLD = 1.0
 INSTALLATION_LOGDIR = {
     'CobblerInstaller': '/var/log/cobbler/anamon',
     'ChefInstaller': '/var/log/chef'
@@ -50,6 +52,27 @@ SWITCHES = [
 
 USER_AUTH_HEADER_NAME = 'X-Auth-Token'
 USER_TOKEN_DURATION = '2h'
+USER_TOKEN_CACHE_DURATION = '5m'
+USER_TOKEN_CACHE_SIZE = 1024
+USER_PERMISSION_CACHE_DURATION = '5m'
+USER_CACHE_BROADCAST = False
+USER_CACHE_CHANNEL = 'compass_user_cache_invalidation'
+USER_LOG_BUFFERED = False
+USER_LOG_QUEUE_SIZE = 10000
+USER_LOG_FLUSH_INTERVAL = 0.5
+USER_LOG_FLUSH_SIZE = 100
+USER_LOG_QUEUE_FULL_POLICY = 'sync'
+USER_LOG_RETENTION = ''
+USER_LOG_PRUNE_INTERVAL = 3600
+USER_LOG_PRUNE_BATCH_SIZE = 1000
+USER_LOG_ARCHIVE_DIR = ''
+CONFIG_CACHE_DIR = ''
+METADATA_SNAPSHOT_DIR = ''
+METADATA_SNAPSHOT_CHECK_INTERVAL = '10s'
+DNS_CACHE_DURATION = '5m'
+DNS_CACHE_NEGATIVE_DURATION = '30s'
+DNS_RESOLVE_TIMEOUT = '5s'
+DNS_RESOLVER_CONCURRENCY = 8
 COMPASS_ADMIN_EMAIL = 'admin@huawei.com'
 COMPASS_ADMIN_PASSWORD = 'admin'
 COMPASS_DEFAULT_PERMISSIONS = [
@@ -19,11 +19,16 @@
 
 import crypt
 import datetime
+import hashlib
+import imp
 import logging
+import marshal
 import os
 import os.path
 import re
+import stat
 import sys
+import tempfile
 
 
 def parse_datetime(date_time, exception_class=Exception):
@@ -167,6 +172,96 @@ def parse_time_interval(time_interval_str):
         ) / 1e6
 
 
+# compiled code of config files: path to (mtime, size, code).
+CONFIG_CODE_CACHE = {}
+
+
+def _read_config_code_cache(cache_path, key):
+    """Read compiled code of config key from cache file cache_path.
+
+    The cache file is ignored unless it is owned by the current user
+    and not writable by group or others, since its code is executed.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cache_stat = os.fstat(cache_file.fileno())
+            if (
+                cache_stat.st_uid != os.getuid() or
+                cache_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+            ):
+                logging.error(
+                    'ignore config cache %s not owned by current user '
+                    'or writable by others', cache_path
+                )
+                return None
+            magic, cached_key, code = marshal.load(cache_file)
+    except Exception as error:
+        logging.debug(
+            'failed to read config cache %s: %s', cache_path, error
+        )
+        return None
+    if magic != imp.get_magic() or cached_key != key:
+        return None
+    return code
+
+
+def _write_config_code_cache(cache_path, key, code):
+    """Write compiled code of config key to cache file cache_path."""
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, 0o700)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'wb') as cache_file:
+            marshal.dump((imp.get_magic(), key, code), cache_file)
+        os.rename(tmp_path, cache_path)
+    except Exception as error:
+        logging.debug(
+            'failed to write config cache %s: %s', cache_path, error
+        )
+
+
+def compile_config(path, cache_dir=None):
+    """Get compiled code of config file.
+
+    The code is cached in memory and, if cache_dir is set, in files
+    under cache_dir, keyed by the path, mtime and size of the config.
+    Entries which can not be read or written, or are not owned by the
+    current user, fall back to compiling the config.
+
+    :param path: config file path.
+    :param cache_dir: dir to cache compiled code, default
+                      setting.CONFIG_CACHE_DIR.
+    """
+    if cache_dir is None:
+        from compass.utils import setting_wrapper as setting
+        cache_dir = setting.CONFIG_CACHE_DIR
+    path = os.path.abspath(path)
+    config_stat = os.stat(path)
+    key = (path, config_stat.st_mtime, config_stat.st_size)
+    if path in CONFIG_CODE_CACHE:
+        mtime, size, code = CONFIG_CODE_CACHE[path]
+        if (path, mtime, size) == key:
+            return code
+    code = None
+    if cache_dir:
+        cache_path = os.path.join(
+            str(cache_dir), '%s.confc' % hashlib.md5(path).hexdigest()
+        )
+        code = _read_config_code_cache(cache_path, key)
+    if code is None:
+        with open(path, 'rU') as config_file:
+            code = compile(config_file.read(), path, 'exec', 0, True)
+        if cache_dir:
+            _write_config_code_cache(cache_path, key, code)
+    CONFIG_CODE_CACHE[path] = (
+        config_stat.st_mtime, config_stat.st_size, code
+    )
+    return code
+
+
 def load_configs(
     config_dir, config_name_suffix='.conf',
     env_globals={}, env_locals={}
@@ -186,7 +281,7 @@ def load_configs(
         config_locals = {}
         config_locals.update(env_locals)
         try:
-            execfile(path, config_globals, config_locals)
+            exec compile_config(path) in config_globals, config_locals
         except Exception as error:
             logging.exception(error)
             raise error